@@ -0,0 +1,20 @@
+from delivery.utils import group_send_many
+
+
+def chat_group(user_id) -> str:
+    """
+        Personal group every chat socket of a user joins. Chat events go to participants'
+        personal groups rather than per-room groups, so connecting costs the same however
+        many rooms a user has. It is separate from user_<id>, whose delivery sockets have no
+        chat handlers.
+    """
+    return f"chat_user_{user_id}"
+
+def send_to_participants(room, message: dict):
+    """
+        Sends a chat event to both participants of a room
+    """
+    group_send_many([
+        (chat_group(room.participant_1_id), message),
+        (chat_group(room.participant_2_id), message),
+    ])
@@ -1,47 +1,32 @@
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from rest_framework_simplejwt.tokens import AccessToken
 from django.db.models import Q
+from mercuri.codecs import CodecConsumerMixin
+from user.presence import PresenceConsumerMixin
 from .models import ChatRoom
+from .chat import chat_group
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-class CallConsumer(AsyncJsonWebsocketConsumer):
+class CallConsumer(PresenceConsumerMixin, CodecConsumerMixin, AsyncJsonWebsocketConsumer):
     async def connect(self):
-        # Get JWT token from query string
-        token = self.scope['query_string'].decode().split('token=')[1] if b'token=' in self.scope['query_string'] else None
-        print(token)
+        # Authenticated by TokenAuthMiddleware from the JWT in the query string
+        self.user = self.scope['user']
         
-        #if not token:
-            #await self.close()
-            #return
-        
-        try:
-            # Verify JWT token
-            UntypedToken(token)
-            self.user = await self.get_user_from_token(token)
-            
-            if self.user == AnonymousUser or self.user == None:
-                print("Cloosing now")
-                await self.close()
-                return
-            
-            # Add to user's personal group
-            self.room_group_name = f"call_{self.user.id}"
-            print(f"call_{self.user.id}")
-            await self.channel_layer.group_add(
-                self.room_group_name,
-                self.channel_name
-            )
-            
-            await self.accept()
-            
-        except (InvalidToken, TokenError):
+        if self.user == AnonymousUser:
             await self.close()
+            return
+        
+        # Add to user's personal group
+        self.room_group_name = f"call_{self.user.id}"
+        await self.channel_layer.group_add(
+            self.room_group_name,
+            self.channel_name
+        )
+        
+        await self.accept()
     
     async def disconnect(self, close_code):
         if hasattr(self, 'room_group_name'):
@@ -59,58 +44,33 @@ class CallConsumer(AsyncJsonWebsocketConsumer):
             'caller': event.get('caller'),
             'channel_name': event.get('channel_name'),
         })
-    
-    @database_sync_to_async
-    def get_user_from_token(self, token):
-        try:
-            from rest_framework_simplejwt.tokens import AccessToken
-            access_token = AccessToken(token)
-            user_id = access_token['user_id']
-            return User.objects.get(id=user_id)
-        except:
-            return AnonymousUser
 
-class ChatConsumer(AsyncJsonWebsocketConsumer):
+
+class ChatConsumer(PresenceConsumerMixin, CodecConsumerMixin, AsyncJsonWebsocketConsumer):
+    presence_streams = ('chat',)
+
     async def connect(self):
-        # Authenticate via JWT
-        token = self.scope['query_string'].decode().split('token=')[1] if b'token=' in self.scope['query_string'] else None
+        # Authenticated by TokenAuthMiddleware from the JWT in the query string
+        self.user = self.scope['user']
         
-        if not token:
+        if self.user == AnonymousUser:
             await self.close()
             return
         
         try:
-            access_token = AccessToken(token)
-            user_id = access_token['user_id']
-            self.user = await self.get_user(user_id)
-            
-            if not self.user:
-                await self.close()
-                return
-            
-            # Join user's personal room (for call notifications)
-            self.user_room = f"user_{self.user.id}"
+            # Join the user's personal chat group, events for every room arrive there
+            self.user_room = chat_group(self.user.id)
             await self.channel_layer.group_add(
                 self.user_room,
                 self.channel_name
             )
-            
-            # Join all chat rooms user is part of
-            rooms = await self.get_user_rooms(self.user)
-            self.chat_rooms = []
-            
-            for room in rooms:
-                room_group = f"chat_{room.id}"
-                self.chat_rooms.append(room_group)
-                await self.channel_layer.group_add(
-                    room_group,
-                    self.channel_name
-                )
+            # Other participant per room, filled in as the user types in each room
+            self.room_partners = {}
             
             await self.accept()
             
         except Exception as e:
-            print(f"WebSocket auth error: {e}")
+            print(f"WebSocket connect error: {e}")
             await self.close()
     
     async def disconnect(self, close_code):
@@ -119,25 +79,24 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 self.user_room,
                 self.channel_name
             )
-        
-        if hasattr(self, 'chat_rooms'):
-            for room_group in self.chat_rooms:
-                await self.channel_layer.group_discard(
-                    room_group,
-                    self.channel_name
-                )
     
     async def receive_json(self, content):
         message_type = content.get('type')
         
         if message_type == 'typing':
-            room_id = content.get('room_id')
+            room_id = str(content.get('room_id'))
+            if room_id not in self.room_partners:
+                self.room_partners[room_id] = await self.get_room_partner(room_id)
+            partner_id = self.room_partners[room_id]
+            if partner_id is None:
+                return
+
             await self.channel_layer.group_send(
-                f"chat_{room_id}",
+                chat_group(partner_id),
                 {
                     'type': 'user_typing',
-                    'user_id': self.user.id,
-                    'username': self.user.username,
+                    'user_id': str(self.user.id),
+                    'username': self.user.get_username(),
                     'is_typing': content.get('is_typing', True),
                 }
             )
@@ -163,7 +122,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         })
     
     async def user_typing(self, event):
-        if event['user_id'] != self.user.id:
+        if event['user_id'] != str(self.user.id):
             await self.send_json({
                 'type': 'user_typing',
                 'user_id': event['user_id'],
@@ -181,14 +140,11 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         })
     
     @database_sync_to_async
-    def get_user(self, user_id):
-        try:
-            return User.objects.get(id=user_id)
-        except User.DoesNotExist:
+    def get_room_partner(self, room_id):
+        """Other participant of a room the user takes part in, or None"""
+        if not room_id.isdigit():
             return None
-    
-    @database_sync_to_async
-    def get_user_rooms(self, user):
-        return list(ChatRoom.objects.filter(
-            Q(participant_1=user) | Q(participant_2=user)
-        ))
+        room = ChatRoom.objects.filter(
+            Q(participant_1=self.user) | Q(participant_2=self.user), id=room_id
+        ).only('participant_1_id', 'participant_2_id').first()
+        return room.get_other_participant_id(self.user) if room else None
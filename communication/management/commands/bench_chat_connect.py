@@ -0,0 +1,85 @@
+import time
+import uuid
+from statistics import median
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from communication.consumers import ChatConsumer
+from communication.models import ChatRoom
+from mercuri.testing import SCRATCH_REDIS_DB, scratch_redis
+
+
+class PerRoomChatConsumer(ChatConsumer):
+    """
+        ChatConsumer.connect as it was before chat events went to personal groups, joining one
+        group per room, kept here as the baseline
+    """
+
+    async def connect(self):
+        self.user = self.scope['user']
+        self.user_room = f"user_{self.user.id}"
+        await self.channel_layer.group_add(self.user_room, self.channel_name)
+
+        self.chat_rooms = []
+        for room in await self.get_user_rooms():
+            room_group = f"chat_{room.id}"
+            self.chat_rooms.append(room_group)
+            await self.channel_layer.group_add(room_group, self.channel_name)
+        await self.accept()
+
+    @database_sync_to_async
+    def get_user_rooms(self):
+        return list(ChatRoom.objects.filter(Q(participant_1=self.user) | Q(participant_2=self.user)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures chat socket connect time for a user in --rooms rooms, joining a group per room and "
+        "joining the one personal group. Uses an in-memory channel layer, where a group_add is free; "
+        "on the Redis layer every group_add is a round trip. Seeded rows are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=1_200)
+        parser.add_argument("--connects", type=int, default=20)
+        parser.add_argument("--redis-db", type=int, default=SCRATCH_REDIS_DB)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(email=f"bench-chat-{tag}@example.com", password="!", role="customer")
+        others = User.objects.bulk_create([
+            User(email=f"bench-chat-{tag}-{index}@example.com", password="!", role="customer")
+            for index in range(options["rooms"])
+        ])
+        ChatRoom.objects.bulk_create([ChatRoom(participant_1=user, participant_2=other) for other in others])
+
+        # The rows are committed, not rolled back: database_sync_to_async closes a connection left in a transaction.
+        try:
+            with scratch_redis(options["redis_db"]):
+                for name, consumer in (("group per room", PerRoomChatConsumer), ("personal group", ChatConsumer)):
+                    timings = sorted(async_to_sync(self.connect_times)(consumer, user, options["connects"]))
+                    self.stdout.write(
+                        f"{name:15} {options['rooms']} rooms  connect median {median(timings) * 1000:7.2f} ms  "
+                        f"p95 {timings[int(len(timings) * 0.95)] * 1000:7.2f} ms"
+                    )
+        finally:
+            User.objects.filter(id__in=[user.id] + [other.id for other in others]).delete()
+
+    async def connect_times(self, consumer, user, connects: int) -> 'list[float]':
+        timings = []
+        for _ in range(connects):
+            communicator = WebsocketCommunicator(consumer.as_asgi(), "/ws/chat/")
+            communicator.scope['user'] = user
+            started = time.perf_counter()
+            connected, _ = await communicator.connect()
+            timings.append(time.perf_counter() - started)
+            if not connected:
+                raise CommandError(f"{consumer.__name__} refused the connection")
+            await communicator.disconnect()
+        return timings
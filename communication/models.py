@@ -49,6 +49,12 @@ class ChatRoom(models.Model):
         if self.participant_1 == user:
             return self.participant_2
         return self.participant_1
+
+    def get_other_participant_id(self, user):
+        """Get the other participant's id without loading either participant"""
+        if self.participant_1_id == user.id:
+            return self.participant_2_id
+        return self.participant_1_id
     
     def get_unread_count(self, user):
         """Get unread message count for a user"""
@@ -1,10 +1,11 @@
 from rest_framework import serializers
-from user.serializers import CustomUserSerializer
+from user.serializers import UserCardField
+from user.cards import get_user_card
 from .models import Call, ChatRoom, FCMDevice, Message
 
 class CallSerializer(serializers.ModelSerializer):
-    caller = CustomUserSerializer(read_only=True)
-    receiver = CustomUserSerializer(read_only=True)
+    caller = UserCardField(source='caller_id')
+    receiver = UserCardField(source='receiver_id')
     
     class Meta:
         model = Call
@@ -13,7 +14,7 @@ class CallSerializer(serializers.ModelSerializer):
         read_only_fields = ['channel_name', 'created_at', 'started_at', 'ended_at', 'duration']
 
 class MessageSerializer(serializers.ModelSerializer):
-    sender = CustomUserSerializer(read_only=True)
+    sender = UserCardField(source='sender_id')
     
     class Meta:
         model = Message
@@ -36,9 +37,9 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     def get_other_participant(self, obj):
         request = self.context.get('request')
         if request and request.user:
-            other = obj.get_other_participant(request.user)
-            if other:
-                return CustomUserSerializer(other).data
+            other_id = obj.get_other_participant_id(request.user)
+            if other_id:
+                return get_user_card(other_id)
         return None
     
     def get_last_message(self, obj):
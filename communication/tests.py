@@ -1,3 +1,37 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from mercuri.testing import ScratchRedisMixin
+from user.presence import Presence
+
+from .models import ChatRoom, ChatRoomMembership
+
+
+class MessagePushTests(ScratchRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        sender = User.objects.create_user(email="sender@example.com", password="!")
+        self.recipient = User.objects.create_user(email="recipient@example.com", password="!")
+        self.room = ChatRoom.objects.create(participant_1=sender, participant_2=self.recipient)
+        ChatRoomMembership.objects.create(room=self.room, user=self.recipient)
+        self.client = APIClient()
+        self.client.force_authenticate(sender)
+
+    def send(self):
+        with mock.patch("communication.views.send_fcm_notification") as push:
+            response = self.client.post(reverse("message-list"), {"room": self.room.id, "content": "On my way"})
+        self.assertEqual(response.status_code, 201)
+        return push
+
+    def test_pushes_when_only_a_delivery_socket_is_open(self):
+        Presence().connect(self.recipient.id, "delivery-socket", ("delivery",))
+        self.assertTrue(self.send().called)
 
-# Create your tests here.
+    def test_no_push_with_a_chat_socket_open(self):
+        Presence().connect(self.recipient.id, "chat-socket", ("chat",))
+        self.assertFalse(self.send().called)
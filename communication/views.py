@@ -16,6 +16,9 @@ from livekit.api import AccessToken, VideoGrants
 from .models import Call
 from .serializers import CallSerializer
 from user.serializers import CustomUserSerializer
+from user.cards import build_user_card
+from .chat import chat_group, send_to_participants
+from user.presence import is_online
 from .models import ChatRoom, Message, ChatRoomMembership, FCMDevice
 from .serializers import (ChatRoomSerializer, MessageSerializer, 
                           FCMDeviceSerializer)
@@ -113,7 +116,7 @@ class CallViewSet(viewsets.ModelViewSet):
                 'type': 'call_notification',
                 'action': 'incoming_call',
                 'call_id': call.id,
-                'caller': CustomUserSerializer(request.user).data,
+                'caller': build_user_card(request.user),
                 'channel_name': channel_name,
             }
         )
@@ -359,7 +362,7 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
             # Notify sender about read receipt
             channel_layer = get_channel_layer()
             async_to_sync(channel_layer.group_send)(
-                f"user_{message.sender.id}",
+                chat_group(message.sender_id),
                 {
                     'type': 'message_read',
                     'message_id': message.id,
@@ -435,14 +438,10 @@ class MessageViewSet(viewsets.ModelViewSet):
         room.save()
         
         # Send real-time notification via WebSocket
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"chat_{room.id}",
-            {
-                'type': 'chat_message',
-                'message': MessageSerializer(message).data
-            }
-        )
+        send_to_participants(room, {
+            'type': 'chat_message',
+            'message': MessageSerializer(message).data
+        })
         
         # Send FCM notification to other participant
         other_participant = room.get_other_participant(request.user)
@@ -452,10 +451,11 @@ class MessageViewSet(viewsets.ModelViewSet):
             room=room, user=other_participant
         ).first()
         
-        if membership and not membership.is_muted:
+        # Participants with a chat socket open already got the message above.
+        if membership and not membership.is_muted and not is_online(other_participant.id, 'chat'):
             send_fcm_notification(
                 user=other_participant,
-                title=f"{request.user.username}",
+                title=f"{request.user.get_username()}",
                 body=message.content[:100],
                 data={
                     'type': 'chat_message',
@@ -482,14 +482,10 @@ class MessageViewSet(viewsets.ModelViewSet):
         message.save()
         
         # Notify via WebSocket
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"chat_{message.room.id}",
-            {
-                'type': 'message_deleted',
-                'message_id': message.id,
-            }
-        )
+        send_to_participants(message.room, {
+            'type': 'message_deleted',
+            'message_id': message.id,
+        })
         
         return Response({'status': 'message deleted'})
 
@@ -0,0 +1,118 @@
+import json
+import uuid
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Order, Rider, Offer, OfferEvent
+from .heatmap import SupplyDemandHeatmap
+from .expiry import ExpiryScheduler
+from .utils import group_send_many
+from .availability import release_offered
+
+
+def claim_order(offer: Offer, rider_id, event_payload: dict):
+    """
+        Atomically assigns the offer's order to a rider if it is still pending and unassigned,
+        marks the offer accepted and records the 'accepted' event.
+
+        The claim is a single conditional UPDATE, so racing accepts never wait on a lock held
+        across round trips: one wins and the rest match no row. Being an UPDATE it skips the
+        post_save heatmap upkeep, so the order is dropped from the heatmap here. Returns the
+        order's customer id when the claim succeeded, otherwise None.
+    """
+    now = timezone.now()
+
+    if connection.vendor != "postgresql":
+        with transaction.atomic():
+            claimed = Order.objects.filter(pk=offer.order_id, status='pending', rider__isnull=True).update(
+                rider_id=rider_id, status='accepted', accepted_at=now,
+            )
+            if not claimed:
+                return None
+            Offer.objects.filter(pk=offer.id).update(accepted=True)
+            OfferEvent.objects.create(offer_id=offer.id, event='accepted', payload=event_payload)
+        row = Order.objects.values_list("customer_id", "pickup_latitude", "pickup_longitude").get(pk=offer.order_id)
+    else:
+        row = _claim_order_postgres(offer, rider_id, event_payload, now)
+        if row is None:
+            return None
+
+    customer_id, pickup_latitude, pickup_longitude = row
+    SupplyDemandHeatmap().remove_orders([(offer.order_id, pickup_latitude, pickup_longitude)])
+    return customer_id
+
+def _claim_order_postgres(offer: Offer, rider_id, event_payload: dict, now):
+    """
+        Claim, offer update and event insert as one statement, returning the claimed order's
+        (customer_id, pickup_latitude, pickup_longitude) or None
+    """
+    sql = f"""
+        WITH claimed AS (
+            UPDATE {Order._meta.db_table}
+            SET rider_id = %s, status = 'accepted', accepted_at = %s
+            WHERE id = %s AND status = 'pending' AND rider_id IS NULL
+            RETURNING customer_id, pickup_latitude, pickup_longitude
+        ), accepted_offer AS (
+            UPDATE {Offer._meta.db_table}
+            SET accepted = true
+            WHERE id = %s AND EXISTS (SELECT 1 FROM claimed)
+        ), accepted_event AS (
+            INSERT INTO {OfferEvent._meta.db_table} (id, offer_id, event, payload, created_at)
+            SELECT %s, %s, 'accepted', %s::jsonb, %s FROM claimed
+        )
+        SELECT customer_id, pickup_latitude, pickup_longitude FROM claimed
+    """
+    params = [rider_id, now, offer.order_id, offer.id, uuid.uuid4(), offer.id, json.dumps(event_payload), now]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+def claim_conflict(order_id):
+    """
+        Explains a failed claim as an (error body, status code) pair for the accept views
+    """
+    status, rider_id = Order.objects.values_list("status", "rider_id").get(pk=order_id)
+    if status == "accepted" or rider_id is not None:
+        return {"detail": "Order has already been accepted by a rider"}, 409
+    return {"error": "Not available"}, 400
+
+def cancel_sibling_offers(order_id, accepted_offer_id) -> int:
+    """
+        Closes every other live offer for an order once it has been accepted, and tells each
+        affected rider with an offer_cancelled message. Returns the number of offers cancelled.
+    """
+    now = timezone.now()
+
+    if connection.vendor != "postgresql":
+        siblings = Offer.objects.filter(order_id=order_id, accepted=False).exclude(id=accepted_offer_id).exclude(expires_at__lte=now)
+        cancelled = list(siblings.values_list("id", "rider_id", "rider__user_id"))
+        Offer.objects.filter(id__in=[offer_id for offer_id, _, _ in cancelled]).update(expires_at=now)
+    else:
+        sql = f"""
+            UPDATE {Offer._meta.db_table} AS offer
+            SET expires_at = %s
+            FROM {Rider._meta.db_table} AS rider
+            WHERE offer.order_id = %s
+                AND offer.id <> %s
+                AND offer.accepted = false
+                AND (offer.expires_at IS NULL OR offer.expires_at > %s)
+                AND rider.id = offer.rider_id
+            RETURNING offer.id, offer.rider_id, rider.user_id
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [now, order_id, accepted_offer_id, now])
+            cancelled = cursor.fetchall()
+
+    if not cancelled:
+        return 0
+
+    offer_ids = [offer_id for offer_id, _, _ in cancelled]
+    OfferEvent.objects.bulk_create([OfferEvent(offer_id=offer_id, event='cancelled') for offer_id in offer_ids])
+    ExpiryScheduler().cancel_offers(offer_ids)
+    release_offered([rider_id for _, rider_id, _ in cancelled])
+    group_send_many([
+        (f"user_{user_id}", {"type": "offer_cancelled", "offer_id": str(offer_id)})
+        for offer_id, _, user_id in cancelled
+    ])
+    return len(cancelled)
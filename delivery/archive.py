@@ -0,0 +1,69 @@
+import time
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Offer, OfferArchive, OfferEvent
+
+ARCHIVE_BATCH_SIZE = 500
+# Stop starting new batches once a run has taken this long.
+ARCHIVE_TIME_BUDGET_SECONDS = 20
+
+
+def archive_offer_batch(before, batch_size: int=ARCHIVE_BATCH_SIZE) -> int:
+    """
+        Moves one batch of unaccepted offers that expired before the cutoff, with their events,
+        into OfferArchive. Returns the number of offers moved.
+    """
+    with transaction.atomic():
+        offers = list(
+            Offer.objects.select_for_update(skip_locked=True)
+            .filter(accepted=False, expires_at__lt=before)
+            .order_by("expires_at")[:batch_size]
+        )
+        if not offers:
+            return 0
+
+        offer_ids = [offer.id for offer in offers]
+        events = defaultdict(list)
+        events_since = min(offer.created_at for offer in offers)
+        for offer_id, event, payload, created_at in (
+            OfferEvent.objects.in_period(start=events_since)
+            .filter(offer_id__in=offer_ids)
+            .order_by("created_at")
+            .values_list("offer_id", "event", "payload", "created_at")
+        ):
+            events[offer_id].append({"event": event, "payload": payload, "created_at": created_at.isoformat()})
+
+        OfferArchive.objects.bulk_create([
+            OfferArchive(
+                id=offer.id,
+                order_id=offer.order_id,
+                rider_id=offer.rider_id,
+                fare=offer.fare,
+                is_counter=offer.is_counter,
+                accepted=offer.accepted,
+                created_at=offer.created_at,
+                expires_at=offer.expires_at,
+                events=events[offer.id],
+            )
+            for offer in offers
+        ], ignore_conflicts=True)
+
+        OfferEvent.objects.in_period(start=events_since).filter(offer_id__in=offer_ids).delete()
+        Offer.objects.filter(id__in=offer_ids).delete()
+        return len(offers)
+
+def archive_expired_offers(before, batch_size: int=ARCHIVE_BATCH_SIZE, time_budget: float=ARCHIVE_TIME_BUDGET_SECONDS) -> int:
+    """
+        Archives expired offers in fixed-size batches, each in its own short transaction,
+        until none are left or the time budget runs out. Returns the number of offers moved.
+    """
+    started = time.monotonic()
+    archived = 0
+    while time.monotonic() - started < time_budget:
+        moved = archive_offer_batch(before, batch_size)
+        archived += moved
+        if moved < batch_size:
+            break
+    return archived
@@ -0,0 +1,144 @@
+import heapq
+from itertools import islice
+
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .heatmap import SupplyDemandHeatmap
+from .models import Offer, Rider
+from .spatial import RIDER_CELL_OF_KEY, cells_around
+
+IDLE_SINCE_KEY = "rider_idle:since"
+IDLE_CELL_KEY = "rider_idle:cell:{cell}"
+
+# Moves an idle rider's queue entry to a new cell, keeping its idle_since score.
+MOVE_IDLE_SCRIPT = """
+local since = redis.call('HGET', KEYS[1], ARGV[1])
+if not since then
+    return 0
+end
+if KEYS[2] ~= KEYS[3] then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+end
+redis.call('ZADD', KEYS[3], since, ARGV[1])
+return 1
+"""
+
+
+class RiderIdleQueue:
+    """
+        Idle riders per grid cell in Redis sorted sets scored by idle_since, so the
+        longest-idle riders around a point come out of a range read instead of a sort.
+
+        A hash of idle_since per idle rider lets a rider's entry follow them between
+        cells as their location updates arrive.
+    """
+
+    def __init__(self, connection=None):
+        self.redis = connection or get_redis_connection("default")
+        self._move = self.redis.register_script(MOVE_IDLE_SCRIPT)
+
+    def _cells_of(self, rider_ids) -> 'list[str | None]':
+        cells = self.redis.mget([RIDER_CELL_OF_KEY.format(rider_id=rider_id) for rider_id in rider_ids])
+        return [cell.decode() if cell is not None else None for cell in cells]
+
+    def add(self, riders: 'list[tuple]'):
+        """
+            Takes (rider_id, idle_since) tuples
+        """
+        riders = [(str(rider_id), idle_since.timestamp()) for rider_id, idle_since in riders]
+        if not riders:
+            return
+
+        pipe = self.redis.pipeline()
+        pipe.hset(IDLE_SINCE_KEY, mapping=dict(riders))
+        for (rider_id, since), cell in zip(riders, self._cells_of([rider_id for rider_id, _ in riders])):
+            if cell:
+                pipe.zadd(IDLE_CELL_KEY.format(cell=cell), {rider_id: since})
+        pipe.execute()
+
+    def remove(self, rider_ids):
+        rider_ids = [str(rider_id) for rider_id in rider_ids]
+        if not rider_ids:
+            return
+
+        pipe = self.redis.pipeline()
+        pipe.hdel(IDLE_SINCE_KEY, *rider_ids)
+        for rider_id, cell in zip(rider_ids, self._cells_of(rider_ids)):
+            if cell:
+                pipe.zrem(IDLE_CELL_KEY.format(cell=cell), rider_id)
+        pipe.execute()
+
+    def move(self, rider_id, previous_cell: 'str | None', cell: str) -> bool:
+        """
+            Follows a location update, a no-op for riders that are not idle. Returns whether the rider is idle.
+        """
+        return bool(self._move(
+            keys=[IDLE_SINCE_KEY, IDLE_CELL_KEY.format(cell=previous_cell or cell), IDLE_CELL_KEY.format(cell=cell)],
+            args=[str(rider_id)],
+        ))
+
+    def longest_idle(self, lat: float, lon: float, radius_km: float, limit: int) -> 'list[str]':
+        """
+            Ids of up to limit idle riders in the cells around a point, longest idle first
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for cell in cells_around(lat, lon, radius_km):
+            pipe.zrange(IDLE_CELL_KEY.format(cell=cell), 0, limit - 1, withscores=True)
+
+        merged = heapq.merge(*pipe.execute(), key=lambda entry: entry[1])
+        return [member.decode() for member, _ in islice(merged, limit)]
+
+
+def _transition(rider_ids, from_states: 'tuple[str, ...]', to_state: str, reset_idle_since: bool=False) -> 'list':
+    """
+        Moves the riders currently in one of from_states to to_state and keeps the idle queue
+        and heatmap supply in step. Returns the ids of the riders that changed state.
+    """
+    riders = Rider.objects.filter(id__in=list(rider_ids), availability__in=from_states)
+    changed = list(riders.values_list("id", flat=True))
+    if not changed:
+        return []
+
+    now = timezone.now()
+    fields = {"availability": to_state, "is_available": to_state == 'idle'}
+    if to_state == 'idle':
+        fields["idle_since"] = Value(now) if reset_idle_since else Coalesce("idle_since", Value(now))
+    Rider.objects.filter(id__in=changed, availability__in=from_states).update(**fields)
+
+    queue = RiderIdleQueue()
+    if to_state == 'idle':
+        queue.add(Rider.objects.filter(id__in=changed).values_list("id", "idle_since"))
+    else:
+        queue.remove(changed)
+        # Only idle riders count as supply; their next location update counts them again.
+        SupplyDemandHeatmap().remove_riders(changed)
+    return changed
+
+def go_online(rider_id):
+    changed = _transition([rider_id], ('offline',), 'idle', reset_idle_since=True)
+    # A rider who was already idle keeps their idle_since but is put back in the queue, in case it was lost.
+    return changed or _transition([rider_id], ('idle',), 'idle')
+
+def go_offline(rider_id):
+    return _transition([rider_id], ('idle', 'offered'), 'offline')
+
+def mark_offered(rider_ids):
+    return _transition(rider_ids, ('idle',), 'offered')
+
+def release_offered(rider_ids):
+    """
+        Returns riders whose offer lapsed to idle, keeping their place in the idle queue.
+        Riders still holding another live offer stay offered.
+    """
+    rider_ids = set(rider_ids)
+    holding = Offer.objects.filter(rider_id__in=rider_ids, accepted=False, expires_at__gt=timezone.now())
+    return _transition(rider_ids - set(holding.values_list("rider_id", flat=True)), ('offered',), 'idle')
+
+def start_delivery(rider_id):
+    return _transition([rider_id], ('offline', 'idle', 'offered'), 'on_delivery')
+
+def finish_delivery(rider_id):
+    return _transition([rider_id], ('on_delivery',), 'idle', reset_idle_since=True)
@@ -1,10 +1,23 @@
-import json
+import time
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
-from .models import Rider
+from mercuri.codecs import CodecConsumerMixin
+from user.presence import PresenceConsumerMixin, is_online
+from .models import Rider, Order
+from .spatial import RiderGridIndex, cell_for
+from .heatmap import SupplyDemandHeatmap
+from .locations import LocationBuffer
+from .availability import RiderIdleQueue, go_offline, go_online
+from .tracking import TrackingDelta, TrackingPublisher, active_order, compact_position, tracking_group
+
+# Pings arriving faster than this per connection are dropped.
+LOCATION_MIN_INTERVAL_SECONDS = 1.0
+
+class DeliveryConsumer(PresenceConsumerMixin, CodecConsumerMixin, AsyncWebsocketConsumer):
+    presence_streams = ('delivery',)
 
-class DeliveryConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
         print("USer is", self.user)
@@ -16,6 +29,8 @@ class DeliveryConsumer(AsyncWebsocketConsumer):
         
         else:
             self.group_name = f'user_{self.user.id}'
+            self.tracked_orders = set()
+            self.tracking = TrackingDelta()
             await self.channel_layer.group_add(
                 self.group_name,
                 self.channel_name
@@ -25,6 +40,9 @@ class DeliveryConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         user = self.scope["user"]
+        for order_id in getattr(self, 'tracked_orders', ()):
+            await self.channel_layer.group_discard(tracking_group(order_id), self.channel_name)
+
         if self.user == AnonymousUser:
             if hasattr(self, 'group_name'):
                 await self.channel_layer.group_discard(
@@ -33,39 +51,75 @@ class DeliveryConsumer(AsyncWebsocketConsumer):
                 )
                 print(f"User {str(user.id)} disconnected")
 
+    async def receive_json(self, data):
+        if data['type'] == 'track_order':
+            order_id = str(data['order_id'])
+            if order_id not in self.tracked_orders and await self.owns_order(order_id):
+                self.tracked_orders.add(order_id)
+                await self.channel_layer.group_add(tracking_group(order_id), self.channel_name)
+
+        elif data['type'] == 'untrack_order':
+            order_id = str(data['order_id'])
+            if order_id in self.tracked_orders:
+                self.tracked_orders.discard(order_id)
+                self.tracking.forget(order_id)
+                await self.channel_layer.group_discard(tracking_group(order_id), self.channel_name)
+
+    async def location_update(self, event):
+        changes = self.tracking.encode(event['order_id'], event['position'])
+        if changes:
+            await self.send_json({
+                'type': 'location_update',
+                'order_id': event['order_id'],
+                **changes
+            })
+
+    @database_sync_to_async
+    def owns_order(self, order_id):
+        return Order.objects.filter(id=order_id, customer=self.user).exists()
+
+    async def order_status(self, event):
+        await self.send_json({
+            "type": "order_status",
+            "order_id": event["order_id"],
+            "status": event["status"]
+        })
+
     async def new_offer(self, event):
         print("Preparing to send new offer")
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             "type": "new_offer",
             "offer": event["offer"]
-        }))
+        })
         print("Offer sent")
 
     async def offer_expired(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             "type": "offer_expired",
             "offer_id": event["offer_id"]
-        }))
+        })
 
     async def offer_accepted(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             "type": "offer_accepted",
             "offer": event["offer"]
-        }))
+        })
 
     async def offer_countered(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             "type": "offer_countered",
             "offer": event["offer"]
-        }))
+        })
 
     async def offer_cancelled(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             "type": "offer_cancelled",
             "offer_id": event["offer_id"]
-        }))
+        })
+
+class RiderLocationConsumer(PresenceConsumerMixin, CodecConsumerMixin, AsyncWebsocketConsumer):
+    presence_streams = ('location',)
 
-class RiderLocationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
         print("User is", self.user)
@@ -76,28 +130,27 @@ class RiderLocationConsumer(AsyncWebsocketConsumer):
             return
         
         else:
-            self.group_name = f'user_{self.user.id}'
-            await self.channel_layer.group_add(
-                self.group_name,
-                self.channel_name
-            )
+            # Offer and order events go to user_<id>, which only ws/delivery/ joins; this socket has no handlers for them.
+            self.rider_id = await self.get_rider_id()
+            self.tracking_publisher = TrackingPublisher()
             await self.accept()
+            # Online only once this socket holds its location lease, so the close of the socket
+            # it replaces, arriving later, finds it and leaves the rider online.
+            if self.rider_id:
+                await database_sync_to_async(go_online)(self.rider_id)
             print(f"User {self.user.id} connected suuccessfully")
 
     async def disconnect(self, close_code):
-        user = self.scope["user"]
-        if self.user == AnonymousUser:
-            if hasattr(self, 'group_name'):
-                await self.channel_layer.group_discard(
-                    self.group_name,
-                    self.channel_name
-                )
-                print(f"User {str(user.id)} disconnected")
-
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+        if getattr(self, 'rider_id', None):
+            await self.go_offline_if_last()
 
+    async def receive_json(self, data):
         if data['type'] == 'update_location':
+            now = time.monotonic()
+            if now - getattr(self, 'last_location_at', 0) < LOCATION_MIN_INTERVAL_SECONDS:
+                return
+            self.last_location_at = now
+
             await self.update_driver_location(
                 longitude = data['longitude'],
                 latitude = data['latitude'],
@@ -105,25 +158,52 @@ class RiderLocationConsumer(AsyncWebsocketConsumer):
                 speed = data.get('speed'),
                 accuracy = data.get('accuracy')
             )
+            await self.publish_tracking(data['latitude'], data['longitude'], data.get('heading'), data.get('speed'))
+
+    async def publish_tracking(self, latitude, longitude, heading, speed):
+        """
+            Forwards the rider's position to customers tracking the order they are delivering
+        """
+        position = compact_position(latitude, longitude, heading, speed)
+        if not self.rider_id or not self.tracking_publisher.should_publish(position):
+            return
+
+        order_id = await sync_to_async(active_order)(self.rider_id)
+        if order_id:
+            await self.channel_layer.group_send(tracking_group(order_id), {
+                'type': 'location_update',
+                'order_id': order_id,
+                'position': position,
+            })
 
     async def location_update(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'location_update',
             'latitude': event['latitude'],
             'longitude': event['longitude'],
             'heading': event.get('heading'),
             'speed': event.get('speed')
-        }))
+        })
+
+    async def go_offline_if_last(self):
+        """
+            Takes the rider offline unless another of their location sockets is still open,
+            as the new one is when a reconnect overtakes the old socket's close
+        """
+        if not await sync_to_async(is_online)(self.user.id, 'location'):
+            await database_sync_to_async(go_offline)(self.rider_id)
 
     @database_sync_to_async
+    def get_rider_id(self):
+        return Rider.objects.filter(user=self.scope["user"]).values_list("id", flat=True).first()
+
+    @sync_to_async
     def update_driver_location(self, longitude, latitude, heading, speed, accuracy):
-        user = self.scope["user"]
-        Rider.objects.filter(user=user).update(
-            latitude=latitude, 
-            longitude=longitude, 
-            heading=heading,
-            speed=speed,
-            accuracy=accuracy
-        )
+        if self.rider_id:
+            LocationBuffer().record(self.rider_id, latitude, longitude, heading, speed, accuracy)
+            previous_cell = RiderGridIndex().update(self.rider_id, latitude, longitude)
+            # Riders who are offered, delivering or going offline are not supply.
+            if RiderIdleQueue().move(self.rider_id, previous_cell, cell_for(latitude, longitude)):
+                SupplyDemandHeatmap().record_rider(self.rider_id, latitude, longitude, previous_cell)
 
         
\ No newline at end of file
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+DECLINED_RIDERS_KEY = "order:{order_id}:declined_riders"
+DEFAULT_DECLINE_TTL = timedelta(minutes=5)
+
+
+def record_decline(order, rider_id):
+    """
+        Remembers that a rider declined an order until the order expires
+    """
+    redis = get_redis_connection("default")
+    key = DECLINED_RIDERS_KEY.format(order_id=order.id)
+    expires_at = order.expires_at or timezone.now() + DEFAULT_DECLINE_TTL
+
+    pipe = redis.pipeline()
+    pipe.sadd(key, str(rider_id))
+    pipe.expireat(key, expires_at)
+    pipe.execute()
+
+def declined_riders(order_id) -> 'set[str]':
+    """
+        Rider ids that declined the given order
+    """
+    redis = get_redis_connection("default")
+    return {member.decode() for member in redis.smembers(DECLINED_RIDERS_KEY.format(order_id=order_id))}
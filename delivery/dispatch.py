@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+DISPATCH_LOCK_KEY = "order:{order_id}:dispatch_lock"
+DISPATCH_WAVE_KEY = "order:{order_id}:dispatch_wave"
+DISPATCH_NOTIFIED_KEY = "order:{order_id}:dispatch_notified"
+
+# Longer than any single dispatch run, so a crashed worker's lock frees itself.
+DISPATCH_LOCK_TIMEOUT = 60
+DEFAULT_DISPATCH_TTL = timedelta(minutes=10)
+
+
+class DispatchRecord:
+    """
+        Per-order dispatch bookkeeping in Redis, so dispatch_offers can be retried or
+        redelivered safely.
+
+        A lock keeps two workers from dispatching the same order at once, the last
+        completed wave stops a wave from running twice, and the set of notified offer
+        ids lets a re-run resend only the notifications that never went out.
+    """
+
+    def __init__(self, order_id, connection=None):
+        self.redis = connection or get_redis_connection("default")
+        self.order_id = str(order_id)
+
+    def lock(self):
+        return self.redis.lock(
+            DISPATCH_LOCK_KEY.format(order_id=self.order_id), timeout=DISPATCH_LOCK_TIMEOUT, blocking=False,
+        )
+
+    def completed_wave(self) -> int:
+        """
+            The last wave that finished for this order, or -1 if none has
+        """
+        wave = self.redis.get(DISPATCH_WAVE_KEY.format(order_id=self.order_id))
+        return int(wave) if wave is not None else -1
+
+    def complete_wave(self, wave: int, expires_at=None):
+        self._write(DISPATCH_WAVE_KEY, lambda pipe, key: pipe.set(key, wave), expires_at)
+
+    def notified(self) -> 'set[str]':
+        return {member.decode() for member in self.redis.smembers(DISPATCH_NOTIFIED_KEY.format(order_id=self.order_id))}
+
+    def mark_notified(self, offer_ids, expires_at=None):
+        offer_ids = [str(offer_id) for offer_id in offer_ids]
+        if offer_ids:
+            self._write(DISPATCH_NOTIFIED_KEY, lambda pipe, key: pipe.sadd(key, *offer_ids), expires_at)
+
+    def _write(self, key_template, command, expires_at):
+        key = key_template.format(order_id=self.order_id)
+        pipe = self.redis.pipeline()
+        command(pipe, key)
+        pipe.expireat(key, max(expires_at or timezone.now(), timezone.now()) + DEFAULT_DISPATCH_TTL)
+        pipe.execute()
@@ -0,0 +1,36 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2, dtype=np.float64):
+    """
+        Vectorized haversine. Returns a (len(lats1), len(lats2)) matrix of distances in km.
+
+        Pass dtype=np.float32 to halve memory and speed up large batches at reduced precision.
+    """
+    lat1 = np.radians(np.asarray(lats1, dtype=dtype))[:, np.newaxis]
+    lon1 = np.radians(np.asarray(lons1, dtype=dtype))[:, np.newaxis]
+    lat2 = np.radians(np.asarray(lats2, dtype=dtype))[np.newaxis, :]
+    lon2 = np.radians(np.asarray(lons2, dtype=dtype))[np.newaxis, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return (2 * EARTH_RADIUS_KM) * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def distances_from(lat: float, lon: float, lats, lons, dtype=np.float64):
+    """
+        Distances in km from one point to each of the given coordinates, as a flat array
+    """
+    return haversine_matrix([lat], [lon], lats, lons, dtype=dtype)[0]
+
+def bearings_to(lat: float, lon: float, lats, lons, dtype=np.float64):
+    """
+        Initial compass bearing in degrees from each of the given coordinates towards one point
+    """
+    lat1 = np.radians(np.asarray(lats, dtype=dtype))
+    lon1 = np.radians(np.asarray(lons, dtype=dtype))
+    lat2, lon2 = np.radians(lat), np.radians(lon)
+
+    x = np.sin(lon2 - lon1) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
@@ -0,0 +1,49 @@
+from django_redis import get_redis_connection
+
+OFFER_EXPIRY_KEY = "expiry:offers"
+ORDER_EXPIRY_KEY = "expiry:orders"
+
+# Removes and returns up to ARGV[2] members whose deadline (score) is at or before ARGV[1].
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+class ExpiryScheduler:
+    """
+        Deadlines for offers and orders kept in Redis sorted sets scored by expires_at.
+
+        Each tick pops only the entries that are due, so the work done is proportional
+        to what actually expires rather than to the size of the tables.
+    """
+
+    def __init__(self, connection=None):
+        self.redis = connection or get_redis_connection("default")
+        self._pop_due = self.redis.register_script(POP_DUE_SCRIPT)
+
+    def schedule_offers(self, offers):
+        deadlines = {str(offer.id): offer.expires_at.timestamp() for offer in offers if offer.expires_at}
+        if deadlines:
+            self.redis.zadd(OFFER_EXPIRY_KEY, deadlines)
+
+    def schedule_order(self, order):
+        if order.expires_at:
+            self.redis.zadd(ORDER_EXPIRY_KEY, {str(order.id): order.expires_at.timestamp()})
+
+    def cancel_offers(self, offer_ids):
+        offer_ids = [str(offer_id) for offer_id in offer_ids]
+        if offer_ids:
+            self.redis.zrem(OFFER_EXPIRY_KEY, *offer_ids)
+
+    def cancel_order(self, order_id):
+        self.redis.zrem(ORDER_EXPIRY_KEY, str(order_id))
+
+    def pop_due_offers(self, now, limit: int=500) -> 'list[str]':
+        return [member.decode() for member in self._pop_due(keys=[OFFER_EXPIRY_KEY], args=[now.timestamp(), limit])]
+
+    def pop_due_orders(self, now, limit: int=500) -> 'list[str]':
+        return [member.decode() for member in self._pop_due(keys=[ORDER_EXPIRY_KEY], args=[now.timestamp(), limit])]
@@ -0,0 +1,79 @@
+import time
+
+from django_redis import get_redis_connection
+
+from .spatial import RIDER_CELL_OF_KEY, cell_for, cells_around
+
+HEATMAP_WINDOW_SECONDS = 5 * 60
+
+SUPPLY_KEY = "heatmap:riders:{cell}"
+DEMAND_KEY = "heatmap:orders:{cell}"
+
+
+class SupplyDemandHeatmap:
+    """
+        Per-cell counts of idle riders and pending orders over a sliding window.
+
+        Each cell is a sorted set of member ids scored by the time they were last seen,
+        so counting a cell is a single ZCOUNT and old entries age out on their own.
+    """
+
+    def __init__(self, connection=None):
+        self.redis = connection or get_redis_connection("default")
+
+    def _touch(self, pipe, key, member, now):
+        pipe.zadd(key, {member: now})
+        pipe.zremrangebyscore(key, "-inf", now - HEATMAP_WINDOW_SECONDS)
+        pipe.expire(key, HEATMAP_WINDOW_SECONDS)
+
+    def record_rider(self, rider_id, lat: float, lon: float, previous_cell: str=None):
+        now = time.time()
+        cell = cell_for(lat, lon)
+        pipe = self.redis.pipeline()
+        if previous_cell and previous_cell != cell:
+            pipe.zrem(SUPPLY_KEY.format(cell=previous_cell), str(rider_id))
+        self._touch(pipe, SUPPLY_KEY.format(cell=cell), str(rider_id), now)
+        pipe.execute()
+
+    def remove_riders(self, rider_ids):
+        """
+            Drops riders from supply in the cell their last location update put them in
+        """
+        rider_ids = [str(rider_id) for rider_id in rider_ids]
+        if not rider_ids:
+            return
+
+        cells = self.redis.mget([RIDER_CELL_OF_KEY.format(rider_id=rider_id) for rider_id in rider_ids])
+        pipe = self.redis.pipeline()
+        for rider_id, cell in zip(rider_ids, cells):
+            if cell is not None:
+                pipe.zrem(SUPPLY_KEY.format(cell=cell.decode()), rider_id)
+        pipe.execute()
+
+    def record_order(self, order):
+        pipe = self.redis.pipeline()
+        self._touch(pipe, DEMAND_KEY.format(cell=cell_for(order.pickup_latitude, order.pickup_longitude)), str(order.id), time.time())
+        pipe.execute()
+
+    def remove_orders(self, orders: 'list[tuple]'):
+        """
+            Takes (order_id, pickup_latitude, pickup_longitude) tuples
+        """
+        pipe = self.redis.pipeline()
+        for order_id, lat, lon in orders:
+            pipe.zrem(DEMAND_KEY.format(cell=cell_for(lat, lon)), str(order_id))
+        pipe.execute()
+
+    def counts(self, lat: float, lon: float, radius_km: float) -> 'tuple[int, int]':
+        """
+            Returns (rider_count, order_count) for the cells around a point
+        """
+        since = time.time() - HEATMAP_WINDOW_SECONDS
+        cells = cells_around(lat, lon, radius_km)
+        pipe = self.redis.pipeline()
+        for cell in cells:
+            pipe.zcount(SUPPLY_KEY.format(cell=cell), since, "+inf")
+        for cell in cells:
+            pipe.zcount(DEMAND_KEY.format(cell=cell), since, "+inf")
+        results = pipe.execute()
+        return sum(results[:len(cells)]), sum(results[len(cells):])
@@ -0,0 +1,169 @@
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+
+from .distance import distances_from
+
+# Riders that have not reported a position for this long drop out of searches.
+STALE_AFTER_SECONDS = 120
+
+GEO_KEY = "rider_geo:positions"
+SEEN_KEY = "rider_geo:seen"
+RIDER_KEY = "rider_geo:rider:{rider_id}"
+
+DEFAULT_BACKEND = "delivery.location_store.RedisGeoBackend"
+
+
+class RedisGeoBackend:
+    """
+        Live rider positions in a Redis GEO set, with a short-lived hash per rider for
+        heading, speed, accuracy and timestamp. A sorted set of last-seen times lets
+        stale riders be filtered out of searches and pruned from the GEO set.
+    """
+
+    def __init__(self, connection=None):
+        self.redis = connection or get_redis_connection("default")
+
+    def update(self, rider_id, location: dict):
+        rider_id = str(rider_id)
+        key = RIDER_KEY.format(rider_id=rider_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.geoadd(GEO_KEY, (location["longitude"], location["latitude"], rider_id))
+        pipe.zadd(SEEN_KEY, {rider_id: location["timestamp"]})
+        pipe.delete(key)
+        pipe.hset(key, mapping={field: value for field, value in location.items() if value is not None})
+        pipe.expire(key, STALE_AFTER_SECONDS)
+        pipe.execute()
+
+    def get_many(self, rider_ids) -> 'dict[str, dict]':
+        rider_ids = [str(rider_id) for rider_id in rider_ids]
+        pipe = self.redis.pipeline(transaction=False)
+        for rider_id in rider_ids:
+            pipe.hgetall(RIDER_KEY.format(rider_id=rider_id))
+
+        # The hash expiry drops riders eventually, the timestamp check keeps the cutoff exact.
+        fresh_since = time.time() - STALE_AFTER_SECONDS
+        locations = {}
+        for rider_id, values in zip(rider_ids, pipe.execute()):
+            if values and float(values[b"timestamp"]) >= fresh_since:
+                locations[rider_id] = {key.decode(): float(value) for key, value in values.items()}
+        return locations
+
+    def search(self, lat: float, lon: float, radius_km: float) -> 'list[tuple[str, float]]':
+        results = self.redis.geosearch(
+            GEO_KEY, longitude=lon, latitude=lat, radius=radius_km, unit="km", withdist=True, sort="ASC",
+        )
+        if not results:
+            return []
+
+        members = [member for member, _ in results]
+        seen = self.redis.zmscore(SEEN_KEY, members)
+        fresh_since = time.time() - STALE_AFTER_SECONDS
+        return [
+            (member.decode(), distance)
+            for (member, distance), seen_at in zip(results, seen)
+            if seen_at is not None and seen_at >= fresh_since
+        ]
+
+    def remove(self, rider_id):
+        rider_id = str(rider_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrem(GEO_KEY, rider_id)
+        pipe.zrem(SEEN_KEY, rider_id)
+        pipe.delete(RIDER_KEY.format(rider_id=rider_id))
+        pipe.execute()
+
+    def prune(self) -> int:
+        stale = self.redis.zrangebyscore(SEEN_KEY, "-inf", time.time() - STALE_AFTER_SECONDS)
+        if stale:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zrem(GEO_KEY, *stale)
+            pipe.zrem(SEEN_KEY, *stale)
+            pipe.execute()
+        return len(stale)
+
+
+class InMemoryGeoBackend:
+    """
+        Process-local stand-in for RedisGeoBackend, for tests and local development without Redis.
+    """
+
+    # Shared across instances so every store in the process sees the same riders.
+    positions = {}
+
+    def update(self, rider_id, location: dict):
+        self.positions[str(rider_id)] = dict(location)
+
+    def get_many(self, rider_ids) -> 'dict[str, dict]':
+        fresh_since = time.time() - STALE_AFTER_SECONDS
+        locations = {}
+        for rider_id in rider_ids:
+            location = self.positions.get(str(rider_id))
+            if location and location["timestamp"] >= fresh_since:
+                locations[str(rider_id)] = {key: value for key, value in location.items() if value is not None}
+        return locations
+
+    def search(self, lat: float, lon: float, radius_km: float) -> 'list[tuple[str, float]]':
+        fresh_since = time.time() - STALE_AFTER_SECONDS
+        candidates = [(rider_id, location) for rider_id, location in self.positions.items() if location["timestamp"] >= fresh_since]
+        if not candidates:
+            return []
+
+        distances = distances_from(
+            lat, lon,
+            [location["latitude"] for _, location in candidates],
+            [location["longitude"] for _, location in candidates],
+        )
+        return sorted(
+            ((rider_id, float(distance)) for (rider_id, _), distance in zip(candidates, distances) if distance <= radius_km),
+            key=lambda result: result[1],
+        )
+
+    def remove(self, rider_id):
+        self.positions.pop(str(rider_id), None)
+
+    def prune(self) -> int:
+        fresh_since = time.time() - STALE_AFTER_SECONDS
+        stale = [rider_id for rider_id, location in self.positions.items() if location["timestamp"] < fresh_since]
+        for rider_id in stale:
+            del self.positions[rider_id]
+        return len(stale)
+
+
+class RiderLocationStore:
+    """
+        Live rider positions, backed by the class named in settings.RIDER_LOCATION_BACKEND
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or import_string(getattr(settings, "RIDER_LOCATION_BACKEND", DEFAULT_BACKEND))()
+
+    def update(self, rider_id, latitude, longitude, heading=None, speed=None, accuracy=None):
+        self.backend.update(rider_id, {
+            "latitude": latitude,
+            "longitude": longitude,
+            "heading": heading,
+            "speed": speed,
+            "accuracy": accuracy,
+            "timestamp": time.time(),
+        })
+
+    def get_many(self, rider_ids) -> 'dict[str, dict]':
+        """
+            Latest known position per rider id, for riders seen recently
+        """
+        return self.backend.get_many(rider_ids)
+
+    def search(self, lat: float, lon: float, radius_km: float) -> 'list[tuple[str, float]]':
+        """
+            (rider_id, distance_km) pairs for fresh riders within a radius, nearest first
+        """
+        return self.backend.search(lat, lon, radius_km)
+
+    def remove(self, rider_id):
+        self.backend.remove(rider_id)
+
+    def prune(self) -> int:
+        return self.backend.prune()
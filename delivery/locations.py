@@ -0,0 +1,98 @@
+from django.db import connection, transaction
+from django_redis import get_redis_connection
+
+from .models import Rider
+from .location_store import RiderLocationStore
+
+DIRTY_RIDERS_KEY = "rider_locations:dirty"
+
+LOCATION_FIELDS = ("latitude", "longitude", "heading", "speed", "accuracy")
+
+
+class LocationBuffer:
+    """
+        Writes the live positions held in the RiderLocationStore to Postgres in batches.
+
+        Every ping overwrites the rider's live position and marks it dirty, so however often
+        a rider pings between flushes only one row update reaches the database.
+    """
+
+    def __init__(self, connection=None, store=None):
+        self.redis = connection or get_redis_connection("default")
+        self.store = store or RiderLocationStore()
+
+    def record(self, rider_id, latitude, longitude, heading=None, speed=None, accuracy=None):
+        self.store.update(rider_id, latitude, longitude, heading, speed, accuracy)
+        self.redis.sadd(DIRTY_RIDERS_KEY, str(rider_id))
+
+    def latest(self, rider_ids) -> 'dict[str, dict]':
+        """
+            Freshest known position per rider id, for riders that have reported one recently
+        """
+        if not rider_ids:
+            return {}
+        return self.store.get_many(rider_ids)
+
+    def overlay(self, riders):
+        """
+            Replaces the possibly stale database coordinates on rider instances with buffered ones
+        """
+        fresh = self.latest([rider.id for rider in riders])
+        for rider in riders:
+            location = fresh.get(str(rider.id))
+            if location:
+                for field in LOCATION_FIELDS:
+                    setattr(rider, field, location.get(field))
+        return riders
+
+    def flush(self) -> int:
+        """
+            Writes every dirty rider position to the database and returns the number written
+        """
+        pipe = self.redis.pipeline()
+        pipe.smembers(DIRTY_RIDERS_KEY)
+        pipe.delete(DIRTY_RIDERS_KEY)
+        rider_ids = [rider_id.decode() for rider_id in pipe.execute()[0]]
+        if not rider_ids:
+            return 0
+
+        locations = self.latest(rider_ids)
+        try:
+            write_locations(locations)
+        except Exception:
+            self.redis.sadd(DIRTY_RIDERS_KEY, *rider_ids)
+            raise
+        return len(locations)
+
+
+def write_locations(locations: 'dict[str, dict]'):
+    """
+        Bulk-updates rider positions with a single UPDATE ... FROM (VALUES ...) statement
+    """
+    if not locations:
+        return
+
+    if connection.vendor != "postgresql":
+        riders = [Rider(id=rider_id, **{field: location.get(field) for field in LOCATION_FIELDS}) for rider_id, location in locations.items()]
+        Rider.objects.bulk_update(riders, LOCATION_FIELDS)
+        return
+
+    rows = ", ".join(["(%s::uuid, %s::double precision, %s::double precision, %s::double precision, %s::double precision, %s::double precision)"] * len(locations))
+    params = []
+    for rider_id, location in locations.items():
+        params.append(rider_id)
+        params.extend(location.get(field) for field in LOCATION_FIELDS)
+
+    sql = f"""
+        UPDATE {Rider._meta.db_table} AS rider
+        SET latitude = v.latitude,
+            longitude = v.longitude,
+            heading = v.heading,
+            speed = v.speed,
+            accuracy = v.accuracy,
+            location_last_updated_at = CURRENT_DATE
+        FROM (VALUES {rows}) AS v (id, latitude, longitude, heading, speed, accuracy)
+        WHERE rider.id = v.id
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, params)
@@ -0,0 +1,64 @@
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from delivery.availability import RiderIdleQueue
+from delivery.location_store import RiderLocationStore
+from delivery.models import Order, Rider
+from delivery.spatial import RiderGridIndex
+
+# Benchmarks seed riders and orders around central Lagos.
+CENTER = (6.5244, 3.3792)
+KM_PER_DEG = 111.32
+SEED_BATCH_SIZE = 5000
+
+
+def random_point(rng: random.Random, spread_km: float, center=CENTER) -> 'tuple[float, float]':
+    offset = spread_km / KM_PER_DEG
+    return center[0] + rng.uniform(-offset, offset), center[1] + rng.uniform(-offset, offset)
+
+def seed_users(count: int, role: str) -> list:
+    User = get_user_model()
+    tag = uuid.uuid4().hex[:8]
+    return User.objects.bulk_create(
+        [User(email=f"bench-{role}-{tag}-{index}@example.com", role=role, password="!") for index in range(count)],
+        batch_size=SEED_BATCH_SIZE,
+    )
+
+def seed_riders(count: int, rng: random.Random, spread_km: float=15) -> 'list[Rider]':
+    """
+        Idle riders scattered over a square spread_km from the center, with heading, speed and idle time
+    """
+    now = timezone.now()
+    riders = []
+    for user in seed_users(count, "rider"):
+        latitude, longitude = random_point(rng, spread_km)
+        riders.append(Rider(
+            user=user, latitude=latitude, longitude=longitude,
+            heading=rng.uniform(0, 360), speed=rng.uniform(0, 12),
+            idle_since=now - timedelta(seconds=rng.uniform(0, 1800)),
+            availability='idle', is_available=True,
+        ))
+    return Rider.objects.bulk_create(riders, batch_size=SEED_BATCH_SIZE)
+
+def seed_order(customer, rng: random.Random, spread_km: float=5, **fields) -> Order:
+    latitude, longitude = random_point(rng, spread_km)
+    return Order.objects.create(
+        customer=customer, status='pending', item_type='envelope', item_category='documents',
+        suggested_cost=1500, pickup_latitude=latitude, pickup_longitude=longitude,
+        dropoff_latitude=latitude + 0.02, dropoff_longitude=longitude + 0.02,
+        expires_at=timezone.now() + timedelta(minutes=10), **fields,
+    )
+
+def register_live_riders(riders):
+    """
+        Puts seeded riders in the Redis structures a running system keeps for connected riders
+    """
+    store, grid = RiderLocationStore(), RiderGridIndex()
+    for rider in riders:
+        store.update(rider.id, rider.latitude, rider.longitude, rider.heading, rider.speed)
+        grid.update(rider.id, rider.latitude, rider.longitude)
+    RiderIdleQueue().add([(rider.id, rider.idle_since) for rider in riders])
@@ -0,0 +1,111 @@
+import random
+import threading
+import time
+from statistics import median
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from delivery.acceptance import claim_order
+from delivery.models import Offer, OfferEvent, Order
+from mercuri.testing import SCRATCH_REDIS_DB, scratch_redis
+
+from ._seed import seed_order, seed_riders, seed_users
+
+
+def locking_accept(offer: Offer, rider_id) -> bool:
+    """
+        The select_for_update accept the views used before claim_order, kept here as the baseline
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=offer.order_id)
+        if order.status != 'pending' or order.rider_id is not None:
+            return False
+        order.rider_id = rider_id
+        order.status = 'accepted'
+        order.accepted_at = timezone.now()
+        order.save()
+
+        offer.accepted = True
+        offer.save()
+        OfferEvent.objects.create(offer=offer, event='accepted', payload={"rider_accepted": str(rider_id)})
+    return True
+
+def claim_accept(offer: Offer, rider_id) -> bool:
+    return claim_order(offer, rider_id, {"rider_accepted": str(rider_id)}) is not None
+
+def race(accept, offers: 'list[Offer]') -> 'tuple[list[float], float, int]':
+    """
+        Every rider accepts their offer for the same order at once. Returns each accept's
+        latency, the wall time of the race and the number of winners.
+    """
+    start = threading.Barrier(len(offers) + 1)
+    latencies, winners = [], []
+
+    def run(offer):
+        # Connect before the race starts so only the accept itself is timed.
+        connection.ensure_connection()
+        start.wait()
+        started = time.perf_counter()
+        try:
+            if accept(offer, offer.rider_id):
+                winners.append(offer.id)
+        finally:
+            latencies.append(time.perf_counter() - started)
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(offer,)) for offer in offers]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started, len(winners)
+
+
+class Command(BaseCommand):
+    help = (
+        "Races --riders riders accepting offers for the same order, with the compare-and-set claim and "
+        "with the old select_for_update path. Seeded rows are deleted afterwards and Redis work goes to a "
+        "scratch database. Run it against Postgres: SQLite serializes every writer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--riders", type=int, default=50)
+        parser.add_argument("--races", type=int, default=20)
+        parser.add_argument("--redis-db", type=int, default=SCRATCH_REDIS_DB)
+
+    def handle(self, *args, **options):
+        rng = random.Random(16)
+        with scratch_redis(options["redis_db"]):
+            riders = seed_riders(options["riders"], rng, spread_km=3)
+            customer = seed_users(1, "customer")[0]
+            try:
+                for name, accept in (("select_for_update", locking_accept), ("claim", claim_accept)):
+                    latencies, walls, broken = [], [], 0
+                    for _ in range(options["races"]):
+                        order = seed_order(customer, rng)
+                        offers = Offer.objects.bulk_create([
+                            Offer(order=order, rider=rider, fare=1500, is_counter=False, expires_at=order.expires_at)
+                            for rider in riders
+                        ])
+                        race_latencies, wall, winners = race(accept, offers)
+                        latencies += race_latencies
+                        walls.append(wall)
+                        accepted_events = OfferEvent.objects.filter(offer__order=order, event='accepted').count()
+                        broken += winners != 1 or accepted_events != 1 or Offer.objects.filter(order=order, accepted=True).count() != 1
+
+                    latencies.sort()
+                    self.stdout.write(
+                        f"{name:17} race {median(walls) * 1000:7.1f} ms  accept p50 {median(latencies) * 1000:6.1f} ms  "
+                        f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.1f} ms  "
+                        f"races without exactly one winner {broken}/{options['races']}"
+                    )
+            finally:
+                # Threads commit on their own connections, so the seeded rows cannot be rolled back.
+                Order.objects.filter(customer=customer).delete()
+                customer.delete()
+                for rider in riders:
+                    rider.user.delete()
@@ -0,0 +1,148 @@
+import json
+import random
+import time
+import uuid
+import zlib
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from communication.models import ChatRoom, Message
+from communication.serializers import MessageSerializer
+from delivery.tracking import TrackingDelta, compact_position
+from mercuri.codecs import DEFLATE_TAIL, DEFLATE_WINDOW_BITS, DeflateMessagePackCodec, JSONCodec, MessagePackCodec
+from mercuri.testing import SCRATCH_REDIS_DB, rolled_back, scratch_redis
+from user.cards import build_user_card, offer_party
+
+from ._seed import CENTER
+
+CHAT_LINES = ["On my way", "I'm at the gate", "Please call when you arrive", "Ok thanks!", "Traffic on Third Mainland, 10 mins"]
+
+
+def offer_frames(customer, rider, rng: random.Random, count: int) -> list:
+    """
+        new_offer frames in the shape send_offer_notifications builds, then expiries for most of them
+    """
+    now = timezone.now()
+    frames = [{"type": "new_offer", "offer": {
+        "id": str(uuid.uuid4()),
+        "customer": offer_party(build_user_card(customer)),
+        "rider": offer_party(build_user_card(rider), uuid.uuid4()),
+        "fare": f"{rng.randint(800, 4000)}.00",
+        "package_category": "documents",
+        "package_type": "envelope",
+        "created_at": now.isoformat(),
+        "expires_at": (now + timedelta(seconds=30)).isoformat(),
+    }} for _ in range(count)]
+    return frames + [{"type": "offer_expired", "offer_id": frame["offer"]["id"]} for frame in frames[:count * 3 // 5]]
+
+def tracking_frames(rng: random.Random, count: int) -> list:
+    """
+        Tracking frames as a customer receives them, a full position and then deltas
+    """
+    delta, order_id = TrackingDelta(), str(uuid.uuid4())
+    (latitude, longitude), heading = CENTER, 90
+    frames = []
+    for _ in range(count):
+        latitude += rng.uniform(-0.0002, 0.0003)
+        longitude += rng.uniform(-0.0002, 0.0003)
+        heading = (heading + rng.randint(-10, 10)) % 360
+        delta.last_sent_at[order_id] = 0
+        changes = delta.encode(order_id, compact_position(latitude, longitude, heading, rng.uniform(0, 12)))
+        if changes:
+            frames.append({"type": "location_update", "order_id": order_id, **changes})
+    return frames
+
+def ping_frames(rng: random.Random, count: int) -> list:
+    return [{
+        "type": "location_update",
+        "latitude": CENTER[0] + rng.random() / 10,
+        "longitude": CENTER[1] + rng.random() / 10,
+        "heading": rng.randint(0, 359),
+        "speed": round(rng.uniform(0, 12), 1),
+    } for _ in range(count)]
+
+def chat_frames(customer, rider, rng: random.Random, count: int) -> list:
+    room = ChatRoom.objects.create(participant_1=customer, participant_2=rider)
+    messages = [
+        Message.objects.create(room=room, sender=rng.choice([customer, rider]), content=rng.choice(CHAT_LINES))
+        for _ in range(count)
+    ]
+    # Through JSON, so timestamps are strings as they are once they've crossed the channel layer
+    return [{"type": "chat_message", "message": json.loads(json.dumps(MessageSerializer(message).data, default=str))} for message in messages]
+
+
+def best_of(repeat: int, run) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def encode_all(codec_class, frames) -> list:
+    codec = codec_class()
+    return [codec.encode(frame) for frame in frames]
+
+def decode_all(codec_class, sent):
+    """
+        What a client does with the frames: one inflater per socket for msgpack-deflate.v1
+    """
+    if codec_class is DeflateMessagePackCodec:
+        inflater, codec = zlib.decompressobj(-DEFLATE_WINDOW_BITS), MessagePackCodec()
+        for frame in sent:
+            codec.decode(bytes_data=inflater.decompress(frame["bytes_data"] + DEFLATE_TAIL))
+    else:
+        codec = codec_class()
+        for frame in sent:
+            codec.decode(frame.get("text_data"), frame.get("bytes_data"))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares frame size and encode/decode time per frame for the json, msgpack.v1 and "
+        "msgpack-deflate.v1 codecs on offer, tracking, rider ping and chat frames built by the real "
+        "builders. Seeded rows are rolled back and Redis work goes to a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--frames", type=int, default=600)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--redis-db", type=int, default=SCRATCH_REDIS_DB)
+
+    def handle(self, *args, **options):
+        rng, count = random.Random(7), options["frames"]
+        User = get_user_model()
+        tag = uuid.uuid4().hex[:8]
+
+        with scratch_redis(options["redis_db"]), rolled_back():
+            customer = User.objects.create_user(
+                email=f"bench-codec-{tag}-customer@example.com", password="!", role="customer",
+                first_name="Ada", last_name="Obi", phone_number="+2348031234567",
+            )
+            rider = User.objects.create_user(
+                email=f"bench-codec-{tag}-rider@example.com", password="!", role="rider",
+                first_name="Tunde", last_name="Bello", phone_number="+2348039876543",
+            )
+            streams = {
+                "offers": offer_frames(customer, rider, rng, count // 6),
+                "tracking": tracking_frames(rng, count),
+                "rider pings": ping_frames(rng, count),
+                "chat": chat_frames(customer, rider, rng, count // 6),
+            }
+
+        self.stdout.write(f"{'stream':12} {'frames':>6}  {'codec':18} {'bytes/frame':>11} {'vs json':>8} {'encode us':>10} {'decode us':>10}")
+        for name, frames in streams.items():
+            json_bytes = None
+            for codec_class in (JSONCodec, MessagePackCodec, DeflateMessagePackCodec):
+                sent = encode_all(codec_class, frames)
+                size = sum(len(frame["text_data"].encode()) if "text_data" in frame else len(frame["bytes_data"]) for frame in sent)
+                json_bytes = json_bytes or size
+                encode = best_of(options["repeat"], lambda: encode_all(codec_class, frames))
+                decode = best_of(options["repeat"], lambda: decode_all(codec_class, sent))
+                self.stdout.write(
+                    f"{name:12} {len(frames):>6}  {codec_class.subprotocol:18} {size / len(frames):>11.1f} "
+                    f"{size / json_bytes:>8.0%} {encode / len(frames) * 1e6:>10.2f} {decode / len(frames) * 1e6:>10.2f}"
+                )
@@ -0,0 +1,80 @@
+import random
+import time
+from datetime import timedelta
+from statistics import median
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from delivery.models import Offer, OfferEvent, Order
+from delivery.utils import create_offers_for_order, find_nearby_riders, send_offer_notifications
+from mercuri.testing import SCRATCH_REDIS_DB, rolled_back, scratch_redis
+
+from ._seed import register_live_riders, seed_order, seed_riders, seed_users
+
+
+def per_rider_dispatch(order: Order):
+    """
+        The per-rider loop create_offers_for_order ran before offers were bulk-created,
+        kept here as the baseline
+    """
+    riders = find_nearby_riders(order.pickup_latitude, order.pickup_longitude)
+    layer = get_channel_layer()
+    expires_at = timezone.now() + timedelta(seconds=50)
+    for rider in riders:
+        offer = Offer.objects.create(order=order, rider=rider, fare=order.suggested_cost, is_counter=False, expires_at=expires_at)
+        OfferEvent.objects.create(offer=offer, event='sent', payload={"sent_to": str(rider.id)})
+        async_to_sync(layer.group_send)(f"user_{rider.user.id}", {
+            "type": "new_offer",
+            "offer": {
+                "id": str(offer.id),
+                "customer": {"id": str(order.customer_id), "email": order.customer.email, "phone": order.customer.phone_number},
+                "rider": {"id": str(offer.rider_id), "email": offer.rider.user.email, "phone": offer.rider.user.phone_number},
+                "fare": str(offer.fare),
+                "package_category": offer.order.item_category,
+                "package_type": offer.order.item_type,
+                "created_at": offer.created_at.isoformat(),
+                "expires_at": offer.expires_at.isoformat(),
+            },
+        })
+
+def bulk_dispatch(order: Order):
+    send_offer_notifications(order, create_offers_for_order(order))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures queries and wall time per dispatch for the bulk offer path against the old "
+        "per-rider loop. Seeded rows are rolled back and Redis work goes to a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dispatches", type=int, default=30)
+        parser.add_argument("--riders", type=int, default=2_000)
+        parser.add_argument("--redis-db", type=int, default=SCRATCH_REDIS_DB)
+
+    def handle(self, *args, **options):
+        for name, dispatch in (("per-rider loop", per_rider_dispatch), ("bulk", bulk_dispatch)):
+            rng = random.Random(5)
+            with scratch_redis(options["redis_db"]), rolled_back():
+                register_live_riders(seed_riders(options["riders"], rng, spread_km=4))
+                customer = seed_users(1, "customer")[0]
+                order_ids = [seed_order(customer, rng, spread_km=1).id for _ in range(options["dispatches"])]
+
+                timings, queries, offers = [], [], 0
+                for order_id in order_ids:
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        dispatch(Order.objects.get(id=order_id))
+                        timings.append(time.perf_counter() - started)
+                    queries.append(len(captured))
+                offers = Offer.objects.filter(order_id__in=order_ids).count()
+
+            self.stdout.write(
+                f"{name:15} {offers / len(order_ids):4.1f} offers/dispatch  "
+                f"{median(queries):5.0f} queries  {median(timings) * 1000:7.1f} ms median"
+            )
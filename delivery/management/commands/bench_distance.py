@@ -0,0 +1,51 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from delivery.distance import haversine_matrix
+from delivery.utils import haversine
+
+from ._seed import random_point
+
+
+def best_of(repeat: int, run) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Compares the per-row haversine loop with haversine_matrix in float64 and float32"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--riders", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+        parser.add_argument("--pickups", type=int, default=1)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        pickups = [random_point(rng, 10) for _ in range(options["pickups"])]
+        pickup_lats, pickup_lons = [lat for lat, _ in pickups], [lon for _, lon in pickups]
+
+        for count in options["riders"]:
+            riders = [random_point(rng, 15) for _ in range(count)]
+            lats, lons = [lat for lat, _ in riders], [lon for _, lon in riders]
+
+            loop = best_of(options["repeat"], lambda: [
+                haversine(pickup_lat, pickup_lon, lat, lon)
+                for pickup_lat, pickup_lon in pickups
+                for lat, lon in riders
+            ])
+            float64 = best_of(options["repeat"], lambda: haversine_matrix(lats, lons, pickup_lats, pickup_lons))
+            float32 = best_of(options["repeat"], lambda: haversine_matrix(lats, lons, pickup_lats, pickup_lons, dtype=np.float32))
+
+            self.stdout.write(
+                f"{count:>7} riders x {len(pickups)} pickups  loop {loop * 1000:8.2f} ms  "
+                f"float64 {float64 * 1000:7.2f} ms ({loop / float64:5.1f}x)  "
+                f"float32 {float32 * 1000:7.2f} ms ({loop / float32:5.1f}x)"
+            )
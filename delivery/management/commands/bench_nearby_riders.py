@@ -0,0 +1,60 @@
+import random
+import time
+from statistics import median
+
+from django.core.management.base import BaseCommand
+
+from delivery.location_store import RiderLocationStore
+from delivery.models import Rider
+from delivery.utils import haversine
+from mercuri.testing import SCRATCH_REDIS_DB, rolled_back, scratch_redis
+
+from ._seed import random_point, seed_riders
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the live location store lookup behind find_nearby_riders with a full scan of "
+        "available riders. Seeded rows are rolled back and Redis work goes to a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+        parser.add_argument("--lookups", type=int, default=20)
+        parser.add_argument("--radius", type=float, default=3)
+        parser.add_argument("--redis-db", type=int, default=SCRATCH_REDIS_DB)
+
+    def handle(self, *args, **options):
+        radius = options["radius"]
+        for size in options["sizes"]:
+            rng = random.Random(size)
+            with scratch_redis(options["redis_db"]), rolled_back():
+                riders = seed_riders(size, rng)
+                store = RiderLocationStore()
+                for rider in riders:
+                    store.update(rider.id, rider.latitude, rider.longitude, rider.heading, rider.speed)
+                seeded = {rider.id for rider in riders}
+                pickups = [random_point(rng, 10) for _ in range(options["lookups"])]
+
+                scan_times, store_times, mismatched = [], [], 0
+                for lat, lon in pickups:
+                    started = time.perf_counter()
+                    scanned = {
+                        rider.id for rider in Rider.objects.filter(is_available=True)
+                        if haversine(lat, lon, rider.latitude, rider.longitude) <= radius
+                    }
+                    scan_times.append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    candidate_ids = [rider_id for rider_id, _ in store.search(lat, lon, radius)]
+                    found = {rider.id for rider in Rider.objects.filter(is_available=True, id__in=candidate_ids)}
+                    store_times.append(time.perf_counter() - started)
+                    # GEO positions are geohash-rounded, so a rider right on the edge may land either side.
+                    # Riders already in the database are scanned too but were never put in the store.
+                    mismatched += len((scanned & seeded) ^ found)
+
+            scan_ms, store_ms = median(scan_times) * 1000, median(store_times) * 1000
+            self.stdout.write(
+                f"{size:>7} riders  full scan {scan_ms:8.1f} ms  location store {store_ms:6.1f} ms  "
+                f"{scan_ms / store_ms:6.0f}x  edge mismatches {mismatched}"
+            )
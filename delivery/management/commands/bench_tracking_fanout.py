@@ -0,0 +1,90 @@
+import asyncio
+import random
+import time
+import uuid
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.management.base import BaseCommand
+
+from delivery.tracking import TRACKING_PUBLISH_INTERVAL_SECONDS, TrackingDelta, compact_position, tracking_group
+
+from ._seed import random_point
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+async def follow(layer, channel: str, rounds: int, latencies: list):
+    """
+        One customer connection: receives its order's tracking events and delta-encodes them
+        as DeliveryConsumer.location_update does, until every round has arrived
+    """
+    tracking = TrackingDelta()
+    for _ in range(rounds):
+        event = await layer.receive(channel)
+        tracking.encode(event["order_id"], event["position"])
+        latencies.append(time.perf_counter() - event["published_at"])
+
+async def publish_round(layer, orders: 'list[tuple[str, tuple[float, float]]]', rng: random.Random):
+    """
+        Every rider publishes one position, spread over the publish interval as live riders would be
+    """
+    started = time.perf_counter()
+    spacing = TRACKING_PUBLISH_INTERVAL_SECONDS / len(orders)
+    for index, (order_id, (latitude, longitude)) in enumerate(orders):
+        delay = started + index * spacing - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        position = compact_position(latitude + rng.uniform(-1e-3, 1e-3), longitude + rng.uniform(-1e-3, 1e-3), rng.uniform(0, 360), rng.uniform(0, 12))
+        await layer.group_send(tracking_group(order_id), {
+            "type": "location_update", "order_id": order_id, "position": position,
+            "published_at": time.perf_counter(),
+        })
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures tracking fan-out latency, from a rider publishing a position to the customer's "
+        "connection receiving it, with one customer following each of --orders concurrent orders. "
+        "Uses the configured channel layer unless --in-memory is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=5_000)
+        parser.add_argument("--rounds", type=int, default=5)
+        parser.add_argument(
+            "--in-memory", action="store_true",
+            help="Smoke run without Redis. The in-memory layer scans every channel on each call, so it does not scale to thousands of orders.",
+        )
+
+    def handle(self, *args, **options):
+        layer = InMemoryChannelLayer(capacity=options["rounds"] + 1) if options["in_memory"] else get_channel_layer()
+        latencies, elapsed = asyncio.run(self.run(layer, options["orders"], options["rounds"]))
+
+        latencies.sort()
+        expected = options["orders"] * options["rounds"]
+        self.stdout.write(
+            f"{options['orders']} tracked orders x {options['rounds']} rounds  "
+            f"delivered {len(latencies)}/{expected} in {elapsed:.1f} s ({len(latencies) / elapsed:,.0f} events/s)  "
+            f"latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms  p95 {percentile(latencies, 0.95) * 1000:.1f} ms  "
+            f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms  max {latencies[-1] * 1000:.1f} ms"
+        )
+
+    async def run(self, layer, order_count: int, rounds: int) -> 'tuple[list, float]':
+        rng = random.Random(10)
+        orders = [(f"bench-{uuid.uuid4()}", random_point(rng, 15)) for _ in range(order_count)]
+        channels = [await layer.new_channel() for _ in orders]
+        for (order_id, _), channel in zip(orders, channels):
+            await layer.group_add(tracking_group(order_id), channel)
+
+        latencies = []
+        started = time.perf_counter()
+        try:
+            followers = asyncio.gather(*(follow(layer, channel, rounds, latencies) for channel in channels))
+            for _ in range(rounds):
+                await publish_round(layer, orders, rng)
+            await asyncio.wait_for(followers, timeout=30)
+        finally:
+            for (order_id, _), channel in zip(orders, channels):
+                await layer.group_discard(tracking_group(order_id), channel)
+        return latencies, time.perf_counter() - started
@@ -0,0 +1,82 @@
+import math
+import random
+from statistics import median
+
+from django.core.management.base import BaseCommand
+
+from delivery.availability import release_offered, start_delivery
+from delivery.tasks import DISPATCH_WAVE_INTERVAL_SECONDS, DISPATCH_WAVE_RADII_KM
+from delivery.utils import create_offers_for_order, haversine
+from mercuri.testing import SCRATCH_REDIS_DB, rolled_back, scratch_redis
+
+from ._seed import register_live_riders, seed_order, seed_riders, seed_users
+
+# Synthetic riders accept nearby offers more often, and answer within this many seconds.
+RESPONSE_SECONDS = (3, 30)
+
+
+def accept_probability(distance_km: float) -> float:
+    return max(0.05, 0.6 - 0.07 * distance_km)
+
+def dispatch_until_accepted(order, radii, rng: random.Random) -> 'tuple[float, int]':
+    """
+        Runs the dispatch waves for one order in simulated time. Returns the seconds until the
+        first accept (inf if nobody accepted) and the number of offers sent.
+    """
+    accepted_at, accepted_by, offered = math.inf, None, []
+    for wave, radius in enumerate(radii):
+        started = wave * DISPATCH_WAVE_INTERVAL_SECONDS
+        if accepted_at <= started:
+            break
+        for offer in create_offers_for_order(order, radius_km=radius):
+            offered.append(offer.rider_id)
+            distance = haversine(order.pickup_latitude, order.pickup_longitude, offer.rider.latitude, offer.rider.longitude)
+            if rng.random() < accept_probability(distance):
+                answered_at = started + rng.uniform(*RESPONSE_SECONDS)
+                if answered_at < accepted_at:
+                    accepted_at, accepted_by = answered_at, offer.rider_id
+
+    # The accepting rider goes on delivery and everyone else's offer lapses, as in production.
+    if accepted_by:
+        start_delivery(accepted_by)
+    release_offered([rider_id for rider_id in offered if rider_id != accepted_by])
+    return accepted_at, len(offered)
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates time-to-accept for a stream of orders, dispatched in a single wave and in widening "
+        "waves, with synthetic riders whose acceptance falls off with distance. Time is simulated; "
+        "seeded rows are rolled back and Redis work goes to a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--riders", type=int, default=400)
+        parser.add_argument("--orders", type=int, default=200)
+        parser.add_argument("--spread", type=float, default=10, help="Half-width in km of the square riders and pickups are seeded in")
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--redis-db", type=int, default=SCRATCH_REDIS_DB)
+
+    def handle(self, *args, **options):
+        strategies = (("single wave", DISPATCH_WAVE_RADII_KM[:1]), ("waves", DISPATCH_WAVE_RADII_KM))
+        for name, radii in strategies:
+            rng = random.Random(options["seed"])
+            with scratch_redis(options["redis_db"]), rolled_back():
+                register_live_riders(seed_riders(options["riders"], rng, spread_km=options["spread"]))
+                customer = seed_users(1, "customer")[0]
+
+                waits, offers = [], 0
+                for _ in range(options["orders"]):
+                    order = seed_order(customer, rng, spread_km=options["spread"])
+                    accepted_at, sent = dispatch_until_accepted(order, radii, rng)
+                    waits.append(accepted_at)
+                    offers += sent
+
+            accepted = sorted(wait for wait in waits if wait != math.inf)
+            p90 = accepted[int(len(accepted) * 0.9)] if accepted else math.nan
+            self.stdout.write(
+                f"{name:12} radii {'/'.join(str(radius) for radius in radii):7} km  "
+                f"accepted {len(accepted) / len(waits):6.1%}  "
+                f"time-to-accept median {median(accepted) if accepted else math.nan:5.1f} s  p90 {p90:5.1f} s  "
+                f"{offers / len(waits):4.1f} offers/order"
+            )
@@ -0,0 +1,43 @@
+from django.db import models
+
+from .spatial import bounding_box
+
+
+class RiderQuerySet(models.QuerySet):
+    def near(self, lat: float, lon: float, radius_km: float):
+        """
+        Riders inside the bounding box of a radius around a point.
+        Uses the (longitude, latitude) index; callers still need an exact distance check.
+        """
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+        return self.filter(
+            longitude__range=(min_lon, max_lon),
+            latitude__range=(min_lat, max_lat),
+        )
+
+
+class OfferEventQuerySet(models.QuerySet):
+    def in_period(self, start=None, end=None):
+        """
+        Events created in [start, end). Bounding created_at lets Postgres
+        skip the monthly partitions outside the period.
+        """
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(created_at__gte=start)
+        if end is not None:
+            queryset = queryset.filter(created_at__lt=end)
+        return queryset
+
+
+class OrderQuerySet(models.QuerySet):
+    def near(self, lat: float, lon: float, radius_km: float):
+        """
+        Orders whose pickup point is inside the bounding box of a radius around a point.
+        Uses the (pickup_longitude, pickup_latitude) index; callers still need an exact distance check.
+        """
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+        return self.filter(
+            pickup_longitude__range=(min_lon, max_lon),
+            pickup_latitude__range=(min_lat, max_lat),
+        )
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['pickup_longitude', 'pickup_latitude'], name='delivery_or_pickup__dafb11_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0003_order_pickup_location_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rider',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['longitude', 'latitude'], include=('idle_since',), name='rider_available_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['expires_at'], name='order_pending_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(condition=models.Q(('accepted', False)), fields=['expires_at'], name='offer_open_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offerevent',
+            index=models.Index(fields=['offer', 'event'], name='delivery_of_offer_i_43d69e_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0004_delivery_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfferArchive',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('order_id', models.UUIDField(db_index=True)),
+                ('rider_id', models.UUIDField()),
+                ('fare', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('is_counter', models.BooleanField()),
+                ('accepted', models.BooleanField()),
+                ('created_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('events', models.JSONField(blank=True, default=list)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:05
+
+from django.db import migrations
+
+from mercuri.partitioning import partition_table_by_month
+
+
+def partition_offer_events(apps, schema_editor):
+    partition_table_by_month(schema_editor, 'delivery_offerevent', 'created_at')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0005_offerarchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_offer_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:02
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def dedupe_offers(apps, schema_editor):
+    """
+    Keeps one offer per (order, rider) so the constraint can be added: the accepted one if
+    any, otherwise the earliest. Events of the dropped offers move to the one kept.
+    """
+    Offer = apps.get_model('delivery', 'Offer')
+    OfferEvent = apps.get_model('delivery', 'OfferEvent')
+
+    duplicated = (
+        Offer.objects.order_by().values('order_id', 'rider_id')
+        .annotate(offers=Count('id')).filter(offers__gt=1)
+    )
+    for pair in duplicated.iterator():
+        offer_ids = list(
+            Offer.objects.filter(order_id=pair['order_id'], rider_id=pair['rider_id'])
+            .order_by('-accepted', 'created_at').values_list('id', flat=True)
+        )
+        kept, dropped = offer_ids[0], offer_ids[1:]
+        OfferEvent.objects.filter(offer_id__in=dropped).update(offer_id=kept)
+        Offer.objects.filter(id__in=dropped).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0006_partition_offerevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_offers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='offer',
+            constraint=models.UniqueConstraint(fields=('order', 'rider'), name='offer_unique_order_rider'),
+        ),
+    ]
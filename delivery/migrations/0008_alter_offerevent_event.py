@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0007_offer_offer_unique_order_rider'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='offerevent',
+            name='event',
+            field=models.CharField(choices=[('sent', 'Sent'), ('countered', 'Countered'), ('accepted', 'Accepted'), ('declined', 'Declined'), ('expired', 'Expired'), ('cancelled', 'Cancelled')], max_length=20),
+        ),
+    ]
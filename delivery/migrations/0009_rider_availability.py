@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+def availability_from_flag(apps, schema_editor):
+    Rider = apps.get_model('delivery', 'Rider')
+    Rider.objects.filter(is_available=False).update(availability='offline')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0008_alter_offerevent_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rider',
+            name='availability',
+            field=models.CharField(choices=[('offline', 'Offline'), ('idle', 'Idle'), ('offered', 'Offered'), ('on_delivery', 'On delivery')], default='idle', max_length=20),
+        ),
+        migrations.RunPython(availability_from_flag, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0009_rider_availability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='picked_up_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delivery_photo_thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='delivery_photos/thumbnails/'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('picked_up', 'Picked up'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], max_length=20),
+        ),
+    ]
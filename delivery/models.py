@@ -5,6 +5,8 @@ from django.db import models
 #Till further notice.  from django.contrib.gis.db import models as gis_models 
 from django.contrib.auth import get_user_model
 
+from .managers import RiderQuerySet, OrderQuerySet, OfferEventQuerySet
+
 # Create your models here.
 
 PACKAGE_CATEGORIES = [
@@ -23,6 +25,15 @@ EVENT_CHOICES = [
     ("accepted", "Accepted"),
     ("declined", "Declined"),
     ("expired", "Expired"),
+    ("cancelled", "Cancelled"),
+]
+
+# Rider availability moves offline -> idle -> offered -> on_delivery -> idle, see delivery.availability.
+AVAILABILITY_CHOICES = [
+    ("offline", "Offline"),
+    ("idle", "Idle"),
+    ("offered", "Offered"),
+    ("on_delivery", "On delivery"),
 ]
 
 User = get_user_model()
@@ -30,6 +41,8 @@ User = get_user_model()
 class Rider(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.OneToOneField(User, on_delete=models.CASCADE)
+    availability = models.CharField(max_length=20, choices=AVAILABILITY_CHOICES, default='idle')
+    # Denormalized availability == 'idle', kept for the partial location index.
     is_available = models.BooleanField(default=True)
     longitude = models.FloatField(default=7.0)
     latitude = models.FloatField(default=7.0)
@@ -40,10 +53,13 @@ class Rider(models.Model):
     created_at = models.DateTimeField(auto_now_add = True)
     location_last_updated_at = models.DateField(auto_now=True)
 
+    objects = RiderQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['longitude', 'latitude']),
-            models.Index(fields=['is_available', 'location_last_updated_at'])
+            models.Index(fields=['is_available', 'location_last_updated_at']),
+            models.Index(fields=['longitude', 'latitude'], include=['idle_since'], condition=models.Q(is_available=True), name='rider_available_location_idx'),
         ]
 
 
@@ -54,6 +70,8 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=[
         ('pending', 'Pending'),
         ('accepted', 'Accepted'),
+        ('picked_up', 'Picked up'),
+        ('delivered', 'Delivered'),
         ('cancelled', 'Cancelled'),
         ('expired', 'Expired')
     ])
@@ -66,13 +84,19 @@ class Order(models.Model):
     dropoff_longitude = models.FloatField()
     created_at = models.DateTimeField(auto_now_add = True)
     accepted_at = models.DateTimeField(null=True, blank=True)
+    picked_up_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
     expires_at = models.DateTimeField(blank=True, null=True)
     delivery_photo = models.ImageField(upload_to='delivery_photos/', null=True, blank=True)
+    delivery_photo_thumbnail = models.ImageField(upload_to='delivery_photos/thumbnails/', null=True, blank=True)
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         indexes = [
-            models.Index(fields=['customer', 'rider', 'created_at'])
+            models.Index(fields=['customer', 'rider', 'created_at']),
+            models.Index(fields=['pickup_longitude', 'pickup_latitude']),
+            models.Index(fields=['expires_at'], condition=models.Q(status='pending'), name='order_pending_expiry_idx'),
         ]
 
 class Offer(models.Model):
@@ -87,7 +111,12 @@ class Offer(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=["order", "rider", "created_at"])
+            models.Index(fields=["order", "rider", "created_at"]),
+            models.Index(fields=["expires_at"], condition=models.Q(accepted=False), name="offer_open_expiry_idx"),
+        ]
+        constraints = [
+            # Dispatch offers an order to each rider at most once, counters update the same offer.
+            models.UniqueConstraint(fields=["order", "rider"], name="offer_unique_order_rider"),
         ]
 
 class OfferEvent(models.Model):
@@ -95,4 +124,27 @@ class OfferEvent(models.Model):
     offer = models.ForeignKey(Offer, on_delete=models.CASCADE, related_name="events")
     event = models.CharField(max_length=20, choices=EVENT_CHOICES)
     payload = models.JSONField(blank=True, default=dict) 
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Monthly range-partitioned on created_at in Postgres, see mercuri.partitioning.
+    objects = OfferEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["offer", "event"])
+        ]
+
+class OfferArchive(models.Model):
+    """
+        Append-only copy of an expired offer and its event trail, moved out of the hot tables.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    order_id = models.UUIDField(db_index=True)
+    rider_id = models.UUIDField()
+    fare = models.DecimalField(max_digits=12, decimal_places=2)
+    is_counter = models.BooleanField()
+    accepted = models.BooleanField()
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField(blank=True, null=True)
+    events = models.JSONField(blank=True, default=list)
+    archived_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
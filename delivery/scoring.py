@@ -0,0 +1,51 @@
+import numpy as np
+
+from .distance import bearings_to, distances_from
+
+# Relative weight of each signal in a rider's dispatch score.
+DISTANCE_WEIGHT = 0.45
+IDLE_WEIGHT = 0.35
+HEADING_WEIGHT = 0.15
+SPEED_WEIGHT = 0.05
+
+# Idle time and speed stop adding to the score past these caps.
+IDLE_CAP_SECONDS = 30 * 60
+SPEED_CAP = 15.0
+
+
+def _as_array(values, fill):
+    return np.array([fill if value is None else value for value in values], dtype=np.float64)
+
+def score_riders(pickup_lat: float, pickup_lon: float, riders, radius_km: float, now):
+    """
+        Scores riders for an offer in one vectorized pass. Returns (distances, scores) arrays
+        aligned with the riders; higher scores are better.
+
+        Riders close to the pickup, idle the longest and already moving towards it score highest.
+        Riders with no idle_since are treated as idle for the full cap, and a missing heading
+        or speed counts as neutral.
+    """
+    lats = [rider.latitude for rider in riders]
+    lons = [rider.longitude for rider in riders]
+    distances = distances_from(pickup_lat, pickup_lon, lats, lons)
+
+    idle_seconds = _as_array(
+        [(now - rider.idle_since).total_seconds() if rider.idle_since else None for rider in riders],
+        IDLE_CAP_SECONDS,
+    )
+    headings = _as_array([rider.heading for rider in riders], np.nan)
+    speeds = _as_array([rider.speed for rider in riders], 0.0)
+
+    distance_score = 1 - np.clip(distances / radius_km, 0, 1)
+    idle_score = np.clip(idle_seconds / IDLE_CAP_SECONDS, 0, 1)
+    alignment = (1 + np.cos(np.radians(headings - bearings_to(pickup_lat, pickup_lon, lats, lons)))) / 2
+    heading_score = np.where(np.isnan(alignment), 0.5, alignment)
+    speed_score = np.clip(speeds / SPEED_CAP, 0, 1) * heading_score
+
+    scores = (
+        DISTANCE_WEIGHT * distance_score
+        + IDLE_WEIGHT * idle_score
+        + HEADING_WEIGHT * heading_score
+        + SPEED_WEIGHT * speed_score
+    )
+    return distances, scores
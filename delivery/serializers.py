@@ -13,7 +13,7 @@ class OrderSerializer(serializers.ModelSerializer):
 class OrderCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        exclude = ['customer', 'status', 'rider', 'accepted_at', 'delivered_at', 'delivery_photo']
+        exclude = ['customer', 'status', 'rider', 'accepted_at', 'picked_up_at', 'delivered_at', 'delivery_photo', 'delivery_photo_thumbnail']
 
     def create(self, validated_data):
         order = Order.objects.create(
@@ -21,6 +21,9 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             status = 'pending',
         )
         return order
+
+class OrderCompleteSerializer(serializers.Serializer):
+    delivery_photo = serializers.ImageField()
     
 class OfferSerializer(serializers.ModelSerializer):
     rider_id = serializers.PrimaryKeyRelatedField(source="driver", read_only=True)
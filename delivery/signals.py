@@ -1,7 +1,10 @@
 from django.db.models.signals import post_save
 from django.contrib.auth import get_user_model
 from django.dispatch import receiver
-from .models import Rider
+from .models import Rider, Order
+from .heatmap import SupplyDemandHeatmap
+from .availability import finish_delivery
+from .tracking import clear_active_order
 
 User = get_user_model()
 
@@ -11,6 +14,22 @@ def create_driver(sender, instance, created, **kwargs):
     if created and instance.role == 'rider':
         Rider.objects.create(user=instance)
 
+# Supply/demand heatmap upkeep
+@receiver(post_save, sender=Order)
+def update_order_heatmap(sender, instance, created, **kwargs):
+    heatmap = SupplyDemandHeatmap()
+    if instance.status == 'pending':
+        heatmap.record_order(instance)
+    elif not created:
+        heatmap.remove_orders([(instance.id, instance.pickup_latitude, instance.pickup_longitude)])
+
+# Rider availability upkeep
+@receiver(post_save, sender=Order)
+def release_order_rider(sender, instance, created, **kwargs):
+    if instance.rider_id and instance.status == 'cancelled':
+        clear_active_order(instance.rider_id)
+        finish_delivery(instance.rider_id)
+
 
 #@receiver(post_save, sender=User)
 #def save_driver(sender, instance, **kwargs):
@@ -0,0 +1,57 @@
+from math import cos, floor, radians
+
+from django_redis import get_redis_connection
+
+# Grid cells are CELL_SIZE_DEG degrees on each side, roughly 1.1 km of latitude.
+CELL_SIZE_DEG = 0.01
+KM_PER_DEG_LAT = 111.32
+
+RIDER_CELL_OF_KEY = "rider_grid:rider:{rider_id}"
+
+
+def cell_for(lat: float, lon: float) -> str:
+    """
+        Returns the grid cell id containing the given coordinates
+    """
+    return f"{floor(lat / CELL_SIZE_DEG)}:{floor(lon / CELL_SIZE_DEG)}"
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> 'tuple[float, float, float, float]':
+    """
+        Returns (min_lat, max_lat, min_lon, max_lon) enclosing a radius around a point
+    """
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlon = radius_km / (KM_PER_DEG_LAT * max(cos(radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+def cells_around(lat: float, lon: float, radius_km: float) -> 'list[str]':
+    """
+        Returns every grid cell touched by the bounding box of a radius around a point
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+
+    min_row, max_row = floor(min_lat / CELL_SIZE_DEG), floor(max_lat / CELL_SIZE_DEG)
+    min_col, max_col = floor(min_lon / CELL_SIZE_DEG), floor(max_lon / CELL_SIZE_DEG)
+    return [
+        f"{row}:{col}"
+        for row in range(min_row, max_row + 1)
+        for col in range(min_col, max_col + 1)
+    ]
+
+
+class RiderGridIndex:
+    """
+        Redis-backed record of the grid cell each rider is in.
+
+        The idle queue and the heatmap read it to find a rider's entries, so a move only
+        touches the two cells involved.
+    """
+
+    def __init__(self, connection=None):
+        self.redis = connection or get_redis_connection("default")
+
+    def update(self, rider_id, lat: float, lon: float) -> 'str | None':
+        """
+            Moves a rider to the cell containing the given coordinates and returns the previous cell
+        """
+        previous = self.redis.getset(RIDER_CELL_OF_KEY.format(rider_id=rider_id), cell_for(lat, lon))
+        return previous.decode() if previous is not None else None
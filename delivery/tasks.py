@@ -1,25 +1,161 @@
+from datetime import timedelta
+from io import BytesIO
+
 from celery import shared_task
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
-from .utils import create_offers_for_order
-from .models import Order, Offer, OfferEvent
+from redis.exceptions import LockError
+from .utils import create_offers_for_order, send_offer_notifications, group_send_many
+from .models import Rider, Order, Offer, OfferEvent
+from .heatmap import SupplyDemandHeatmap
+from .locations import LocationBuffer
+from .location_store import RiderLocationStore
+from .expiry import ExpiryScheduler
+from .archive import archive_expired_offers
+from .dispatch import DISPATCH_LOCK_TIMEOUT, DispatchRecord
+from .availability import release_offered
+from mercuri.partitioning import ensure_future_partitions
+
+# Expired offers stay in the hot table this long, so late accept/decline requests still find them.
+ARCHIVE_GRACE_PERIOD = timedelta(minutes=2)
+
+# Each dispatch wave offers the order to riders further out, until one accepts or the waves run out.
+DISPATCH_WAVE_RADII_KM = (3, 5, 8)
+DISPATCH_WAVE_INTERVAL_SECONDS = 20
+
+DELIVERY_THUMBNAIL_SIZE = (320, 320)
 
 @shared_task(bind=True, max_retries=3)
-def dispatch_offers(self, order_id):
+def dispatch_offers(self, order_id, wave=0):
     """
-        Notify drivers within 3km of the new order
+        Notify drivers near the new order, widening the radius with each wave.
+
+        Safe to retry or redeliver: runs for the same order are serialized by a lock, and a run
+        that finds it taken retries once the lock would have expired. A wave that already
+        completed is skipped, and a re-run only creates offers for riders not offered yet and
+        only notifies riders whose notification never went out.
     """
+    record = DispatchRecord(order_id)
+    lock = record.lock()
+    if not lock.acquire():
+        # Another run holds the lock, or a crashed worker's lock has yet to expire: come back once it has.
+        raise self.retry(countdown=DISPATCH_LOCK_TIMEOUT)
+
     try:
+        if record.completed_wave() >= wave:
+            return "Wave already dispatched"
+
         order = Order.objects.get(id=order_id)
         if order.status != 'pending':
             return "Order already closed"
-        create_offers_for_order(order)
+
+        create_offers_for_order(order, radius_km=DISPATCH_WAVE_RADII_KM[wave])
+        unnotified = list(
+            Offer.objects.filter(order=order, accepted=False, expires_at__gt=timezone.now())
+            .exclude(id__in=record.notified())
+            .select_related("rider")
+        )
+        send_offer_notifications(order, unnotified)
+        record.mark_notified([offer.id for offer in unnotified], order.expires_at)
+
+        # Scheduled before the wave is marked complete: a duplicate next wave is skipped, a missing one is not recovered.
+        if wave + 1 < len(DISPATCH_WAVE_RADII_KM):
+            dispatch_offers.apply_async((order_id, wave + 1), countdown=DISPATCH_WAVE_INTERVAL_SECONDS)
+        record.complete_wave(wave, order.expires_at)
         return "Offers Created"
     except Exception as e:
         self.retry(exc=e, countdown=5)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # The lock timed out and may already belong to another run.
+            pass
+
+def expire_pending_orders(orders):
+    """
+        Marks the still-pending orders in a queryset as expired and drops them from the heatmap
+    """
+    expired_orders = list(orders.filter(status='pending').values_list("id", "pickup_latitude", "pickup_longitude"))
+    if expired_orders:
+        Order.objects.filter(id__in=[order_id for order_id, _, _ in expired_orders], status='pending').update(status='expired')
+        SupplyDemandHeatmap().remove_orders(expired_orders)
+
+@shared_task
+def expire_due_offers_and_orders():
+    """
+        Expires exactly the offers and orders whose deadline has passed, and tells riders their offer lapsed
+    """
+    now = timezone.now()
+    scheduler = ExpiryScheduler()
+
+    offer_ids = scheduler.pop_due_offers(now)
+    if offer_ids:
+        expired = list(Offer.objects.filter(id__in=offer_ids, accepted=False, expires_at__lte=now).values_list("id", "rider_id", "rider__user_id"))
+        OfferEvent.objects.bulk_create([OfferEvent(offer_id=offer_id, event='expired') for offer_id, _, _ in expired])
+        release_offered([rider_id for _, rider_id, _ in expired])
+        group_send_many([
+            (f"user_{user_id}", {"type": "offer_expired", "offer_id": str(offer_id)})
+            for offer_id, _, user_id in expired
+        ])
+
+    order_ids = scheduler.pop_due_orders(now)
+    if order_ids:
+        expire_pending_orders(Order.objects.filter(id__in=order_ids, expires_at__lte=now))
 
 @shared_task
 def expire_old_offers():
+    """
+        Safety-net sweep for orders the expiry scheduler missed, e.g. after a Redis flush,
+        and for riders left marked as offered without a live offer
+    """
     now = timezone.now()
+    expire_pending_orders(Order.objects.filter(expires_at__lt=now))
+
+    live_offers = Offer.objects.filter(rider=OuterRef("pk"), accepted=False, expires_at__gt=now)
+    release_offered(list(Rider.objects.filter(availability='offered').exclude(Exists(live_offers)).values_list("id", flat=True)))
+
+@shared_task
+def archive_old_offers():
+    """
+        Moves expired offers and their events out of the hot tables into OfferArchive
+    """
+    return archive_expired_offers(before=timezone.now() - ARCHIVE_GRACE_PERIOD)
+
+@shared_task
+def create_offer_event_partitions():
+    ensure_future_partitions(OfferEvent._meta.db_table)
+
+@shared_task
+def flush_rider_locations():
+    return LocationBuffer().flush()
+
+@shared_task
+def prune_stale_rider_locations():
+    return RiderLocationStore().prune()
+
+
+@shared_task(bind=True, max_retries=3)
+def generate_delivery_thumbnail(self, order_id):
+    """
+        Renders a small JPEG of an order's delivery photo into delivery_photo_thumbnail
+    """
+    order = Order.objects.only("id", "delivery_photo").get(id=order_id)
+    if not order.delivery_photo:
+        return "No delivery photo"
+
+    try:
+        with order.delivery_photo.open("rb") as photo, Image.open(photo) as image:
+            # Lets JPEGs decode straight at a reduced scale instead of at full resolution.
+            image.draft("RGB", DELIVERY_THUMBNAIL_SIZE)
+            image.thumbnail(DELIVERY_THUMBNAIL_SIZE)
+            thumbnail = BytesIO()
+            image.convert("RGB").save(thumbnail, "JPEG", quality=80)
+    except OSError as e:
+        self.retry(exc=e, countdown=30)
 
-    Offer.objects.filter(expires_at__lt=now, accepted=False).delete()
-    Order.objects.filter(expires_at__lt=now, status='pending').update(status='expired')
\ No newline at end of file
+    order.delivery_photo_thumbnail.save(f"{order.id}.jpg", ContentFile(thumbnail.getvalue()), save=False)
+    Order.objects.filter(id=order.id).update(delivery_photo_thumbnail=order.delivery_photo_thumbnail.name)
+    return "Thumbnail created"
@@ -1,3 +1,864 @@
-from django.test import TestCase
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from celery.exceptions import Retry
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.db.models.fields.files import FieldFile
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from mercuri.consumers import GatewayConsumer
+from mercuri.testing import ScratchRedisMixin
+
+from .acceptance import claim_order
+from .archive import archive_expired_offers, archive_offer_batch
+from .availability import go_offline, go_online, mark_offered, release_offered, start_delivery
+from .consumers import RiderLocationConsumer
+from .dispatch import DispatchRecord
+from .distance import EARTH_RADIUS_KM, bearings_to, distances_from, haversine_matrix
+from .expiry import ExpiryScheduler
+from .heatmap import SUPPLY_KEY
+from .location_store import STALE_AFTER_SECONDS, InMemoryGeoBackend, RedisGeoBackend, RiderLocationStore
+from .locations import DIRTY_RIDERS_KEY, LocationBuffer, write_locations
+from .models import Offer, OfferArchive, OfferEvent, Order, Rider
+from .scoring import IDLE_CAP_SECONDS, score_riders
+from .spatial import CELL_SIZE_DEG, KM_PER_DEG_LAT, RiderGridIndex, bounding_box, cell_for, cells_around
+from .tasks import ARCHIVE_GRACE_PERIOD, archive_old_offers, dispatch_offers, expire_due_offers_and_orders
+from .tracking import (
+    TRACKING_PUBLISH_INTERVAL_SECONDS, TRACKING_SEND_INTERVAL_SECONDS, TrackingDelta, TrackingPublisher, compact_position,
+)
+from .utils import haversine
+
+
+def make_order(customer, **fields) -> Order:
+    return Order.objects.create(**{
+        "customer": customer, "status": 'pending', "item_type": 'envelope', "item_category": 'documents',
+        "suggested_cost": 1500, "pickup_latitude": 6.5244, "pickup_longitude": 3.3792,
+        "dropoff_latitude": 6.5444, "dropoff_longitude": 3.3992, "expires_at": timezone.now() + timedelta(minutes=10),
+        **fields,
+    })
+
+
+class GridCellTests(SimpleTestCase):
+    def test_cell_for_floors_towards_negative_infinity(self):
+        self.assertEqual(cell_for(0.005, 0.005), "0:0")
+        self.assertEqual(cell_for(-0.005, -0.005), "-1:-1")
+        self.assertEqual(cell_for(6.5244, 3.3792), "652:337")
+
+    def test_bounding_box_edges_are_radius_away(self):
+        lat, lon = 6.5244, 3.3792
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, 5)
+        for edge in (haversine(lat, lon, min_lat, lon), haversine(lat, lon, max_lat, lon),
+                     haversine(lat, lon, lat, min_lon), haversine(lat, lon, lat, max_lon)):
+            self.assertAlmostEqual(edge, 5, delta=0.01)
+
+    def test_cells_around_a_point_in_the_middle_of_a_cell(self):
+        lat, lon = 6.525, 3.375
+        self.assertEqual(cells_around(lat, lon, 0), [cell_for(lat, lon)])
+        self.assertEqual(len(cells_around(lat, lon, 0.3)), 1)
+
+    def test_cells_around_covers_every_point_in_the_radius(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            lat, lon = rng.uniform(-60, 60), rng.uniform(-179, 179)
+            radius = rng.uniform(0.5, 8)
+            cells = set(cells_around(lat, lon, radius))
+            for _ in range(20):
+                # A point inside the radius, a little short of the edge.
+                point_lat = lat + rng.uniform(-1, 1) * radius / 111.32 * 0.7
+                point_lon = lon + rng.uniform(-1, 1) * CELL_SIZE_DEG * 0.5
+                if haversine(lat, lon, point_lat, point_lon) <= radius:
+                    self.assertIn(cell_for(point_lat, point_lon), cells)
+
+    def test_cells_around_grows_with_the_radius(self):
+        self.assertLess(len(cells_around(6.5, 3.3, 1)), len(cells_around(6.5, 3.3, 3)))
+
+
+class RiderGridIndexTests(ScratchRedisMixin, SimpleTestCase):
+    def test_update_returns_the_previous_cell(self):
+        grid = RiderGridIndex()
+        self.assertIsNone(grid.update("rider", 6.5244, 3.3792))
+        self.assertEqual(grid.update("rider", 6.5244, 3.3792), "652:337")
+        self.assertEqual(grid.update("rider", 6.6, 3.4), "652:337")
+        # One key per rider, nothing per cell.
+        self.assertEqual(self.redis.keys("*"), [b"rider_grid:rider:rider"])
+
+
+class LocationStoreTestsMixin:
+    """
+        RiderLocationStore behaviour every backend has to share, run once per backend
+    """
+    pickup = (6.5244, 3.3792)
+
+    def setUp(self):
+        super().setUp()
+        self.now = 1_800_000_000.0
+        clock = mock.patch("delivery.location_store.time.time", side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.store = RiderLocationStore(self.make_backend())
+
+    def place(self, rider_id, km_north, **fields):
+        self.store.update(rider_id, self.pickup[0] + km_north / KM_PER_DEG_LAT, self.pickup[1], **fields)
+
+    def test_get_many_returns_the_latest_position(self):
+        self.place("near", 1, heading=90, speed=4.5)
+        self.place("near", 2, heading=180)
+        self.place("other", 3)
+
+        locations = self.store.get_many(["near", "other", "unknown"])
+        self.assertEqual(set(locations), {"near", "other"})
+        self.assertAlmostEqual(locations["near"]["latitude"], self.pickup[0] + 2 / KM_PER_DEG_LAT)
+        self.assertEqual(locations["near"]["heading"], 180)
+        # Fields a ping left out are not carried over from the previous one.
+        self.assertNotIn("speed", locations["near"])
+        self.assertNotIn("accuracy", locations["other"])
+
+    def test_search_is_nearest_first_within_the_radius(self):
+        for rider_id, km_north in (("three", 3), ("half", 0.5), ("ten", 10), ("one", 1)):
+            self.place(rider_id, km_north)
+
+        results = self.store.search(*self.pickup, 5)
+        self.assertEqual([rider_id for rider_id, _ in results], ["half", "one", "three"])
+        for (_, distance), km in zip(results, (0.5, 1, 3)):
+            self.assertAlmostEqual(distance, km, delta=0.01)
+
+    def test_stale_riders_are_left_out(self):
+        self.place("stale", 1)
+        self.now += STALE_AFTER_SECONDS + 1
+        self.place("fresh", 2)
+
+        self.assertEqual([rider_id for rider_id, _ in self.store.search(*self.pickup, 5)], ["fresh"])
+        self.assertEqual(set(self.store.get_many(["stale", "fresh"])), {"fresh"})
+
+    def test_prune_drops_only_stale_riders(self):
+        self.place("stale", 1)
+        self.now += STALE_AFTER_SECONDS + 1
+        self.place("fresh", 2)
+
+        self.assertEqual(self.store.prune(), 1)
+        self.assertEqual(self.store.prune(), 0)
+        # Gone for good, not just filtered out.
+        self.now -= STALE_AFTER_SECONDS + 1
+        self.assertEqual([rider_id for rider_id, _ in self.store.search(*self.pickup, 5)], ["fresh"])
+
+    def test_remove(self):
+        self.place("rider", 1)
+        self.store.remove("rider")
+        self.assertEqual(self.store.search(*self.pickup, 5), [])
+        self.assertEqual(self.store.get_many(["rider"]), {})
+
+
+class InMemoryLocationStoreTests(LocationStoreTestsMixin, SimpleTestCase):
+    def make_backend(self):
+        InMemoryGeoBackend.positions.clear()
+        self.addCleanup(InMemoryGeoBackend.positions.clear)
+        return InMemoryGeoBackend()
+
+
+class RedisLocationStoreTests(LocationStoreTestsMixin, ScratchRedisMixin, SimpleTestCase):
+    def make_backend(self):
+        return RedisGeoBackend()
+
+
+class LocationBufferTests(ScratchRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.first, self.second = [
+            User.objects.create_user(email=f"buffer-rider-{index}@example.com", password="!", role="rider").rider.id
+            for index in range(2)
+        ]
+        self.buffer = LocationBuffer()
+
+    def dirty(self):
+        return {rider_id.decode() for rider_id in self.redis.smembers(DIRTY_RIDERS_KEY)}
+
+    def test_pings_between_flushes_write_one_row(self):
+        for step in range(3):
+            self.buffer.record(self.first, 6.5 + step / 100, 3.3, heading=step * 10, speed=5)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(len([query for query in captured if query["sql"].lstrip().startswith("UPDATE")]), 1)
+
+        rider = Rider.objects.get(id=self.first)
+        self.assertEqual((rider.latitude, rider.longitude, rider.heading, rider.speed), (6.52, 3.3, 20, 5))
+
+    def test_flush_clears_the_dirty_set(self):
+        self.buffer.record(self.first, 6.5, 3.3)
+        self.buffer.record(self.second, 6.6, 3.4)
+        self.assertEqual(self.dirty(), {str(self.first), str(self.second)})
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.dirty(), set())
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(len(captured), 0)
+
+    def test_a_failed_write_puts_the_riders_back(self):
+        self.buffer.record(self.first, 6.5, 3.3)
+        self.buffer.record(self.second, 6.6, 3.4)
+
+        with mock.patch("delivery.locations.write_locations", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(self.dirty(), {str(self.first), str(self.second)})
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(Rider.objects.get(id=self.second).latitude, 6.6)
+
+    def test_overlay_replaces_stale_database_coordinates(self):
+        self.buffer.record(self.first, 6.5, 3.3, heading=90)
+        riders = self.buffer.overlay(list(Rider.objects.filter(id__in=[self.first, self.second]).order_by("id")))
+
+        overlaid = {rider.id: (rider.latitude, rider.longitude, rider.heading) for rider in riders}
+        database = Rider.objects.get(id=self.second)
+        self.assertEqual(overlaid[self.first], (6.5, 3.3, 90))
+        self.assertEqual(overlaid[self.second], (database.latitude, database.longitude, database.heading))
+
+    @skipUnless(connection.vendor == 'postgresql', "The UPDATE ... FROM (VALUES ...) statement is Postgres only")
+    def test_postgres_update_from_values(self):
+        Rider.objects.filter(id=self.first).update(location_last_updated_at=timezone.now().date() - timedelta(days=3))
+        write_locations({
+            str(self.first): {"latitude": 6.5, "longitude": 3.3, "heading": 90.0, "speed": None, "accuracy": 4.0},
+            str(self.second): {"latitude": 6.6, "longitude": 3.4, "heading": None, "speed": 7.5, "accuracy": None},
+        })
+
+        first, second = Rider.objects.get(id=self.first), Rider.objects.get(id=self.second)
+        self.assertEqual((first.latitude, first.longitude, first.heading, first.speed, first.accuracy), (6.5, 3.3, 90, None, 4))
+        self.assertEqual((second.latitude, second.longitude, second.heading, second.speed, second.accuracy), (6.6, 3.4, None, 7.5, None))
+        self.assertEqual(first.location_last_updated_at, timezone.now().date())
+
+
+class HaversineMatrixTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(2)
+        self.riders = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(40)]
+        self.pickups = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(7)]
+
+    def test_matches_scalar_haversine(self):
+        matrix = haversine_matrix(
+            [lat for lat, _ in self.riders], [lon for _, lon in self.riders],
+            [lat for lat, _ in self.pickups], [lon for _, lon in self.pickups],
+        )
+        self.assertEqual(matrix.shape, (len(self.riders), len(self.pickups)))
+        for i, (rider_lat, rider_lon) in enumerate(self.riders):
+            for j, (pickup_lat, pickup_lon) in enumerate(self.pickups):
+                self.assertAlmostEqual(matrix[i, j], haversine(rider_lat, rider_lon, pickup_lat, pickup_lon), places=6)
+
+    def test_float32_stays_within_metres_at_city_scale(self):
+        lats, lons = [6.52 + index / 1000 for index in range(100)], [3.37 + index / 1000 for index in range(100)]
+        exact = distances_from(6.5244, 3.3792, lats, lons)
+        approx = distances_from(6.5244, 3.3792, lats, lons, dtype=np.float32)
+        self.assertEqual(approx.dtype, np.float32)
+        self.assertLess(np.max(np.abs(exact - approx)), 0.01)
+
+    def test_same_point_and_antipode(self):
+        self.assertEqual(distances_from(6.5, 3.3, [6.5], [3.3])[0], 0)
+        self.assertAlmostEqual(distances_from(0, 0, [0], [180])[0], np.pi * EARTH_RADIUS_KM, places=6)
+
+    def test_bearings_to_points_the_right_way(self):
+        # From points due south, west, north and east of the target.
+        bearings = bearings_to(1, 1, [0, 1, 2, 1], [1, 0, 1, 2])
+        for bearing, expected in zip(bearings, (0, 90, 180, 270)):
+            self.assertAlmostEqual(bearing, expected, delta=0.1)
+
+
+class HeatmapSupplyTests(ScratchRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = get_user_model().objects.create_user(email="supply@example.com", password="!", role="rider")
+        self.rider = user.rider
+        self.consumer = RiderLocationConsumer()
+        self.consumer.rider_id = self.rider.id
+
+    def ping(self, lat=6.5244, lon=3.3792):
+        async_to_sync(self.consumer.update_driver_location)(lon, lat, 90, 5, 10)
+
+    def supply(self, lat=6.5244, lon=3.3792):
+        return self.redis.zcard(SUPPLY_KEY.format(cell=cell_for(lat, lon)))
+
+    def test_idle_riders_count_as_supply(self):
+        go_online(self.rider.id)
+        self.ping()
+        self.assertEqual(self.supply(), 1)
+        self.ping(6.6, 3.4)
+        self.assertEqual((self.supply(), self.supply(6.6, 3.4)), (0, 1))
+
+    def test_leaving_idle_removes_supply(self):
+        for leave in (mark_offered, start_delivery, go_offline):
+            with self.subTest(leave=leave.__name__):
+                Rider.objects.filter(id=self.rider.id).update(availability='offline')
+                go_online(self.rider.id)
+                self.ping()
+                self.assertEqual(self.supply(), 1)
+                leave([self.rider.id] if leave is mark_offered else self.rider.id)
+                self.assertEqual(self.supply(), 0)
+                # Pings while offered, delivering or offline are not supply.
+                self.ping()
+                self.assertEqual(self.supply(), 0)
+
+
+class ScoreRidersTests(SimpleTestCase):
+    pickup = (6.5244, 3.3792)
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def rider(self, km_north=1, idle_seconds=600, heading=None, speed=None):
+        return SimpleNamespace(
+            latitude=self.pickup[0] + km_north / KM_PER_DEG_LAT, longitude=self.pickup[1],
+            idle_since=None if idle_seconds is None else self.now - timedelta(seconds=idle_seconds),
+            heading=heading, speed=speed,
+        )
+
+    def scores(self, *riders, radius_km=3):
+        return score_riders(*self.pickup, riders, radius_km, self.now)[1]
+
+    def test_distances_line_up_with_the_riders(self):
+        riders = [self.rider(km_north=1), self.rider(km_north=2.5)]
+        distances, scores = score_riders(*self.pickup, riders, 3, self.now)
+        self.assertEqual(len(scores), 2)
+        for distance, rider in zip(distances, riders):
+            self.assertAlmostEqual(distance, haversine(*self.pickup, rider.latitude, rider.longitude), places=6)
+
+    def test_closer_riders_score_higher(self):
+        near, far, outside = self.scores(self.rider(km_north=0.5), self.rider(km_north=2.5), self.rider(km_north=5))
+        self.assertGreater(near, far)
+        # Past the radius distance adds nothing, but the rider still gets a score.
+        self.assertGreater(far, outside)
+        self.assertGreater(outside, 0)
+
+    def test_longer_idle_riders_score_higher_up_to_the_cap(self):
+        short, long, capped, unknown = self.scores(
+            self.rider(idle_seconds=60), self.rider(idle_seconds=IDLE_CAP_SECONDS),
+            self.rider(idle_seconds=4 * IDLE_CAP_SECONDS), self.rider(idle_seconds=None),
+        )
+        self.assertGreater(long, short)
+        self.assertAlmostEqual(long, capped)
+        self.assertAlmostEqual(long, unknown)
+
+    def test_riders_heading_towards_the_pickup_score_higher(self):
+        # The riders are north of the pickup, so heading 180 points at it.
+        towards, unknown, away = self.scores(
+            self.rider(heading=180, speed=10), self.rider(heading=None, speed=10), self.rider(heading=0, speed=10),
+        )
+        self.assertGreater(towards, unknown)
+        self.assertGreater(unknown, away)
+
+    def test_speed_only_helps_riders_moving_towards_the_pickup(self):
+        slow, fast = self.scores(self.rider(heading=180, speed=1), self.rider(heading=180, speed=14))
+        self.assertGreater(fast, slow)
+        parked, fleeing = self.scores(self.rider(heading=0, speed=0), self.rider(heading=0, speed=14))
+        self.assertAlmostEqual(parked, fleeing)
+
+
+class DispatchWaveTests(ScratchRedisMixin, TestCase):
+    pickup = (6.5244, 3.3792)
+
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        customer = User.objects.create_user(email="wave-customer@example.com", password="!", role="customer")
+        self.order = Order.objects.create(
+            customer=customer, status='pending', item_type='envelope', item_category='documents', suggested_cost=1500,
+            pickup_latitude=self.pickup[0], pickup_longitude=self.pickup[1],
+            dropoff_latitude=self.pickup[0] + 0.02, dropoff_longitude=self.pickup[1] + 0.02,
+            expires_at=timezone.now() + timedelta(minutes=10),
+        )
+        # Two riders inside the first wave's radius, one for each later wave and one out of reach.
+        self.riders = {}
+        for km_north in (1, 2, 4, 7, 12):
+            user = User.objects.create_user(email=f"wave-rider-{km_north}@example.com", password="!", role="rider")
+            Rider.objects.filter(user=user).update(latitude=self.pickup[0] + km_north / KM_PER_DEG_LAT, longitude=self.pickup[1])
+            self.riders[km_north] = user.rider.id
+
+        next_wave = mock.patch.object(dispatch_offers, "apply_async")
+        self.next_wave = next_wave.start()
+        self.addCleanup(next_wave.stop)
+
+    def offered(self):
+        return set(Offer.objects.filter(order=self.order).values_list("rider_id", flat=True))
+
+    def riders_within(self, km):
+        return {rider_id for km_north, rider_id in self.riders.items() if km_north <= km}
+
+    def test_each_wave_widens_the_radius_and_schedules_the_next(self):
+        for wave, radius in enumerate((3, 5, 8)):
+            self.assertEqual(dispatch_offers(self.order.id, wave), "Offers Created")
+            self.assertEqual(self.offered(), self.riders_within(radius))
+        self.assertEqual([call.args[0] for call in self.next_wave.call_args_list], [(self.order.id, 1), (self.order.id, 2)])
+
+    def test_riders_already_offered_are_skipped(self):
+        dispatch_offers(self.order.id, 0)
+        # Even once their offers lapse and they are idle again.
+        release_offered(self.riders_within(3))
+        dispatch_offers(self.order.id, 1)
+        self.assertEqual(Offer.objects.filter(order=self.order).count(), len(self.riders_within(5)))
+
+    def test_a_redelivered_wave_is_skipped(self):
+        dispatch_offers(self.order.id, 0)
+        self.assertEqual(dispatch_offers(self.order.id, 0), "Wave already dispatched")
+        self.assertEqual(self.offered(), self.riders_within(3))
+
+    def test_waves_stop_once_an_offer_is_accepted(self):
+        dispatch_offers(self.order.id, 0)
+        offer = Offer.objects.filter(order=self.order).first()
+        self.assertIsNotNone(claim_order(offer, offer.rider_id, {}))
+
+        self.assertEqual(dispatch_offers(self.order.id, 1), "Order already closed")
+        self.assertEqual(self.offered(), self.riders_within(3))
+        self.assertEqual(self.next_wave.call_count, 1)
+
+
+class ConcurrentDispatchTests(ScratchRedisMixin, TransactionTestCase):
+    parallel_runs = 20
+
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        customer = User.objects.create_user(email="race-customer@example.com", password="!", role="customer")
+        self.order = Order.objects.create(
+            customer=customer, status='pending', item_type='envelope', item_category='documents', suggested_cost=1500,
+            pickup_latitude=6.5244, pickup_longitude=3.3792, dropoff_latitude=6.5444, dropoff_longitude=3.3992,
+            expires_at=timezone.now() + timedelta(minutes=10),
+        )
+        for index in range(3):
+            user = User.objects.create_user(email=f"race-rider-{index}@example.com", password="!", role="rider")
+            Rider.objects.filter(user=user).update(latitude=6.5244 + (index + 1) / KM_PER_DEG_LAT, longitude=3.3792)
+
+        next_wave = mock.patch.object(dispatch_offers, "apply_async")
+        self.next_wave = next_wave.start()
+        self.addCleanup(next_wave.stop)
+
+    def test_parallel_runs_of_the_same_wave_dispatch_once(self):
+        start = threading.Barrier(self.parallel_runs)
+        outcomes = []
+
+        def run():
+            start.wait()
+            try:
+                outcomes.append(dispatch_offers(self.order.id, 0))
+            except Retry:
+                outcomes.append("retry")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(self.parallel_runs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # One run dispatches; the rest either found the lock taken or the wave already done.
+        self.assertEqual(len(outcomes), self.parallel_runs)
+        self.assertEqual(outcomes.count("Offers Created"), 1)
+        self.assertLessEqual(set(outcomes), {"Offers Created", "retry", "Wave already dispatched"})
+
+        offers = list(Offer.objects.filter(order=self.order).values_list("id", "rider_id"))
+        self.assertEqual(len(offers), 3)
+        self.assertEqual(len({rider_id for _, rider_id in offers}), 3)
+        self.assertEqual(DispatchRecord(self.order.id).notified(), {str(offer_id) for offer_id, _ in offers})
+        self.assertEqual(self.next_wave.call_count, 1)
+
+
+class TrackingTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch("delivery.tracking.time.monotonic", side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_compact_position_rounds_to_about_a_metre(self):
+        self.assertEqual(
+            compact_position(6.524412345, 3.379298765, 91.6, 4.26),
+            {"latitude": 6.52441, "longitude": 3.3793, "heading": 92, "speed": 4.3},
+        )
+        self.assertEqual(compact_position(6.5, 3.3)["heading"], None)
+
+    def test_publisher_waits_out_the_interval(self):
+        publisher = TrackingPublisher()
+        self.assertTrue(publisher.should_publish(compact_position(6.5, 3.3)))
+        self.now += TRACKING_PUBLISH_INTERVAL_SECONDS / 2
+        self.assertFalse(publisher.should_publish(compact_position(6.6, 3.3)))
+        self.now += TRACKING_PUBLISH_INTERVAL_SECONDS
+        self.assertTrue(publisher.should_publish(compact_position(6.6, 3.3)))
+
+    def test_publisher_skips_a_rider_who_has_not_moved(self):
+        publisher = TrackingPublisher()
+        publisher.should_publish(compact_position(6.5, 3.3))
+        self.now += TRACKING_PUBLISH_INTERVAL_SECONDS * 2
+        self.assertFalse(publisher.should_publish(compact_position(6.5, 3.3)))
+
+    def test_delta_sends_everything_first_then_only_changes(self):
+        delta = TrackingDelta()
+        first = compact_position(6.5, 3.3, 90, 5)
+        self.assertEqual(delta.encode("order", first), first)
+        self.now += TRACKING_SEND_INTERVAL_SECONDS
+        self.assertEqual(delta.encode("order", compact_position(6.5, 3.31, 90, 5)), {"longitude": 3.31})
+        self.now += TRACKING_SEND_INTERVAL_SECONDS
+        self.assertIsNone(delta.encode("order", compact_position(6.5, 3.31, 90, 5)))
+
+    def test_delta_throttles_each_order_separately(self):
+        delta = TrackingDelta()
+        delta.encode("first", compact_position(6.5, 3.3))
+        self.assertIsNone(delta.encode("first", compact_position(6.6, 3.3)))
+        self.assertIsNotNone(delta.encode("second", compact_position(6.6, 3.3)))
+
+    def test_forgotten_orders_start_over_with_a_full_frame(self):
+        delta = TrackingDelta()
+        position = compact_position(6.5, 3.3, 90, 5)
+        delta.encode("order", position)
+        delta.forget("order")
+        self.assertEqual(delta.encode("order", position), position)
+
+
+@skipUnless(connection.vendor == 'postgresql', "Partial and covering indexes only shape plans on Postgres")
+class HotQueryPlanTests(TestCase):
+    """
+        Each hot delivery query must keep using its index on a seeded, analyzed database
+    """
+    pickup = (6.5244, 3.3792)
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(12)
+        now = timezone.now()
+        count = 4000
+
+        User = get_user_model()
+        users = User.objects.bulk_create([User(email=f"plan-{index}@example.com", password="!") for index in range(count)])
+        # One rider in twenty is available, one order in forty is still pending.
+        riders = Rider.objects.bulk_create([
+            Rider(
+                user=user, latitude=cls.pickup[0] + rng.uniform(-0.3, 0.3), longitude=cls.pickup[1] + rng.uniform(-0.3, 0.3),
+                availability='idle' if index % 20 == 0 else 'offline', is_available=index % 20 == 0, idle_since=now,
+            )
+            for index, user in enumerate(users)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(
+                status='pending' if index % 40 == 0 else 'delivered', item_type='envelope', item_category='documents',
+                suggested_cost=1500, pickup_latitude=cls.pickup[0] + rng.uniform(-0.3, 0.3),
+                pickup_longitude=cls.pickup[1] + rng.uniform(-0.3, 0.3), dropoff_latitude=6.6, dropoff_longitude=3.4,
+                expires_at=now + timedelta(minutes=rng.uniform(-60 * 24, 10)),
+            )
+            for index in range(count)
+        ])
+        # Most offers are closed; the open ones are spread over the next hour.
+        offers = Offer.objects.bulk_create([
+            Offer(
+                order=order, rider=rider, fare=1500, is_counter=False, accepted=index % 10 != 0,
+                expires_at=now + timedelta(minutes=rng.uniform(-60, 60)),
+            )
+            for index, (order, rider) in enumerate(zip(orders, riders))
+        ])
+        OfferEvent.objects.bulk_create([
+            OfferEvent(offer=offer, event=event) for offer in offers for event in ('sent', 'declined')
+        ])
+        cls.offer = offers[0]
+
+        with connection.cursor() as cursor:
+            for model in (Rider, Order, Offer, OfferEvent):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        self.assertNotIn("Seq Scan", plan)
+        self.assertIn(index_name or "Index", plan)
+
+    def test_available_riders_near_a_pickup(self):
+        self.assertUsesIndex(Rider.objects.filter(is_available=True).near(*self.pickup, 3), "rider_available_location_idx")
+
+    def test_pending_orders_due_to_expire(self):
+        self.assertUsesIndex(Order.objects.filter(status='pending', expires_at__lt=timezone.now()), "order_pending_expiry_idx")
+
+    def test_open_offers_due_to_expire(self):
+        self.assertUsesIndex(Offer.objects.filter(accepted=False, expires_at__lte=timezone.now()), "offer_open_expiry_idx")
+
+    def test_events_of_an_offer(self):
+        # OfferEvent is partitioned by month: bounding the period prunes the empty future partitions,
+        # and the (offer, event) index exists once per partition.
+        events = OfferEvent.objects.in_period(self.offer.created_at, timezone.now() + timedelta(minutes=1))
+        self.assertUsesIndex(events.filter(offer=self.offer, event='declined'), "offer_id_event_idx")
+
+
+class OrderLifecycleTests(ScratchRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+        User = get_user_model()
+        customer = User.objects.create_user(email="lifecycle-customer@example.com", password="!", role="customer")
+        self.rider_user = User.objects.create_user(email="lifecycle-rider@example.com", password="!", role="rider")
+        self.other_rider_user = User.objects.create_user(email="lifecycle-other@example.com", password="!", role="rider")
+        self.order = make_order(customer, rider=self.rider_user.rider, status='accepted')
+        self.client = APIClient()
+
+    def post(self, name, user, data=None):
+        self.client.force_authenticate(user)
+        return self.client.post(reverse(name, args=[self.order.id]), data, format="multipart" if data else None)
+
+    def photo(self):
+        content = io.BytesIO()
+        Image.new("RGB", (64, 48), "orange").save(content, "JPEG")
+        return SimpleUploadedFile("Proof.JPG", content.getvalue(), content_type="image/jpeg")
+
+    def test_pickup_of_an_accepted_order(self):
+        response = self.post("orders-pickup", self.rider_user)
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'picked_up')
+        self.assertIsNotNone(self.order.picked_up_at)
+
+    def test_pickup_conflicts_for_another_rider_or_status(self):
+        self.assertEqual(self.post("orders-pickup", self.other_rider_user).status_code, 409)
+        Order.objects.filter(id=self.order.id).update(status='pending')
+        self.assertEqual(self.post("orders-pickup", self.rider_user).status_code, 409)
+        self.assertEqual(Order.objects.get(id=self.order.id).status, 'pending')
+
+    def test_only_riders_can_pick_up(self):
+        self.assertEqual(self.post("orders-pickup", self.order.customer).status_code, 403)
+
+    def test_complete_stores_the_photo_and_frees_the_rider(self):
+        Order.objects.filter(id=self.order.id).update(status='picked_up')
+        with mock.patch("delivery.views.generate_delivery_thumbnail.delay") as thumbnail, \
+                mock.patch("delivery.views.finish_delivery") as finish, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.post("orders-complete", self.rider_user, {"delivery_photo": self.photo()})
+
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'delivered')
+        self.assertIsNotNone(self.order.delivered_at)
+        self.assertEqual(self.order.delivery_photo.name, f"delivery_photos/{self.order.id}.jpg")
+        self.assertTrue(os.path.exists(self.order.delivery_photo.path))
+        thumbnail.assert_called_once_with(str(self.order.id))
+        finish.assert_called_once_with(self.rider_user.rider.id)
+
+    def test_complete_conflicts_before_pickup(self):
+        with mock.patch("delivery.views.finish_delivery") as finish:
+            response = self.post("orders-complete", self.rider_user, {"delivery_photo": self.photo()})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(finish.called)
+
+    def test_a_failed_complete_deletes_the_stored_photo(self):
+        Order.objects.filter(id=self.order.id).update(status='picked_up')
+        stored = []
+        store = FieldFile.save
+
+        def store_then_cancel(field_file, name, content, save=True):
+            # The customer cancels while the photo is being stored.
+            store(field_file, name, content, save=save)
+            stored.append(field_file.path)
+            Order.objects.filter(id=self.order.id).update(status='cancelled')
+
+        with mock.patch.object(FieldFile, "save", store_then_cancel), \
+                mock.patch("delivery.views.generate_delivery_thumbnail.delay") as thumbnail, \
+                mock.patch("delivery.views.finish_delivery") as finish, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.post("orders-complete", self.rider_user, {"delivery_photo": self.photo()})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(stored), 1)
+        self.assertFalse(os.path.exists(stored[0]))
+        self.assertIsNone(Order.objects.get(id=self.order.id).delivered_at)
+        self.assertFalse(thumbnail.called or finish.called)
+
+
+class ReleaseOfferedTests(ScratchRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        customer = User.objects.create_user(email="release-customer@example.com", password="!", role="customer")
+        self.rider = User.objects.create_user(email="release-rider@example.com", password="!", role="rider").rider
+        go_online(self.rider.id)
+        mark_offered([self.rider.id])
+
+        now = timezone.now()
+        self.lapsed, self.live = [
+            Offer.objects.create(order=make_order(customer), rider=self.rider, fare=1500, expires_at=expires_at)
+            for expires_at in (now - timedelta(seconds=1), now + timedelta(seconds=30))
+        ]
+
+    def availability(self):
+        return Rider.objects.get(id=self.rider.id).availability
+
+    def test_riders_with_another_live_offer_stay_offered(self):
+        self.assertEqual(release_offered([self.rider.id]), [])
+        self.assertEqual(self.availability(), 'offered')
+
+        Offer.objects.filter(id=self.live.id).update(expires_at=timezone.now())
+        self.assertEqual(release_offered([self.rider.id]), [self.rider.id])
+        self.assertEqual(self.availability(), 'idle')
+
+    def test_expiring_one_of_two_offers_keeps_the_rider_offered(self):
+        ExpiryScheduler().schedule_offers([self.lapsed, self.live])
+        with mock.patch("delivery.tasks.group_send_many") as notify:
+            expire_due_offers_and_orders()
+        self.assertEqual(self.availability(), 'offered')
+        self.assertEqual([user for user, _ in notify.call_args.args[0]], [f"user_{self.rider.user_id}"])
+
+
+class LocationSocketTests(ScratchRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(email="reconnect-rider@example.com", password="!", role="rider")
+
+    def open(self, consumer=RiderLocationConsumer):
+        communicator = WebsocketCommunicator(consumer.as_asgi(), "/ws/")
+        communicator.scope["user"] = self.user
+        return communicator
+
+    def availability(self):
+        return Rider.objects.get(user=self.user).availability
+
+    def test_a_reconnect_overtaking_the_old_close_keeps_the_rider_online(self):
+        async def run():
+            old, new = self.open(), self.open()
+            await old.connect()
+            await new.connect()
+            await old.disconnect()
+            self.assertEqual(await database_sync_to_async(self.availability)(), 'idle')
+            await new.disconnect()
+            self.assertEqual(await database_sync_to_async(self.availability)(), 'offline')
+
+        async_to_sync(run)()
+
+    def test_gateway_location_topic_counts_as_a_location_socket(self):
+        async def run():
+            gateway, dedicated = self.open(GatewayConsumer), self.open()
+            await gateway.connect()
+            await gateway.send_json_to({"type": "subscribe", "topic": "location"})
+            await gateway.receive_json_from()
+            await dedicated.connect()
+            await dedicated.disconnect()
+            self.assertEqual(await database_sync_to_async(self.availability)(), 'idle')
+            await gateway.send_json_to({"type": "unsubscribe", "topic": "location"})
+            # Unsubscribing has no reply, the error for the frame after it shows it was handled.
+            await gateway.send_json_to({"type": "subscribe", "topic": "nope"})
+            await gateway.receive_json_from()
+            self.assertEqual(await database_sync_to_async(self.availability)(), 'offline')
+            await gateway.disconnect()
+
+        async_to_sync(run)()
+
+    def test_offer_and_order_events_leave_the_location_socket_alone(self):
+        async def run():
+            communicator = self.open()
+            await communicator.connect()
+            layer = get_channel_layer()
+            for event in (
+                {"type": "new_offer", "offer": {}},
+                {"type": "offer_accepted", "offer": {}},
+                {"type": "offer_countered", "offer": {}},
+                {"type": "offer_cancelled", "offer_id": "offer"},
+                {"type": "offer_expired", "offer_id": "offer"},
+                {"type": "order_status", "order_id": "order", "status": "picked_up"},
+            ):
+                await layer.group_send(f"user_{self.user.id}", event)
+            self.assertTrue(await communicator.receive_nothing())
+            # A consumer that died on an event would raise here, and its disconnect would never run.
+            await communicator.disconnect()
+            self.assertEqual(await database_sync_to_async(self.availability)(), 'offline')
+
+        async_to_sync(run)()
+
+
+class OfferArchiveTests(ScratchRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.customer = User.objects.create_user(email="archive-customer@example.com", password="!", role="customer")
+        self.rider = User.objects.create_user(email="archive-rider@example.com", password="!", role="rider").rider
+        self.now = timezone.now()
+
+    def offer(self, expired_ago: timedelta, **fields) -> Offer:
+        return Offer.objects.create(
+            order=make_order(self.customer), rider=self.rider, fare=1500, expires_at=self.now - expired_ago, **fields,
+        )
+
+    def expired_offers(self, count: int) -> 'list[Offer]':
+        return [self.offer(timedelta(hours=count - index)) for index in range(count)]
+
+    def test_expired_offers_move_with_their_events_in_order(self):
+        offer = self.offer(timedelta(hours=1), is_counter=False)
+        # Written out of order, archived in the order they happened.
+        for event, seconds in (("expired", 30), ("sent", 0), ("countered", 10)):
+            created = OfferEvent.objects.create(offer=offer, event=event, payload={"at": seconds})
+            OfferEvent.objects.filter(id=created.id).update(created_at=offer.created_at + timedelta(seconds=seconds))
+
+        self.assertEqual(archive_expired_offers(before=self.now), 1)
+
+        self.assertFalse(Offer.objects.filter(id=offer.id).exists())
+        self.assertFalse(OfferEvent.objects.filter(offer_id=offer.id).exists())
+        archived = OfferArchive.objects.get(id=offer.id)
+        self.assertEqual(
+            (archived.order_id, archived.rider_id, archived.fare, archived.is_counter, archived.accepted, archived.expires_at),
+            (offer.order_id, offer.rider_id, offer.fare, False, False, offer.expires_at),
+        )
+        self.assertEqual([event["event"] for event in archived.events], ["sent", "countered", "expired"])
+        self.assertEqual([event["payload"] for event in archived.events], [{"at": 0}, {"at": 10}, {"at": 30}])
+
+    def test_accepted_live_and_recently_expired_offers_stay(self):
+        accepted = self.offer(timedelta(hours=1), accepted=True)
+        live = self.offer(-timedelta(minutes=1))
+        in_grace = self.offer(ARCHIVE_GRACE_PERIOD - timedelta(seconds=30))
+        past_grace = self.offer(ARCHIVE_GRACE_PERIOD + timedelta(seconds=30))
+
+        self.assertEqual(archive_old_offers(), 1)
+        self.assertEqual(set(Offer.objects.values_list("id", flat=True)), {accepted.id, live.id, in_grace.id})
+        self.assertEqual(list(OfferArchive.objects.values_list("id", flat=True)), [past_grace.id])
+
+    def test_a_batch_takes_the_earliest_expired_offers(self):
+        offers = self.expired_offers(5)
+        self.assertEqual(archive_offer_batch(self.now, batch_size=2), 2)
+        self.assertEqual(set(OfferArchive.objects.values_list("id", flat=True)), {offers[0].id, offers[1].id})
+
+    def test_runs_batches_until_nothing_is_left(self):
+        self.expired_offers(5)
+        with mock.patch("delivery.archive.archive_offer_batch", wraps=archive_offer_batch) as batch:
+            self.assertEqual(archive_expired_offers(self.now, batch_size=2), 5)
+        self.assertEqual(batch.call_count, 3)
+        self.assertEqual(OfferArchive.objects.count(), 5)
+
+    def test_stops_starting_batches_once_the_budget_is_spent(self):
+        self.expired_offers(5)
+        # The run starts at 0, the first batch starts in budget and the second check finds it spent.
+        with mock.patch("delivery.archive.time.monotonic", side_effect=[0, 0, 21]):
+            self.assertEqual(archive_expired_offers(self.now, batch_size=2, time_budget=20), 2)
+        self.assertEqual(Offer.objects.count(), 3)
+
+    def test_rerunning_is_harmless(self):
+        offer = self.offer(timedelta(hours=1))
+        # A copy left by an earlier run, e.g. one restored from the archive by hand.
+        OfferArchive.objects.create(
+            id=offer.id, order_id=offer.order_id, rider_id=offer.rider_id, fare=offer.fare,
+            is_counter=offer.is_counter, accepted=False, created_at=offer.created_at, expires_at=offer.expires_at,
+        )
+
+        self.assertEqual(archive_expired_offers(self.now), 1)
+        self.assertEqual(archive_expired_offers(self.now), 0)
+        self.assertFalse(Offer.objects.filter(id=offer.id).exists())
+        self.assertEqual(OfferArchive.objects.filter(id=offer.id).count(), 1)
@@ -0,0 +1,92 @@
+import time
+
+from django_redis import get_redis_connection
+
+ACTIVE_ORDER_KEY = "rider:{rider_id}:active_order"
+ACTIVE_ORDER_TTL_SECONDS = 6 * 60 * 60
+
+# Riders publish at most one tracking update per interval, and only once they have moved.
+TRACKING_PUBLISH_INTERVAL_SECONDS = 2.0
+# Each customer connection receives at most one tracking frame per interval.
+TRACKING_SEND_INTERVAL_SECONDS = 1.0
+# Coordinates are rounded to about a metre before comparing and sending.
+COORDINATE_PRECISION = 5
+
+TRACKED_FIELDS = ("latitude", "longitude", "heading", "speed")
+
+
+def tracking_group(order_id) -> str:
+    return f"order_{order_id}"
+
+def set_active_order(rider_id, order_id):
+    redis = get_redis_connection("default")
+    redis.set(ACTIVE_ORDER_KEY.format(rider_id=rider_id), str(order_id), ex=ACTIVE_ORDER_TTL_SECONDS)
+
+def clear_active_order(rider_id):
+    redis = get_redis_connection("default")
+    redis.delete(ACTIVE_ORDER_KEY.format(rider_id=rider_id))
+
+def active_order(rider_id) -> 'str | None':
+    redis = get_redis_connection("default")
+    order_id = redis.get(ACTIVE_ORDER_KEY.format(rider_id=rider_id))
+    return order_id.decode() if order_id else None
+
+def compact_position(latitude, longitude, heading=None, speed=None) -> dict:
+    return {
+        "latitude": round(latitude, COORDINATE_PRECISION),
+        "longitude": round(longitude, COORDINATE_PRECISION),
+        "heading": round(heading) if heading is not None else None,
+        "speed": round(speed, 1) if speed is not None else None,
+    }
+
+
+class TrackingPublisher:
+    """
+        Rider-side rate limiter. Decides whether a new position is worth publishing to the order group.
+    """
+
+    def __init__(self):
+        self.last_published_at = 0
+        self.last_position = None
+
+    def should_publish(self, position: dict) -> bool:
+        now = time.monotonic()
+        if now - self.last_published_at < TRACKING_PUBLISH_INTERVAL_SECONDS or position == self.last_position:
+            return False
+        self.last_published_at = now
+        self.last_position = position
+        return True
+
+
+class TrackingDelta:
+    """
+        Customer-side throttle and delta encoder, one per connection.
+
+        The first frame for an order carries every field; later frames carry only
+        the fields that changed since the last frame this connection sent.
+    """
+
+    def __init__(self):
+        self.last_sent = {}
+        self.last_sent_at = {}
+
+    def encode(self, order_id, position: dict) -> 'dict | None':
+        now = time.monotonic()
+        if now - self.last_sent_at.get(order_id, 0) < TRACKING_SEND_INTERVAL_SECONDS:
+            return None
+
+        previous = self.last_sent.get(order_id)
+        if previous is None:
+            changes = dict(position)
+        else:
+            changes = {field: position[field] for field in TRACKED_FIELDS if position.get(field) != previous.get(field)}
+            if not changes:
+                return None
+
+        self.last_sent[order_id] = position
+        self.last_sent_at[order_id] = now
+        return changes
+
+    def forget(self, order_id):
+        self.last_sent.pop(order_id, None)
+        self.last_sent_at.pop(order_id, None)
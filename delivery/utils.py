@@ -1,11 +1,33 @@
+import asyncio
 from math import radians, cos, sin, asin, sqrt
-from datetime import timedelta, datetime
+from datetime import timedelta
 from decimal import Decimal
 
+from django.db import transaction
 from django.utils import timezone
 from asgiref.sync import async_to_sync # type: ignore
 from channels.layers import get_channel_layer
 from .models import Rider, Order, Offer, OfferEvent
+from .scoring import score_riders
+from .declines import declined_riders
+from .heatmap import SupplyDemandHeatmap
+from .locations import LocationBuffer
+from .location_store import RiderLocationStore
+from .expiry import ExpiryScheduler
+from .availability import RiderIdleQueue, mark_offered
+from user.cards import get_user_cards, offer_party
+from user.presence import Presence
+
+async def _group_send_many(messages):
+    layer = get_channel_layer()
+    await asyncio.gather(*(layer.group_send(group, message) for group, message in messages))
+
+def group_send_many(messages: 'list[tuple[str, dict]]'):
+    """
+        Sends (group, message) pairs to the channel layer concurrently from a single event loop entry
+    """
+    if messages:
+        async_to_sync(_group_send_many)(messages)
 
 def haversine(lat1: float, lon1: float, lat2: float, lon2: float):
     """
@@ -25,30 +47,47 @@ def is_within_radius(pickup_lat: float, pickup_lon: float, target_lat: float, ta
     distance = haversine(pickup_lat, pickup_lon, target_lat, target_lon)
     return distance <= radius_km
 
-def find_nearby_riders(pickup_latitude: float, pickup_longitude: float, limit: int=5):
-    declined_offers = OfferEvent.objects.filter(event='declined').values_list("offer_id", flat=True)
-    excluded_riders = Offer.objects.filter(id__in=declined_offers).values_list("rider_id", flat=True)
-    available_riders = Rider.objects.filter(is_available=True, latitude__isnull=False, longitude__isnull=False).exclude(id__in=excluded_riders)
-    nearby_riders = [rider for rider in available_riders if is_within_radius(pickup_latitude, pickup_longitude, rider.latitude, rider.longitude)]
-    nearby_riders.sort(key=lambda x: x.idle_since or datetime.min)
-    return nearby_riders[:limit]
-
-# This function is meant to calculate the effective fare based on supply and demand metrics in real-time.
-# However initial testing and lack of an existing framework to hold such led to it remaining unused for the meantime.
-# Will be revisited with time.
+# How many of the longest-idle riders around a pickup are considered for scoring.
+IDLE_CANDIDATES = 50
+
+def find_nearby_riders(pickup_latitude: float, pickup_longitude: float, limit: int=5, radius_km: int=3, excluded_riders=()):
+    available_riders = Rider.objects.filter(is_available=True).near(pickup_latitude, pickup_longitude, radius_km)
+    if excluded_riders:
+        available_riders = available_riders.exclude(id__in=excluded_riders)
+
+    # The live location store narrows the box further; fall back to the box alone while it is still cold.
+    candidate_ids = [rider_id for rider_id, _ in RiderLocationStore().search(pickup_latitude, pickup_longitude, radius_km)]
+    if candidate_ids:
+        available_riders = available_riders.filter(id__in=candidate_ids)
+
+    # Likewise the idle queue hands over only the longest-idle riders in the cells around the pickup.
+    idle_ids = RiderIdleQueue().longest_idle(pickup_latitude, pickup_longitude, radius_km, IDLE_CANDIDATES)
+    if idle_ids:
+        available_riders = available_riders.filter(id__in=idle_ids)
+
+    available_riders = list(available_riders.only(
+        "id", "user_id", "latitude", "longitude", "heading", "speed", "idle_since",
+    ))
+    if not available_riders:
+        return []
+
+    LocationBuffer().overlay(available_riders)
+    distances, scores = score_riders(pickup_latitude, pickup_longitude, available_riders, radius_km, timezone.now())
+    ranked = sorted(
+        (index for index in range(len(available_riders)) if distances[index] <= radius_km),
+        key=lambda index: scores[index],
+        reverse=True,
+    )
+    # Riders with a socket open that delivers offers go first, best scored first within each group.
+    connected = Presence().online((str(available_riders[index].user_id) for index in ranked), 'delivery')
+    ranked.sort(key=lambda index: str(available_riders[index].user_id) not in connected)
+    return [available_riders[index] for index in ranked[:limit]]
+
+# Calculates the effective fare multiplier from real-time supply and demand.
+# Counts come from the incrementally maintained heatmap, so this is a handful of Redis reads
+# regardless of fleet size or order volume.
 def calculate_simple_supply_demand_multiplier(pickup_lat: float, pickup_lon: float, radius_km: int=3):
-    now = timezone.now()
-    riders = Rider.objects.filter(is_available=True, latitude__isnull=False, longitude__isnull=False)
-    rider_count = 0
-    for r in riders:
-        if haversine(pickup_lat, pickup_lon, r.latitude, r.longitude) <= radius_km:
-            rider_count += 1
-
-    recent_orders = Order.objects.filter(created_at__gte=now - timedelta(minutes=5), status='pending')
-    order_count = 0
-    for o in recent_orders:
-        if haversine(pickup_lat, pickup_lon, o.pickup_latitude, o.pickup_longitude) <= radius_km:
-            order_count += 1
+    rider_count, order_count = SupplyDemandHeatmap().counts(pickup_lat, pickup_lon, radius_km)
 
     supply = max(rider_count, 1)
     ratio = order_count / supply if supply > 0 else order_count
@@ -62,52 +101,72 @@ def calculate_simple_supply_demand_multiplier(pickup_lat: float, pickup_lon: flo
     else:
         return 1.20
     
-def create_offers_for_order(order: Order) -> 'list[Offer]':
-    #multiplier = calculate_simple_supply_demand_multiplier(order.pickup_latitude, order.pickup_longitude)
+def create_offers_for_order(order: Order, radius_km: int=3) -> 'list[Offer]':
+    """
+        Creates offers for nearby riders who have not been offered or declined the order yet.
+        Riders are notified separately, see send_offer_notifications.
+    """
+    multiplier = calculate_simple_supply_demand_multiplier(order.pickup_latitude, order.pickup_longitude)
     suggested = Decimal(order.suggested_cost)
 
-    effective_fare =  (suggested).quantize(Decimal("0.01")) #(suggested * Decimal(multiplier)).quantize(Decimal("0.01"))
+    effective_fare = (suggested * Decimal(str(multiplier))).quantize(Decimal("0.01"))
+
+    already_offered = {str(rider_id) for rider_id in Offer.objects.filter(order=order).values_list("rider_id", flat=True)}
+    riders = find_nearby_riders(
+        order.pickup_latitude, order.pickup_longitude,
+        radius_km=radius_km,
+        excluded_riders=declined_riders(order.id) | already_offered,
+    )
 
-    riders = find_nearby_riders(order.pickup_latitude, order.pickup_longitude)
+    if not riders:
+        return []
 
-    offers = []
     now = timezone.now()
     expires_at = now + timedelta(seconds=50)
-    for rider in riders:
-        offer = Offer.objects.create(order=order, rider=rider, fare=effective_fare, is_counter=False, expires_at=expires_at)
-        OfferEvent.objects.create(offer=offer, event='sent', payload={"sent_to": str(rider.id)})
-        offers.append(offer)
+    offers = [
+        Offer(order=order, rider=rider, fare=effective_fare, is_counter=False, expires_at=expires_at)
+        for rider in riders
+    ]
+    with transaction.atomic():
+        Offer.objects.bulk_create(offers)
+        OfferEvent.objects.bulk_create([
+            OfferEvent(offer=offer, event='sent', payload={"sent_to": str(offer.rider_id)})
+            for offer in offers
+        ])
+    ExpiryScheduler().schedule_offers(offers)
+    mark_offered([rider.id for rider in riders])
+    return offers
 
-        layer = get_channel_layer()
+def send_offer_notifications(order: Order, offers: 'list[Offer]'):
+    """
+        Sends a new_offer message to the rider of each offer. Offers need their rider loaded.
+    """
+    if not offers:
+        return
+
+    cards = get_user_cards([order.customer_id] + [offer.rider.user_id for offer in offers])
+    customer = offer_party(cards[str(order.customer_id)])
+    messages = []
+    for offer in offers:
+        rider_user_id = offer.rider.user_id
         payload = {
             "type": "new_offer",
             "offer": {
                 "id": str(offer.id),
-                "customer": {
-                    "id": str(order.customer_id),
-                    "email": order.customer.email,
-                    "first_name": order.customer.first_name,
-                    "last_name": order.customer.last_name,
-                    "phone": order.customer.phone_number,
-                },
-                "rider": {
-                    "id": str(offer.rider_id),
-                    "email": offer.rider.user.email,
-                    "first_name": offer.rider.user.first_name,
-                    "last_name": offer.rider.user.last_name,
-                    "phone": offer.rider.user.phone_number,
-                },
+                "customer": customer,
+                "rider": offer_party(cards[str(rider_user_id)], offer.rider_id),
                 #"order_id": str(order.id),
                 "fare": str(offer.fare),
                 #"pickup_lat": order.pickup_latitude,
                 #"pickup_lon": order.pickup_longitude,
                 #"dropoff_lat": order.dropoff_latitude,
                 #"dropoff_lon": order.dropoff_longitude,
-                "package_category": offer.order.item_category,
-                "package_type": offer.order.item_type,
+                "package_category": order.item_category,
+                "package_type": order.item_type,
                 "created_at": offer.created_at.isoformat(),
                 "expires_at": offer.expires_at.isoformat()
             },
         }
-        async_to_sync(layer.group_send)(f"user_{rider.user.id}", payload)
-    return offers
\ No newline at end of file
+        messages.append((f"user_{rider_user_id}", payload))
+
+    group_send_many(messages)
\ No newline at end of file
@@ -1,3 +1,4 @@
+import os
 from datetime import timedelta
 
 from rest_framework import viewsets, permissions, status
@@ -6,13 +7,20 @@ from rest_framework.response import Response
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
 from .models import Order, Rider, Offer, OfferEvent
-from .serializers import OrderCreateSerializer, OrderSerializer, OfferSerializer
-from .tasks import dispatch_offers
-from user.permissions import IsApprovedRider
+from .serializers import OrderCreateSerializer, OrderSerializer, OrderCompleteSerializer, OfferSerializer
+from .tasks import dispatch_offers, generate_delivery_thumbnail
+from .declines import record_decline
+from .tracking import set_active_order, clear_active_order
+from .expiry import ExpiryScheduler
+from .acceptance import claim_order, claim_conflict, cancel_sibling_offers
+from .availability import release_offered, start_delivery, finish_delivery
+from user.permissions import IsApprovedRider, IsRider
+from user.cards import build_user_card, get_user_card, offer_party
 
 
 # Create your views here.
@@ -30,8 +38,66 @@ class OrderViewSet(viewsets.ModelViewSet):
         now = timezone.now()
         expires = now + timedelta(seconds=60)
         order = serializer.save(customer = self.request.user, expires_at=expires)
+        ExpiryScheduler().schedule_order(order)
         dispatch_offers.delay(str(order.id))
 
+    def _notify_status(self, order_id, status_name):
+        customer_id = Order.objects.values_list("customer_id", flat=True).get(pk=order_id)
+        async_to_sync(get_channel_layer().group_send)(f'user_{customer_id}', {
+            "type": "order_status",
+            "order_id": str(order_id),
+            "status": status_name,
+        })
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsRider])
+    def pickup(self, request, pk=None):
+        """
+            Rider collected the package
+        """
+        rider_id = Rider.objects.values_list("id", flat=True).get(user=request.user)
+        picked_up = Order.objects.filter(pk=pk, rider_id=rider_id, status='accepted').update(
+            status='picked_up', picked_up_at=timezone.now(),
+        )
+        if not picked_up:
+            return Response({"detail": "Order is not awaiting pickup by you"}, status=409)
+
+        self._notify_status(pk, 'picked_up')
+        return Response({"status": "Order picked up", "order_id": str(pk)})
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsRider])
+    def complete(self, request, pk=None):
+        """
+            Rider delivered the package, with a delivery photo as proof
+        """
+        # Stream the photo to a temporary file in chunks rather than buffering it in memory,
+        # so FileSystemStorage can move it into place without another copy.
+        request._request.upload_handlers = [TemporaryFileUploadHandler(request._request)]
+
+        rider_id = Rider.objects.values_list("id", flat=True).get(user=request.user)
+        if not Order.objects.filter(pk=pk, rider_id=rider_id, status='picked_up').exists():
+            return Response({"detail": "Order is not being delivered by you"}, status=409)
+
+        serializer = OrderCompleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        photo = serializer.validated_data["delivery_photo"]
+        order = Order(pk=pk)
+        order.delivery_photo.save(f"{pk}{os.path.splitext(photo.name)[1].lower()}", photo, save=False)
+        with transaction.atomic():
+            delivered = Order.objects.filter(pk=pk, rider_id=rider_id, status='picked_up').update(
+                status='delivered', delivered_at=timezone.now(), delivery_photo=order.delivery_photo.name,
+            )
+            if delivered:
+                transaction.on_commit(lambda: generate_delivery_thumbnail.delay(str(pk)))
+        if not delivered:
+            order.delivery_photo.delete(save=False)
+            return Response({"detail": "Order is not being delivered by you"}, status=409)
+
+        clear_active_order(rider_id)
+        finish_delivery(rider_id)
+        self._notify_status(pk, 'delivered')
+        return Response({"status": "Order delivered", "order_id": str(pk)})
+
 
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated, IsApprovedRider])
@@ -39,47 +105,36 @@ def driver_accept(request, offer_id):
     """
         Driver accepts an order
     """
-    offer = get_object_or_404(Offer, pk=offer_id)
-    rider = Rider.objects.get(user=request.user)
+    offer = get_object_or_404(Offer.objects.only("id", "order_id", "expires_at"), pk=offer_id)
+    rider_id = Rider.objects.values_list("id", flat=True).get(user=request.user)
 
     now = timezone.now()
     if offer.expires_at and now > offer.expires_at:
         OfferEvent.objects.create(offer=offer, event='expired', payload={})
         return Response({"detail": "Offer expired"}, status=400)
-    
-    with transaction.atomic():
-        order = Order.objects.select_for_update().get(pk=offer.order_id)
 
-        if order.status == "accepted" or order.rider is not None:
-            return Response({"detail": "Order has already been accepted by a rider"}, status=409)
-        if order.status != "pending":
-            return Response({"error": "Not available"}, status=400)
-        
-        order.rider = rider
-        order.status = 'accpeted'
-        order.accepted_at = timezone.now()
-        order.save()
+    customer_id = claim_order(offer, rider_id, {"rider_accepted": str(rider_id)})
+    if customer_id is None:
+        body, status_code = claim_conflict(offer.order_id)
+        return Response(body, status=status_code)
 
-        offer.accepted = True
-        offer.save()
-        OfferEvent.objects.create(offer=offer, event='accepted', payload={"rider_accepted": str(rider.id)})
+    set_active_order(rider_id, offer.order_id)
+    start_delivery(rider_id)
+    scheduler = ExpiryScheduler()
+    scheduler.cancel_offers([offer.id])
+    scheduler.cancel_order(offer.order_id)
+    cancel_sibling_offers(offer.order_id, offer.id)
 
     channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(f'user_{order.customer.id}', {
+    async_to_sync(channel_layer.group_send)(f'user_{customer_id}', {
         "type": "offer_accepted",
         "offer": {
             "id": str(offer.id),
-            "rider": {
-                    "id": str(order.rider.user.id),
-                    "email": order.rider.user.email,
-                    "first_name": order.rider.user.first_name,
-                    "last_name": order.rider.user.last_name,
-                    "phone": order.rider.user.phone_number,
-            },
+            "rider": offer_party(build_user_card(request.user)),
         },
     })
 
-    return Response({"status" : "Order accepted", "order_id": str(order.id)})
+    return Response({"status" : "Order accepted", "order_id": str(offer.order_id)})
 
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated, IsApprovedRider])
@@ -87,52 +142,40 @@ def customer_accept(request, offer_id):
     """
         Driver accepts an order
     """
-    offer = get_object_or_404(Offer, pk=offer_id)
+    offer = get_object_or_404(Offer.objects.select_related("rider"), pk=offer_id)
     rider = offer.rider
 
     now = timezone.now()
     if offer.expires_at and now > offer.expires_at:
         OfferEvent.objects.create(offer=offer, event='expired', payload={})
         return Response({"detail": "Offer expired"}, status=400)
-    
-    with transaction.atomic():
-        order = Order.objects.select_for_update().get(pk=offer.order_id)
 
-        if order.status == "accepted" or order.rider is not None:
-            return Response({"detail": "Order has already been accepted by a rider"}, status=409)
-        if order.status != "pending":
-            return Response({"error": "Not available"}, status=400)
-        
-        order.rider = rider
-        order.status = 'accpeted'
-        order.accepted_at = timezone.now()
-        order.save()
+    if claim_order(offer, rider.id, {"customer_accepted": str(rider.id)}) is None:
+        body, status_code = claim_conflict(offer.order_id)
+        return Response(body, status=status_code)
 
-        offer.accepted = True
-        offer.save()
-        OfferEvent.objects.create(offer=offer, event='accepted', payload={"customer_accepted": str(rider.id)})
+    set_active_order(rider.id, offer.order_id)
+    start_delivery(rider.id)
+    scheduler = ExpiryScheduler()
+    scheduler.cancel_offers([offer.id])
+    scheduler.cancel_order(offer.order_id)
+    cancel_sibling_offers(offer.order_id, offer.id)
 
     channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(f'user_{rider.user.id}', {
+    async_to_sync(channel_layer.group_send)(f'user_{rider.user_id}', {
         "type": "offer_accepted",
         "offer": {
             "id": str(offer.id),
-            "rider": {
-                    "id": str(order.rider.id),
-                    "email": order.rider.user.email,
-                    "first_name": order.rider.user.first_name,
-                    "last_name": order.rider.user.last_name,
-                    "phone": order.rider.user.phone_number,
-            },
+            "rider": offer_party(get_user_card(rider.user_id), rider.id),
         },
     })
 
-    return Response({"status" : "Order accepted", "order_id": str(order.id)})
+    return Response({"status" : "Order accepted", "order_id": str(offer.order_id)})
 
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated, IsApprovedRider])
 def counter_offer(request, offer_id):
-    offer = get_object_or_404(Offer, pk=offer_id)
+    offer = get_object_or_404(Offer.objects.select_related("order", "rider"), pk=offer_id)
     user = request.user
     
     fare = request.data.get("counter_fee")
@@ -142,10 +185,12 @@ def counter_offer(request, offer_id):
     now = timezone.now()
     expires_at = now + timedelta(seconds=30)
     Offer.objects.filter(id=offer_id).update(fare=fare, is_counter=True, expires_at=expires_at)
+    offer.expires_at = expires_at
+    ExpiryScheduler().schedule_offers([offer])
     OfferEvent.objects.create(offer=offer, event='countered', payload={"fare": str(fare)})
 
     if user.role == "rider":
-        async_to_sync(get_channel_layer().group_send)(f"user_{str(offer.order.customer.id)}", {
+        async_to_sync(get_channel_layer().group_send)(f"user_{str(offer.order.customer_id)}", {
             "type": "offer_countered",
             "offer": {
                 "id": str(offer.id),
@@ -153,7 +198,7 @@ def counter_offer(request, offer_id):
             }
         })
     else:
-        async_to_sync(get_channel_layer().group_send)(f"user_{str(offer.rider.user.id)}", {
+        async_to_sync(get_channel_layer().group_send)(f"user_{str(offer.rider.user_id)}", {
             "type": "offer_countered",
             "offer": {
                 "id": str(offer.id),
@@ -167,13 +212,18 @@ def counter_offer(request, offer_id):
 @permission_classes([permissions.IsAuthenticated, IsApprovedRider])
 def decline_offer(request, offer_id):
     rider = Rider.objects.get(user=request.user)
-    offer = get_object_or_404(Offer, id=offer_id, rider=rider)
+    offer = get_object_or_404(Offer.objects.select_related("order"), id=offer_id, rider=rider)
 
     now = timezone.now()
     if offer.expires_at and now > offer.expires_at:
         OfferEvent.objects.create(offer=offer, event='expired', payload={})
         return Response({"detail": "Offer expired"}, status=400)
     
+    # Ended the way cancelled offers are, so it no longer counts as a live offer for the rider.
+    Offer.objects.filter(id=offer.id).update(expires_at=now)
+    ExpiryScheduler().cancel_offers([offer.id])
     OfferEvent.objects.create(offer=offer, event='declined')
+    record_decline(offer.order, rider.id)
+    release_offered([rider.id])
     return Response({"detail": "Declined"}, status=200)
         
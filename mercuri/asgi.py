@@ -18,8 +18,9 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from delivery.middleware import TokenAuthMiddleware
 from delivery.routing import websocket_urlpatterns as delivery
 from communication.routing import websocket_urlpatterns as communication
+from mercuri.routing import websocket_urlpatterns as gateway
 
-url_patterns = delivery + communication
+url_patterns = delivery + communication + gateway
 
 application = ProtocolTypeRouter ({
     "http" : django_asgi_app,
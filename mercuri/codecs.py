@@ -0,0 +1,205 @@
+"""
+Wire codecs for WebSocket frames, negotiated per connection through the subprotocol.
+
+Clients list the codecs they understand in Sec-WebSocket-Protocol, most preferred first,
+and the server accepts the first one it supports. Clients that offer none keep getting
+the JSON text frames every socket has always sent.
+
+    json                 JSON text frames
+    msgpack.v1           MessagePack binary frames with compact keys
+    msgpack-deflate.v1   as msgpack.v1, with server frames deflated as one stream per
+                         connection the way permessage-deflate does it. Each frame is the
+                         output of a sync flush without its trailing 00 00 ff ff, so clients
+                         append those four bytes and feed the frame to a raw inflater
+                         (window bits 11 or more) kept for the life of the socket. Client
+                         frames are plain msgpack.v1.
+
+Only the keys of a frame and of the objects named in COMPACT_OBJECTS are compacted. Other
+nested values, such as transaction payloads or call details, go out as they are. A key at a
+compacted level that is itself a compact key, or starts with ESCAPE, is sent with ESCAPE in
+front, so any payload decodes back to exactly what was sent.
+
+The v1 in a subprotocol name is the version of COMPACT_KEYS. Keys are only ever added to
+the table; changing an existing entry needs a new version.
+"""
+import json
+import zlib
+
+import msgpack
+
+COMPACT_KEYS = {
+    "type": "t",
+    "order_id": "o",
+    "offer_id": "of",
+    "offer": "f",
+    "customer": "cu",
+    "rider": "r",
+    "fare": "fa",
+    "price": "pr",
+    "package_category": "pc",
+    "package_type": "pt",
+    "created_at": "ca",
+    "expires_at": "ea",
+    "email": "em",
+    "first_name": "fn",
+    "last_name": "ln",
+    "phone": "ph",
+    "phone_number": "pn",
+    "role": "ro",
+    "status": "s",
+    "latitude": "la",
+    "longitude": "lo",
+    "heading": "h",
+    "speed": "sp",
+    "accuracy": "ac",
+    "message": "m",
+    "message_id": "mi",
+    "message_type": "mt",
+    "room": "rm",
+    "room_id": "ri",
+    "sender": "se",
+    "content": "co",
+    "file_url": "fu",
+    "edited_at": "eda",
+    "is_deleted": "del",
+    "is_read": "ir",
+    "read_at": "ra",
+    "user_id": "u",
+    "username": "un",
+    "is_typing": "it",
+    "action": "a",
+    "call_id": "ci",
+    "caller": "cl",
+    "channel_name": "cn",
+    "topic": "tp",
+    "detail": "d",
+    "data": "da",
+}
+EXPANDED_KEYS = {short: key for key, short in COMPACT_KEYS.items()}
+ESCAPE = "~"
+
+# Objects inside a frame whose keys belong to the offer, tracking and chat schemas
+COMPACT_OBJECTS = {"offer", "customer", "rider", "message", "sender"}
+
+assert len(EXPANDED_KEYS) == len(COMPACT_KEYS), "compact keys must be unique"
+assert not EXPANDED_KEYS.keys() & COMPACT_KEYS.keys(), "a compact key can't also be a full key"
+assert not any(short.startswith(ESCAPE) for short in EXPANDED_KEYS), "a compact key can't start with the escape"
+
+# Deflate settings for msgpack-deflate.v1. Frames are small and repeat within a few frames,
+# so a 2 KB window compresses nearly as well as zlib's 32 KB default, and the compressor
+# state kept per socket drops from about 256 KB to 24 KB.
+DEFLATE_LEVEL = 6
+DEFLATE_WINDOW_BITS = 11
+DEFLATE_MEM_LEVEL = 5
+DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
+
+def compact_key(key):
+    if key in COMPACT_KEYS:
+        return COMPACT_KEYS[key]
+    if key in EXPANDED_KEYS or (isinstance(key, str) and key.startswith(ESCAPE)):
+        return ESCAPE + key
+    return key
+
+def expand_key(key):
+    if isinstance(key, str) and key.startswith(ESCAPE):
+        return key[1:]
+    return EXPANDED_KEYS.get(key, key)
+
+def compact_keys(content):
+    if isinstance(content, dict):
+        return {
+            compact_key(key): compact_keys(value) if key in COMPACT_OBJECTS else value
+            for key, value in content.items()
+        }
+    if isinstance(content, (list, tuple)):
+        return [compact_keys(value) for value in content]
+    return content
+
+def expand_keys(content):
+    if isinstance(content, dict):
+        expanded = {}
+        for short, value in content.items():
+            key = expand_key(short)
+            expanded[key] = expand_keys(value) if key in COMPACT_OBJECTS else value
+        return expanded
+    if isinstance(content, (list, tuple)):
+        return [expand_keys(value) for value in content]
+    return content
+
+
+class JSONCodec:
+    subprotocol = "json"
+
+    def encode(self, content) -> dict:
+        """
+            Keyword arguments for AsyncWebsocketConsumer.send
+        """
+        return {"text_data": json.dumps(content)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        return json.loads(text_data if text_data is not None else bytes_data)
+
+
+class MessagePackCodec(JSONCodec):
+    subprotocol = "msgpack.v1"
+
+    def pack(self, content) -> bytes:
+        return msgpack.packb(compact_keys(content))
+
+    def encode(self, content) -> dict:
+        return {"bytes_data": self.pack(content)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        # Text frames are still read as JSON, so a client can switch its sends over gradually.
+        if bytes_data is None:
+            return super().decode(text_data)
+        return expand_keys(msgpack.unpackb(bytes_data))
+
+
+class DeflateMessagePackCodec(MessagePackCodec):
+    subprotocol = "msgpack-deflate.v1"
+
+    def __init__(self):
+        self.compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -DEFLATE_WINDOW_BITS, DEFLATE_MEM_LEVEL)
+
+    def encode(self, content) -> dict:
+        data = self.compressor.compress(self.pack(content)) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return {"bytes_data": data[:-len(DEFLATE_TAIL)]}
+
+
+CODECS = {codec.subprotocol: codec for codec in (JSONCodec, MessagePackCodec, DeflateMessagePackCodec)}
+
+
+def negotiate(subprotocols) -> 'tuple[JSONCodec, str | None]':
+    """
+        A fresh codec for the first offered subprotocol the server supports, and the
+        subprotocol to accept with. Falls back to JSON without a subprotocol.
+    """
+    for subprotocol in subprotocols:
+        if subprotocol in CODECS:
+            return CODECS[subprotocol](), subprotocol
+    return JSONCodec(), None
+
+
+class CodecConsumerMixin:
+    """
+        Gives a consumer the negotiated codec. Consumers send with send_json and handle
+        decoded frames in receive_json, as with AsyncJsonWebsocketConsumer, whatever
+        the codec on the wire.
+    """
+
+    codec = JSONCodec()
+
+    async def accept(self, subprotocol=None, headers=None):
+        self.codec, negotiated = negotiate(self.scope.get("subprotocols", ()))
+        await super().accept(subprotocol=subprotocol or negotiated, headers=headers)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        await self.receive_json(self.codec.decode(text_data, bytes_data), **kwargs)
+
+    async def receive_json(self, content, **kwargs):
+        pass
+
+    async def send_json(self, content, close=False):
+        await self.send(close=close, **self.codec.encode(content))
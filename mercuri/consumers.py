@@ -0,0 +1,136 @@
+from channels.db import database_sync_to_async
+from django.contrib.auth.models import AnonymousUser
+
+from communication.chat import chat_group
+from communication.consumers import CallConsumer, ChatConsumer
+from delivery.availability import go_online
+from delivery.consumers import DeliveryConsumer, RiderLocationConsumer
+from delivery.tracking import TrackingDelta, TrackingPublisher, tracking_group
+
+# Frames the gateway hands to the single-purpose consumer that already handles them.
+DELIVERY_FRAMES = ('track_order', 'untrack_order')
+LOCATION_FRAMES = ('update_location',)
+CHAT_FRAMES = ('typing',)
+# Topics that count towards the user's presence on the stream of the same name.
+PRESENCE_TOPICS = ('delivery', 'chat', 'location')
+
+
+class GatewayConsumer(DeliveryConsumer, RiderLocationConsumer, ChatConsumer, CallConsumer):
+    """
+        One socket per client in place of ws/delivery/, ws/driver-locations/, ws/chat/,
+        ws/calls/ and ws/transactions/.
+
+        Clients send {"type": "subscribe", "topic": ...} and {"type": "unsubscribe", "topic": ...}
+        frames, and the gateway joins or leaves the channel-layer groups behind each topic.
+        Events are delivered by the handlers inherited from the existing consumers, so every
+        frame keeps the shape it has on the dedicated socket.
+
+        Topics:
+            delivery      offers and order status, the user_<id> group
+            location      rider location pings, for riders only
+            chat          messages and typing for every room, the chat_user_<id> group
+            calls         call notifications, the call_<id> group
+            transactions  wallet transaction updates
+    """
+
+    TOPICS = ('delivery', 'location', 'chat', 'calls', 'transactions')
+    # Streams are joined as topics are subscribed to, not on connect as the dedicated consumers do.
+    presence_streams = ()
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        if self.user == AnonymousUser:
+            await self.close()
+            return
+
+        self.topic_groups = {}
+        self.tracked_orders = set()
+        self.tracking = TrackingDelta()
+        self.rider_id = None
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        for topic in list(getattr(self, 'topic_groups', {})):
+            await self.unsubscribe(topic)
+        for order_id in getattr(self, 'tracked_orders', ()):
+            await self.channel_layer.group_discard(tracking_group(order_id), self.channel_name)
+
+    async def receive_json(self, data):
+        frame_type = data.get('type')
+
+        if frame_type == 'subscribe':
+            await self.subscribe(data.get('topic'))
+        elif frame_type == 'unsubscribe':
+            await self.unsubscribe(data.get('topic'))
+        elif frame_type in DELIVERY_FRAMES and 'delivery' in self.topic_groups:
+            await DeliveryConsumer.receive_json(self, data)
+        elif frame_type in LOCATION_FRAMES and 'location' in self.topic_groups:
+            await RiderLocationConsumer.receive_json(self, data)
+        elif frame_type in CHAT_FRAMES and 'chat' in self.topic_groups:
+            await ChatConsumer.receive_json(self, data)
+
+    async def subscribe(self, topic):
+        if topic not in self.TOPICS:
+            await self.send_json({"type": "error", "detail": f"Unknown topic {topic}"})
+            return
+
+        if topic not in self.topic_groups:
+            groups = await self.topic_group_names(topic)
+            if groups is None:
+                await self.send_json({"type": "error", "detail": f"Topic {topic} is not available"})
+                return
+
+            self.topic_groups[topic] = groups
+            for group in groups:
+                await self.channel_layer.group_add(group, self.channel_name)
+            if topic in PRESENCE_TOPICS:
+                await self.join_presence_stream(topic)
+            # As on ws/driver-locations/, online only once the location lease is held.
+            if topic == 'location':
+                await database_sync_to_async(go_online)(self.rider_id)
+
+        await self.send_json({"type": "subscribed", "topic": topic})
+
+    async def unsubscribe(self, topic):
+        groups = self.topic_groups.pop(topic, None)
+        if groups is None:
+            return
+
+        # user_<id> backs more than one topic, only leave it once nothing needs it.
+        still_needed = {group for remaining in self.topic_groups.values() for group in remaining}
+        for group in groups:
+            if group not in still_needed:
+                await self.channel_layer.group_discard(group, self.channel_name)
+        if topic in PRESENCE_TOPICS:
+            await self.leave_presence_stream(topic)
+
+        if topic == 'location' and self.rider_id:
+            await self.go_offline_if_last()
+            self.rider_id = None
+
+    async def topic_group_names(self, topic) -> 'list[str] | None':
+        """
+            Channel-layer groups behind a topic for this user, or None if the user can't subscribe
+        """
+        if topic == 'delivery':
+            return [f"user_{self.user.id}"]
+        if topic == 'calls':
+            return [f"call_{self.user.id}"]
+        if topic == 'transactions':
+            return [f"Transactions_{self.user.id}"]
+        if topic == 'chat':
+            self.room_partners = {}
+            return [chat_group(self.user.id)]
+        if topic == 'location':
+            self.rider_id = await self.get_rider_id()
+            if not self.rider_id:
+                return None
+            self.tracking_publisher = TrackingPublisher()
+            return []
+
+    async def transaction_update(self, event):
+        # The dedicated socket sends the bare payload, here it needs a type to be told apart.
+        await self.send_json({
+            "type": "transaction_update",
+            "data": event["data"]
+        })
@@ -0,0 +1,82 @@
+"""
+Monthly range partitioning helpers for append-only Postgres tables.
+
+Partitioned tables need the partition column in their primary key, so the database-level
+key becomes (id, <column>) while Django keeps treating ``id`` as the primary key. Rows that
+fall outside every monthly partition land in a default partition, which should stay empty
+as long as future partitions are created ahead of time.
+"""
+from datetime import date
+
+from django.db import connection as default_connection
+from django.utils import timezone
+
+
+def _month_start(day: date, offset: int=0) -> date:
+    month_index = day.year * 12 + day.month - 1 + offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+def create_month_partitions(cursor, table: str, start: date, end: date, name_prefix: str=None):
+    """
+        Creates any missing monthly partitions of a table covering start through end
+    """
+    month = _month_start(start)
+    while month <= end:
+        next_month = _month_start(month, 1)
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "{partition_name(name_prefix or table, month)}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        )
+        month = next_month
+
+def ensure_future_partitions(table: str, months_ahead: int=3, connection=None):
+    """
+        Makes sure partitions exist from the current month through months_ahead months from now
+    """
+    connection = connection or default_connection
+    if connection.vendor != "postgresql":
+        return
+    today = timezone.now().date()
+    with connection.cursor() as cursor:
+        create_month_partitions(cursor, table, today, _month_start(today, months_ahead))
+
+def partition_table_by_month(schema_editor, table: str, column: str, months_ahead: int=3):
+    """
+        Rebuilds an existing table as a monthly range-partitioned table, keeping its rows,
+        indexes and foreign keys. Does nothing on databases other than Postgres.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+
+    staging = f"{table}_partitioned"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+            "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'u'))",
+            [table, table],
+        )
+        index_definitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT min("{column}") FROM "{table}"')
+        oldest = cursor.fetchone()[0] or timezone.now()
+
+        cursor.execute(f'CREATE TABLE "{staging}" (LIKE "{table}" INCLUDING DEFAULTS) PARTITION BY RANGE ("{column}")')
+        cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{staging}" DEFAULT')
+        create_month_partitions(cursor, staging, oldest.date(), _month_start(timezone.now().date(), months_ahead), name_prefix=table)
+        cursor.execute(f'INSERT INTO "{staging}" SELECT * FROM "{table}"')
+
+        cursor.execute(f'DROP TABLE "{table}"')
+        cursor.execute(f'ALTER TABLE "{staging}" RENAME TO "{table}"')
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY ("id", "{column}")')
+        for definition in index_definitions:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
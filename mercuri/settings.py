@@ -128,6 +128,16 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    'default' : {
+        'BACKEND' : 'django_redis.cache.RedisCache',
+        'LOCATION' : redis_url + '/2',
+        'OPTIONS' : {
+            'CLIENT_CLASS' : 'django_redis.client.DefaultClient',
+        },
+    },
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -216,8 +226,34 @@ CELERY_RESULT_BACKEND = redis_url + '/0'
 CELERY_TASK_ACKS_LATE = True
 CELERY_TASK_REJECT_ON_WORKER_LOST = True
 CELERY_BEAT_SCHEDULE = {
-    "expire_offers_every_10_seconds": {
+    "expire_due_offers_every_second": {
+        "task": "delivery.tasks.expire_due_offers_and_orders",
+        "schedule": 1,
+    },
+    "expire_offers_sweep_every_5_minutes": {
         "task": "delivery.tasks.expire_old_offers",
-        "schedule": 10,
-    }
+        "schedule": 300,
+    },
+    "archive_old_offers_every_minute": {
+        "task": "delivery.tasks.archive_old_offers",
+        "schedule": 60,
+    },
+    "create_offer_event_partitions_daily": {
+        "task": "delivery.tasks.create_offer_event_partitions",
+        "schedule": 24 * 60 * 60,
+    },
+    "create_transaction_partitions_daily": {
+        "task": "wallet.tasks.create_transaction_partitions",
+        "schedule": 24 * 60 * 60,
+    },
+    "flush_rider_locations_every_2_seconds": {
+        "task": "delivery.tasks.flush_rider_locations",
+        "schedule": 2,
+    },
+    "prune_stale_rider_locations_every_minute": {
+        "task": "delivery.tasks.prune_stale_rider_locations",
+        "schedule": 60,
+    },
 }
+
+RIDER_LOCATION_BACKEND = config('RIDER_LOCATION_BACKEND', default='delivery.location_store.RedisGeoBackend')
@@ -0,0 +1,77 @@
+"""
+Scratch environment shared by the test suites and the bench_* management commands.
+
+Code under test reaches Redis through get_redis_connection("default") and the cache, so
+scratch_redis points the cache at a separate Redis database for the duration, flushed on
+the way in and out, and swaps the channel layer for an in-memory one. Seeded rows go in a
+rolled_back() block so benchmarks can run against a development database.
+"""
+from contextlib import contextmanager
+
+from channels.layers import channel_layers
+from django.conf import settings
+from django.db import transaction
+from django.test.utils import override_settings
+from django_redis import get_redis_connection
+
+SCRATCH_REDIS_DB = 15
+IN_MEMORY_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+class _Rollback(Exception):
+    pass
+
+
+def scratch_caches(redis_db: int=SCRATCH_REDIS_DB) -> dict:
+    default = settings.CACHES["default"]
+    location = f"{default['LOCATION'].rsplit('/', 1)[0]}/{redis_db}"
+    if location == default["LOCATION"]:
+        raise ValueError(f"Redis database {redis_db} holds the cache, pick another scratch database")
+    return {"default": {**default, "LOCATION": location}}
+
+def redis_available() -> bool:
+    try:
+        with override_settings(CACHES=scratch_caches()):
+            get_redis_connection("default").ping()
+    except Exception:
+        return False
+    return True
+
+@contextmanager
+def scratch_redis(redis_db: int=SCRATCH_REDIS_DB):
+    """
+        Runs the block against an empty scratch Redis database and an in-memory channel layer
+    """
+    with override_settings(CACHES=scratch_caches(redis_db), CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS):
+        channel_layers.backends.clear()
+        redis = get_redis_connection("default")
+        redis.flushdb()
+        try:
+            yield redis
+        finally:
+            redis.flushdb()
+            channel_layers.backends.clear()
+
+@contextmanager
+def rolled_back():
+    """
+        Runs the block in a transaction that is always rolled back
+    """
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+class ScratchRedisMixin:
+    """
+        TestCase mixin running each test inside scratch_redis, skipped when Redis is unreachable
+    """
+
+    def setUp(self):
+        super().setUp()
+        if not redis_available():
+            self.skipTest("Redis is not available")
+        self.redis = self.enterContext(scratch_redis())
@@ -0,0 +1,92 @@
+import zlib
+from datetime import date
+
+import msgpack
+from django.test import SimpleTestCase
+
+from .codecs import DEFLATE_TAIL, DEFLATE_WINDOW_BITS, DeflateMessagePackCodec, MessagePackCodec, negotiate
+from .partitioning import _month_start, create_month_partitions, partition_name
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+
+
+class MonthPartitionTests(SimpleTestCase):
+    def test_month_start(self):
+        self.assertEqual(_month_start(date(2026, 10, 18)), date(2026, 10, 1))
+        self.assertEqual(_month_start(date(2026, 10, 1)), date(2026, 10, 1))
+
+    def test_month_start_offsets_cross_years(self):
+        self.assertEqual(_month_start(date(2026, 11, 30), 1), date(2026, 12, 1))
+        self.assertEqual(_month_start(date(2026, 12, 31), 1), date(2027, 1, 1))
+        self.assertEqual(_month_start(date(2026, 1, 31), -1), date(2025, 12, 1))
+        self.assertEqual(_month_start(date(2026, 10, 18), 27), date(2029, 1, 1))
+        self.assertEqual(_month_start(date(2026, 10, 18), -22), date(2024, 12, 1))
+
+    def test_partition_name(self):
+        self.assertEqual(partition_name("wallet_transaction", date(2027, 3, 1)), "wallet_transaction_y2027m03")
+
+    def test_partitions_cover_start_through_end(self):
+        cursor = RecordingCursor()
+        create_month_partitions(cursor, "events", date(2026, 11, 20), date(2027, 2, 1))
+        self.assertEqual(cursor.statements, [
+            'CREATE TABLE IF NOT EXISTS "events_y2026m11" PARTITION OF "events" FOR VALUES FROM (\'2026-11-01\') TO (\'2026-12-01\')',
+            'CREATE TABLE IF NOT EXISTS "events_y2026m12" PARTITION OF "events" FOR VALUES FROM (\'2026-12-01\') TO (\'2027-01-01\')',
+            'CREATE TABLE IF NOT EXISTS "events_y2027m01" PARTITION OF "events" FOR VALUES FROM (\'2027-01-01\') TO (\'2027-02-01\')',
+            'CREATE TABLE IF NOT EXISTS "events_y2027m02" PARTITION OF "events" FOR VALUES FROM (\'2027-02-01\') TO (\'2027-03-01\')',
+        ])
+
+    def test_partitions_for_a_single_month_and_a_renamed_table(self):
+        cursor = RecordingCursor()
+        create_month_partitions(cursor, "events_partitioned", date(2026, 10, 18), date(2026, 10, 31), name_prefix="events")
+        self.assertEqual(len(cursor.statements), 1)
+        self.assertIn('"events_y2026m10" PARTITION OF "events_partitioned"', cursor.statements[0])
+
+
+class CodecTests(SimpleTestCase):
+    def round_trip(self, content):
+        codec = MessagePackCodec()
+        return codec.decode(**codec.encode(content))
+
+    def test_known_schemas_are_compacted(self):
+        frame = {"type": "new_offer", "offer": {"fare": "1500.00", "rider": {"email": "a@example.com"}}}
+        self.assertEqual(
+            msgpack.unpackb(MessagePackCodec().pack(frame)),
+            {"t": "new_offer", "f": {"fa": "1500.00", "r": {"em": "a@example.com"}}},
+        )
+        self.assertEqual(self.round_trip(frame), frame)
+
+    def test_foreign_payloads_are_left_alone(self):
+        frame = {"type": "transaction_update", "data": {"type": "credit", "amount": "500.00"}}
+        self.assertEqual(
+            msgpack.unpackb(MessagePackCodec().pack(frame)),
+            {"t": "transaction_update", "da": {"type": "credit", "amount": "500.00"}},
+        )
+        self.assertEqual(self.round_trip(frame), frame)
+
+    def test_colliding_keys_round_trip(self):
+        for frame in (
+            {"data": {"t": 1, "type": 2}},
+            {"t": 1, "type": 2, "~t": 3, "~": 4},
+            {"offer": {"fa": 1, "fare": 2, "~~fa": 3}},
+            {"message": [{"s": 1, "status": 2}], "m": "text"},
+        ):
+            self.assertEqual(self.round_trip(frame), frame)
+
+    def test_deflate_frames_inflate_as_one_stream(self):
+        codec, inflater = DeflateMessagePackCodec(), zlib.decompressobj(-DEFLATE_WINDOW_BITS)
+        frames = [{"type": "location_update", "order_id": "1", "la": index} for index in range(3)]
+        for frame in frames:
+            data = inflater.decompress(codec.encode(frame)["bytes_data"] + DEFLATE_TAIL)
+            self.assertEqual(codec.decode(bytes_data=data), frame)
+
+    def test_negotiate_takes_the_first_supported_subprotocol(self):
+        codec, subprotocol = negotiate(["graphql-ws", "msgpack.v1", "json"])
+        self.assertIsInstance(codec, MessagePackCodec)
+        self.assertEqual(subprotocol, "msgpack.v1")
+        self.assertEqual(negotiate(["graphql-ws"])[1], None)
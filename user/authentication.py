@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+AUTH_USER_KEY = "auth_user:{user_id}"
+REVOKED_TOKEN_KEY = "auth_revoked:{jti}"
+AUTH_USER_TIMEOUT = 5 * 60
+
+# User loads in flight per user id, so a burst of handshakes for one user shares a single query.
+_pending_loads = {}
+
+
+def revoke_token(token):
+    """
+        Adds a token's jti to the cached revoked set until the token would have expired anyway
+    """
+    remaining = int(token["exp"] - time.time())
+    if remaining > 0:
+        cache.set(REVOKED_TOKEN_KEY.format(jti=token[api_settings.JTI_CLAIM]), True, remaining)
+
+def invalidate_cached_user(user_id):
+    cache.delete(AUTH_USER_KEY.format(user_id=user_id))
+
+@database_sync_to_async
+def _load_user(user_id):
+    user = get_user_model().objects.filter(id=user_id, is_active=True).first()
+    if user is not None:
+        cache.set(AUTH_USER_KEY.format(user_id=user_id), user, AUTH_USER_TIMEOUT)
+    return user
+
+async def _load_user_once(user_id):
+    load = _pending_loads.get(user_id)
+    if load is None:
+        load = _pending_loads[user_id] = asyncio.ensure_future(_load_user(user_id))
+        load.add_done_callback(lambda _: _pending_loads.pop(user_id, None))
+    # Shielded so one handshake going away does not cancel the load for the others.
+    return await asyncio.shield(load)
+
+async def authenticate_token(token_string):
+    """
+        Resolves a JWT access token to its user for WebSocket handshakes, or AnonymousUser.
+
+        The token is checked locally and the revoked set and user are read from the cache in
+        one round trip, so only the first handshake per user in AUTH_USER_TIMEOUT reaches the
+        database. Users are dropped from the cache whenever they are saved.
+    """
+    if not token_string:
+        return AnonymousUser
+    try:
+        token = AccessToken(token_string)
+    except TokenError:
+        return AnonymousUser
+
+    user_id = token[api_settings.USER_ID_CLAIM]
+    user_key = AUTH_USER_KEY.format(user_id=user_id)
+    revoked_key = REVOKED_TOKEN_KEY.format(jti=token[api_settings.JTI_CLAIM])
+    # Off the event loop, and not thread-sensitive: a cache read need not queue behind ORM work.
+    cached = await sync_to_async(cache.get_many, thread_sensitive=False)([user_key, revoked_key])
+    if cached.get(revoked_key):
+        return AnonymousUser
+
+    user = cached.get(user_key) or await _load_user_once(user_id)
+    return user or AnonymousUser
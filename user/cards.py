@@ -0,0 +1,58 @@
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+
+# A user card is the public identity of a user as it appears inside notification payloads.
+USER_CARD_KEY = "user_card:{user_id}"
+USER_CARD_TIMEOUT = 24 * 60 * 60
+USER_CARD_FIELDS = ('id', 'email', 'first_name', 'last_name', 'phone_number', 'role')
+
+
+def build_user_card(user) -> dict:
+    """
+        Serializes a user into a card, in the same shape as CustomUserSerializer
+    """
+    return {
+        "id": str(user.id),
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "phone_number": user.phone_number,
+        "role": user.role,
+    }
+
+def get_user_cards(user_ids) -> 'dict[str, dict]':
+    """
+        Cards for the given user ids keyed by id, loading any that are not cached in one query
+    """
+    user_ids = {str(user_id) for user_id in user_ids}
+    cached = cache.get_many([USER_CARD_KEY.format(user_id=user_id) for user_id in user_ids])
+    cards = {card["id"]: card for card in cached.values()}
+
+    missing = user_ids - cards.keys()
+    if missing:
+        loaded = {
+            str(user.id): build_user_card(user)
+            for user in get_user_model().objects.filter(id__in=missing).only(*USER_CARD_FIELDS)
+        }
+        cache.set_many({USER_CARD_KEY.format(user_id=user_id): card for user_id, card in loaded.items()}, USER_CARD_TIMEOUT)
+        cards.update(loaded)
+    return cards
+
+def get_user_card(user_id) -> 'dict | None':
+    return get_user_cards([user_id]).get(str(user_id))
+
+def offer_party(card: dict, party_id=None) -> dict:
+    """
+        The rider/customer fragment used by delivery offer payloads. party_id replaces the
+        user id where a payload identifies the party by another id, e.g. the Rider id.
+    """
+    return {
+        "id": str(party_id or card["id"]),
+        "email": card["email"],
+        "first_name": card["first_name"],
+        "last_name": card["last_name"],
+        "phone": card["phone_number"],
+    }
+
+def invalidate_user_card(user_id):
+    cache.delete(USER_CARD_KEY.format(user_id=user_id))
@@ -0,0 +1,87 @@
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from delivery.middleware import TokenAuthMiddleware
+from mercuri.testing import SCRATCH_REDIS_DB, scratch_redis
+
+
+@database_sync_to_async
+def lookup_user(token_string):
+    """
+        The per-handshake database lookup the middleware did before authenticate_token, kept as the baseline
+    """
+    try:
+        return get_user_model().objects.get(id=AccessToken(token_string)[api_settings.USER_ID_CLAIM])
+    except Exception:
+        return AnonymousUser
+
+class LookupMiddleware(TokenAuthMiddleware):
+    async def __call__(self, scope, receive, send):
+        scope['user'] = await lookup_user(scope['query_string'].decode().split('token=')[1])
+        return await self.app(scope, receive, send)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures WebSocket handshakes per second through the token middleware: a database lookup "
+        "per handshake, authenticate_token with a cold cache and with a warm one. Seeded users are "
+        "deleted afterwards and the cache goes to a scratch Redis database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--handshakes", type=int, default=2_000)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--redis-db", type=int, default=SCRATCH_REDIS_DB)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        tag = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create_user(email=f"bench-handshake-{tag}-{index}@example.com", password="!", role="customer")
+            for index in range(options["users"])
+        ]
+        tokens = [str(RefreshToken.for_user(user).access_token) for user in users]
+
+        async def app(scope, receive, send):
+            if scope['user'] is AnonymousUser:
+                raise AssertionError("handshake was not authenticated")
+
+        runs = (
+            ("database lookup", LookupMiddleware(app), False),
+            ("cold cache", TokenAuthMiddleware(app), True),
+            ("warm cache", TokenAuthMiddleware(app), False),
+        )
+        # The users are committed, not rolled back: database_sync_to_async closes a connection left in a transaction.
+        try:
+            with scratch_redis(options["redis_db"]):
+                for name, middleware, clear_cache in runs:
+                    if clear_cache:
+                        cache.clear()
+                    # Under async_to_sync the ORM calls run on this thread, so its connection sees every query.
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        async_to_sync(self.storm)(middleware, tokens, options["handshakes"])
+                        elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{name:16} {options['handshakes'] / elapsed:8.0f} handshakes/s  {len(captured):5} queries"
+                    )
+        finally:
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+    async def storm(self, middleware, tokens: 'list[str]', handshakes: int):
+        await asyncio.gather(*(
+            middleware({'query_string': f'token={tokens[index % len(tokens)]}'.encode()}, None, None)
+            for index in range(handshakes)
+        ))
@@ -6,7 +6,7 @@ class IsApprovedRider(permissions.BasePermission):
         if not request.user.is_authenticated:
             return False
 
-        if not hasattr(user, 'rider_profile'):
+        if not hasattr(request.user, 'rider_profile'):
             self.message = {
                 'error': 'Rider profile required',
                 'next_step': 'Complete driver profile registration',
@@ -32,3 +32,13 @@ class IsApprovedRider(permissions.BasePermission):
             return False
 
         return True
+
+
+class IsRider(permissions.BasePermission):
+    """
+        Authenticated users with the rider role, who have a Rider from sign-up
+    """
+    message = {'error': 'Rider account required'}
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.is_rider()
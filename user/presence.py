@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django_redis import get_redis_connection
+
+PRESENCE_KEY = "presence:{user_id}"
+STREAM_PRESENCE_KEY = "presence:{stream}:{user_id}"
+# A connection stops counting once it misses a couple of heartbeats, e.g. when its worker died.
+PRESENCE_TTL_SECONDS = 90
+PRESENCE_HEARTBEAT_SECONDS = 30
+
+
+class Presence:
+    """
+        Open WebSocket connections per user, kept in a Redis sorted set per user with one
+        member per connection, scored by when the connection's lease runs out.
+
+        The number of unexpired members is the user's connection count. Heartbeats renew
+        the lease, so connections that never say goodbye drop out on their own instead of
+        leaving the user online for good the way a bare counter would.
+
+        A connection also holds a lease per stream it delivers, such as "chat" for chat
+        events or "delivery" for offers, so callers can ask whether a user will actually
+        see an event rather than whether they have any socket open.
+    """
+
+    def __init__(self, connection=None):
+        self.redis = connection or get_redis_connection("default")
+
+    def connect(self, user_id, connection_id, streams=()):
+        """
+            Adds or renews a connection's lease on the user and on each of the streams,
+            dropping any lapsed ones on the way
+        """
+        now = time.time()
+        pipe = self.redis.pipeline()
+        for key in presence_keys(user_id, streams):
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zadd(key, {connection_id: now + PRESENCE_TTL_SECONDS})
+            pipe.expire(key, PRESENCE_TTL_SECONDS)
+        pipe.execute()
+
+    heartbeat = connect
+
+    def disconnect(self, user_id, connection_id, streams=()):
+        pipe = self.redis.pipeline()
+        for key in presence_keys(user_id, streams):
+            pipe.zrem(key, connection_id)
+        pipe.execute()
+
+    def leave(self, user_id, connection_id, stream):
+        """
+            Drops a connection's lease on one stream, the connection still counts towards the user
+        """
+        self.redis.zrem(presence_key(user_id, stream), connection_id)
+
+    def connection_counts(self, user_ids, stream=None) -> 'dict[str, int]':
+        """
+            Live connection count per user id, on the stream if one is given, in one round trip
+            however many users are asked about
+        """
+        user_ids = [str(user_id) for user_id in user_ids]
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zcount(presence_key(user_id, stream), f"({now}", "+inf")
+        return dict(zip(user_ids, pipe.execute()))
+
+    def online(self, user_ids, stream=None) -> 'set[str]':
+        return {user_id for user_id, count in self.connection_counts(user_ids, stream).items() if count}
+
+def presence_key(user_id, stream=None) -> str:
+    if stream is None:
+        return PRESENCE_KEY.format(user_id=user_id)
+    return STREAM_PRESENCE_KEY.format(stream=stream, user_id=user_id)
+
+def presence_keys(user_id, streams) -> 'list[str]':
+    return [presence_key(user_id)] + [presence_key(user_id, stream) for stream in streams]
+
+def is_online(user_id, stream=None) -> bool:
+    return bool(Presence().online([user_id], stream))
+
+
+class PresenceConsumerMixin:
+    """
+        Counts an authenticated socket towards its user's presence, and towards each of
+        presence_streams, from accept until it disconnects, renewing the leases every
+        PRESENCE_HEARTBEAT_SECONDS meanwhile
+    """
+
+    presence_streams = ()
+
+    async def accept(self, subprotocol=None, headers=None):
+        # Leased before accepting, so the user counts as present by the time the client sees the socket open.
+        user = self.scope.get("user")
+        if user is not None and user != AnonymousUser and user.is_authenticated:
+            self.presence_user_id = user.id
+            self.presence_streams = set(self.presence_streams)
+            await sync_to_async(Presence().connect)(user.id, self.channel_name, tuple(self.presence_streams))
+            self.presence_heartbeat = asyncio.ensure_future(self.renew_presence())
+
+        await super().accept(subprotocol=subprotocol, headers=headers)
+
+    async def renew_presence(self):
+        while True:
+            await asyncio.sleep(PRESENCE_HEARTBEAT_SECONDS)
+            await sync_to_async(Presence().heartbeat)(self.presence_user_id, self.channel_name, tuple(self.presence_streams))
+
+    async def join_presence_stream(self, stream):
+        if getattr(self, "presence_heartbeat", None) and stream not in self.presence_streams:
+            self.presence_streams.add(stream)
+            await sync_to_async(Presence().connect)(self.presence_user_id, self.channel_name, (stream,))
+
+    async def leave_presence_stream(self, stream):
+        if getattr(self, "presence_heartbeat", None) and stream in self.presence_streams:
+            self.presence_streams.discard(stream)
+            await sync_to_async(Presence().leave)(self.presence_user_id, self.channel_name, stream)
+
+    async def websocket_disconnect(self, message):
+        if getattr(self, "presence_heartbeat", None):
+            self.presence_heartbeat.cancel()
+            self.presence_heartbeat = None
+            await sync_to_async(Presence().disconnect)(self.presence_user_id, self.channel_name, tuple(self.presence_streams))
+        await super().websocket_disconnect(message)
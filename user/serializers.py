@@ -3,6 +3,7 @@ from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 
 from .models import CustomUser, CustomerProfile, RiderProfile
+from .cards import get_user_card
 
 ROLE_CHOICES = [
     ('customer', 'Customer'),
@@ -17,6 +18,17 @@ class CustomUserSerializer(serializers.ModelSerializer):
         model = CustomUser
         fields = ('id', 'email', 'first_name', 'last_name', 'phone_number', 'role')
 
+class UserCardField(serializers.Field):
+    """
+    Read-only field rendering a user id as the cached user card, same shape as CustomUserSerializer.
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return get_user_card(value)
+
 class CustomUserRegisterationSerializer(serializers.ModelSerializer):
     """
     Serializer class to serialize registeration requests and create a new user.
@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth import get_user_model
 from django.dispatch import receiver
 #from django.core.mail import EmailMultiAlternatives
@@ -8,6 +8,8 @@ from django.dispatch import receiver
 #from django_rest_passwordreset.signals import reset_password_token_created
 
 from .models import CustomerProfile, RiderProfile
+from .cards import invalidate_user_card
+from .authentication import invalidate_cached_user
 
 
 User = get_user_model()
@@ -18,6 +20,13 @@ def create_profile(sender, instance, created, **kwargs):
     if created:
         if instance.role == 'customer':
             CustomerProfile.objects.create(user=instance)
+
+# Cached user cards
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_user_card(sender, instance, **kwargs):
+    invalidate_user_card(instance.id)
+    invalidate_cached_user(instance.id)
 # Password reset
 '''
 @receiver(reset_password_token_created)
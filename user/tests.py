@@ -1,3 +1,145 @@
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from communication.consumers import ChatConsumer
+from delivery.consumers import DeliveryConsumer
+from mercuri.consumers import GatewayConsumer
+from mercuri.testing import ScratchRedisMixin
+
+from .authentication import authenticate_token, revoke_token
+from .presence import Presence, is_online
+
+
+class PresenceTests(ScratchRedisMixin, SimpleTestCase):
+    def test_streams_are_leased_alongside_the_user(self):
+        presence = Presence()
+        presence.connect("1", "socket-a", ("chat",))
+        presence.connect("2", "socket-b", ("delivery",))
+        self.assertEqual(presence.online(["1", "2", "3"]), {"1", "2"})
+        self.assertEqual(presence.online(["1", "2", "3"], "chat"), {"1"})
+        self.assertEqual(presence.online(["1", "2", "3"], "delivery"), {"2"})
+
+    def test_leaving_a_stream_keeps_the_user_online(self):
+        presence = Presence()
+        presence.connect("1", "socket-a", ("chat",))
+        presence.leave("1", "socket-a", "chat")
+        self.assertTrue(is_online("1"))
+        self.assertFalse(is_online("1", "chat"))
+        presence.disconnect("1", "socket-a")
+        self.assertFalse(is_online("1"))
+
+    def test_lapsed_stream_leases_stop_counting(self):
+        Presence().connect("1", "socket-a", ("chat",))
+        with mock.patch("user.presence.time.time", return_value=10**10):
+            self.assertFalse(is_online("1", "chat"))
+
+
+class ConsumerPresenceTests(ScratchRedisMixin, SimpleTestCase):
+    user = SimpleNamespace(id=7, is_authenticated=True, get_username=lambda: "ada")
+
+    def open(self, consumer, path="/ws/"):
+        communicator = WebsocketCommunicator(consumer.as_asgi(), path)
+        communicator.scope["user"] = self.user
+        return communicator
+
+    def test_dedicated_sockets_lease_their_own_stream(self):
+        async def run():
+            for consumer, stream, other in ((ChatConsumer, "chat", "delivery"), (DeliveryConsumer, "delivery", "chat")):
+                communicator = self.open(consumer)
+                await communicator.connect()
+                self.assertEqual(
+                    (is_online(self.user.id), is_online(self.user.id, stream), is_online(self.user.id, other)),
+                    (True, True, False),
+                )
+                await communicator.disconnect()
+                self.assertFalse(is_online(self.user.id) or is_online(self.user.id, stream))
+
+        async_to_sync(run)()
+
+    def test_gateway_leases_streams_per_subscription(self):
+        async def run():
+            communicator = self.open(GatewayConsumer)
+            await communicator.connect()
+            self.assertTrue(is_online(self.user.id))
+            self.assertFalse(is_online(self.user.id, "chat"))
+
+            await communicator.send_json_to({"type": "subscribe", "topic": "chat"})
+            await communicator.receive_json_from()
+            self.assertTrue(is_online(self.user.id, "chat"))
+            self.assertFalse(is_online(self.user.id, "delivery"))
+
+            await communicator.send_json_to({"type": "unsubscribe", "topic": "chat"})
+            await communicator.send_json_to({"type": "subscribe", "topic": "delivery"})
+            await communicator.receive_json_from()
+            self.assertEqual((is_online(self.user.id, "chat"), is_online(self.user.id, "delivery")), (False, True))
+
+            await communicator.disconnect()
+            self.assertFalse(is_online(self.user.id) or is_online(self.user.id, "delivery"))
+
+        async_to_sync(run)()
+
+
+class AuthenticateTokenTests(ScratchRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(email="socket@example.com", password="!")
+        self.token = AccessToken.for_user(self.user)
+
+    def authenticate(self, token):
+        return async_to_sync(authenticate_token)(token)
+
+    def test_missing_or_invalid_tokens_are_anonymous(self):
+        for token in (None, "", "not-a-jwt", str(self.token)[:-2] + "xx", str(RefreshToken.for_user(self.user))):
+            with self.subTest(token=token):
+                self.assertIs(self.authenticate(token), AnonymousUser)
+
+    def test_valid_token_resolves_the_user(self):
+        self.assertEqual(self.authenticate(str(self.token)), self.user)
+
+    def test_revoked_token_is_rejected(self):
+        revoke_token(self.token)
+        self.assertIs(self.authenticate(str(self.token)), AnonymousUser)
+        # Other tokens for the same user still work.
+        self.assertEqual(self.authenticate(str(AccessToken.for_user(self.user))), self.user)
+
+    def test_logout_revokes_the_access_token(self):
+        refresh = RefreshToken.for_user(self.user)
+        access = str(refresh.access_token)
+        self.assertEqual(self.authenticate(access), self.user)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = client.post(reverse("user:logout-user"), {"refresh": str(refresh)})
+        self.assertEqual(response.status_code, 205)
+        self.assertIs(self.authenticate(access), AnonymousUser)
+
+    def test_inactive_user_is_rejected(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertIs(self.authenticate(str(self.token)), AnonymousUser)
+
+    def test_warm_cache_makes_no_queries(self):
+        self.authenticate(str(self.token))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(str(self.token)), self.user)
+
+    def test_saving_the_user_drops_the_cached_copy(self):
+        self.authenticate(str(self.token))
+        self.user.first_name = "Renamed"
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(str(self.token)).first_name, "Renamed")
+
+        # Deactivating through save() takes effect on the next handshake, not after the cache timeout.
+        self.user.is_active = False
+        self.user.save()
+        self.assertIs(self.authenticate(str(self.token)), AnonymousUser)
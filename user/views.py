@@ -6,6 +6,7 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
 
 from . import serializers, models
+from .authentication import revoke_token
 
 # Create your views here.
 
@@ -65,6 +66,9 @@ class CustomUserLogoutAPIView(GenericAPIView):
             refresh_token = request.data["refresh"]
             token = RefreshToken(refresh_token)
             token.blacklist()
+            # Also shut out WebSocket handshakes still holding either token.
+            revoke_token(token)
+            revoke_token(request.auth)
             return Response(status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
             return Response(status=status.HTTP_400_BAD_REQUEST)
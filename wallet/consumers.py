@@ -1,7 +1,8 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
-import json
+from mercuri.codecs import CodecConsumerMixin
+from user.presence import PresenceConsumerMixin
 
-class TransactionConsumer(AsyncWebsocketConsumer):
+class TransactionConsumer(PresenceConsumerMixin, CodecConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.user_id = self.scope["url_route"]["kwargs"]["user_id"]
         self.group_name = f"Transactions_{self.user_id}"
@@ -12,4 +13,4 @@ class TransactionConsumer(AsyncWebsocketConsumer):
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
     async def transaction_update(self, event):
-        await self.send(text_data=json.dumps(event["data"]))
\ No newline at end of file
+        await self.send_json(event["data"])
\ No newline at end of file
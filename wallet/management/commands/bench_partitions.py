@@ -0,0 +1,113 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from statistics import median
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from mercuri.partitioning import _month_start, create_month_partitions
+from mercuri.testing import rolled_back
+
+PLAIN_TABLE = "bench_transaction_plain"
+PARTITIONED_TABLE = "bench_transaction_partitioned"
+INSERT_BATCH_SIZE = 1_000_000
+
+# Shaped like wallet_transaction: the columns the history queries touch and its wallet index.
+CREATE_TABLE = """
+    CREATE TABLE "{table}" (
+        id uuid NOT NULL, wallet_id integer NOT NULL, amount numeric(10, 2) NOT NULL,
+        creation_date timestamp with time zone NOT NULL
+    ) {partitioning}
+"""
+
+QUERIES = (
+    ("wallet history, last 30 days",
+     'SELECT * FROM "{table}" WHERE wallet_id = %(wallet)s AND creation_date >= %(month_ago)s AND creation_date < %(now)s ORDER BY creation_date DESC'),
+    ("wallet history, all time",
+     'SELECT * FROM "{table}" WHERE wallet_id = %(wallet)s ORDER BY creation_date DESC LIMIT 50'),
+    ("one month's totals",
+     'SELECT count(*), sum(amount) FROM "{table}" WHERE creation_date >= %(month)s AND creation_date < %(next_month)s'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares transaction history queries on a plain and a monthly partitioned table holding the "
+        "same synthetic rows, 10M by default, and the cost of dropping the oldest month. Postgres only; "
+        "everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000_000)
+        parser.add_argument("--wallets", type=int, default=10_000)
+        parser.add_argument("--months", type=int, default=24)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning only exists on Postgres")
+
+        now = datetime.now(dt_timezone.utc)
+        oldest = _month_start(now.date(), -options["months"] + 1)
+        with rolled_back(), connection.cursor() as cursor:
+            self.seed(cursor, oldest, now, options)
+
+            rng = random.Random(14)
+            params = []
+            for _ in range(options["repeat"]):
+                month = _month_start(now.date(), -rng.randrange(options["months"]))
+                params.append({
+                    "wallet": rng.randrange(options["wallets"]), "now": now, "month_ago": now - timedelta(days=30),
+                    "month": month, "next_month": _month_start(month, 1),
+                })
+
+            for name, sql in QUERIES:
+                plain = self.time_query(cursor, sql.format(table=PLAIN_TABLE), params)
+                partitioned = self.time_query(cursor, sql.format(table=PARTITIONED_TABLE), params)
+                self.stdout.write(
+                    f"{name:30} plain {plain * 1000:8.2f} ms  partitioned {partitioned * 1000:8.2f} ms  "
+                    f"({plain / partitioned:5.1f}x)"
+                )
+
+            started = time.perf_counter()
+            cursor.execute(f'DELETE FROM "{PLAIN_TABLE}" WHERE creation_date < %s', [_month_start(oldest, 1)])
+            plain = time.perf_counter() - started
+            started = time.perf_counter()
+            cursor.execute(f'DROP TABLE "{PARTITIONED_TABLE}_y{oldest.year}m{oldest.month:02d}"')
+            partitioned = time.perf_counter() - started
+            self.stdout.write(
+                f"{'dropping the oldest month':30} plain {plain * 1000:8.2f} ms  partitioned {partitioned * 1000:8.2f} ms  "
+                f"({plain / partitioned:5.1f}x)"
+            )
+
+    def seed(self, cursor, oldest, now, options):
+        cursor.execute(CREATE_TABLE.format(table=PLAIN_TABLE, partitioning=""))
+        cursor.execute(CREATE_TABLE.format(table=PARTITIONED_TABLE, partitioning="PARTITION BY RANGE (creation_date)"))
+        create_month_partitions(cursor, PARTITIONED_TABLE, oldest, now.date())
+
+        span = now - datetime(oldest.year, oldest.month, oldest.day, tzinfo=dt_timezone.utc)
+        started = time.perf_counter()
+        for offset in range(0, options["rows"], INSERT_BATCH_SIZE):
+            cursor.execute(
+                f'INSERT INTO "{PLAIN_TABLE}" '
+                "SELECT gen_random_uuid(), floor(random() * %s)::int, round((random() * 50000)::numeric, 2), %s - random() * %s "
+                "FROM generate_series(1, %s)",
+                [options["wallets"], now, span, min(INSERT_BATCH_SIZE, options["rows"] - offset)],
+            )
+        cursor.execute(f'INSERT INTO "{PARTITIONED_TABLE}" SELECT * FROM "{PLAIN_TABLE}"')
+        for table in (PLAIN_TABLE, PARTITIONED_TABLE):
+            cursor.execute(f'CREATE INDEX ON "{table}" (wallet_id)')
+            cursor.execute(f'ANALYZE "{table}"')
+        self.stdout.write(f"seeded {options['rows']:,} rows over {options['months']} months in {time.perf_counter() - started:.0f} s")
+
+    def time_query(self, cursor, sql, params) -> float:
+        cursor.execute(sql, params[0])  # Warm the cache.
+        cursor.fetchall()
+        timings = []
+        for values in params:
+            started = time.perf_counter()
+            cursor.execute(sql, values)
+            cursor.fetchall()
+            timings.append(time.perf_counter() - started)
+        return median(timings)
@@ -0,0 +1,15 @@
+from django.db import models
+
+
+class TransactionQuerySet(models.QuerySet):
+    def in_period(self, start=None, end=None):
+        """
+        Transactions created in [start, end). Bounding creation_date lets Postgres
+        skip the monthly partitions outside the period.
+        """
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(creation_date__gte=start)
+        if end is not None:
+            queryset = queryset.filter(creation_date__lt=end)
+        return queryset
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:05
+
+from django.db import migrations
+
+from mercuri.partitioning import partition_table_by_month
+
+
+def partition_transactions(apps, schema_editor):
+    partition_table_by_month(schema_editor, 'wallet_transaction', 'creation_date')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_transactions, migrations.RunPython.noop),
+    ]
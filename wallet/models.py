@@ -4,6 +4,8 @@ from django.db.models import Index
 from django.conf import settings
 from django.contrib.auth.hashers import make_password, check_password
 
+from .managers import TransactionQuerySet
+
 # Create your models here.
 
 def generate_unique_account_number():
@@ -71,6 +73,9 @@ class Transaction(models.Model):
     creation_date = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True, null=True)
 
+    # Monthly range-partitioned on creation_date in Postgres, see mercuri.partitioning.
+    objects = TransactionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.transaction_format.capitalize()} Transaction of ₦{self.amount} on {self.creation_date}"
 
@@ -8,6 +8,7 @@ from django.db import transaction
 
 from .models import Wallet, Transaction, WithdrawalRequest
 from .services import flutterwave as flw_srv
+from mercuri.partitioning import ensure_future_partitions
 
 @shared_task(bind = True, max_retries = 3, default_retry_delay = 15)
 def process_withdrawal(self, withdrawal_id):
@@ -49,4 +50,7 @@ def process_withdrawal(self, withdrawal_id):
             wallet.save()
             Transaction.objects.create(wallet = wallet, amount = withdrawal.amount, transaction_format = 'release')
         return
-    
+
+@shared_task
+def create_transaction_partitions():
+    ensure_future_partitions(Transaction._meta.db_table)
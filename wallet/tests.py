@@ -1,3 +1,39 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .models import Transaction
+
+
+class TransactionsViewTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(email="history@example.com", password="!")
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        for day in (1, 15, 28):
+            transaction = Transaction.objects.create(wallet=user.wallet, transaction_type='credit', transaction_format='deposit', amount=day)
+            Transaction.objects.filter(id=transaction.id).update(creation_date=datetime(2026, 9, day, 12, tzinfo=dt_timezone.utc))
+
+    def amounts(self, **params):
+        response = self.client.get(reverse("transactions"), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(float(transaction["amount"]) for transaction in response.data)
+
+    def test_lists_every_transaction_without_a_period(self):
+        self.assertEqual(self.amounts(), [1, 15, 28])
+
+    def test_period_is_start_inclusive_and_end_exclusive(self):
+        self.assertEqual(self.amounts(start="2026-09-15T12:00:00Z", end="2026-09-28T12:00:00Z"), [15])
+
+    def test_naive_dates_are_read_in_the_server_timezone(self):
+        self.assertEqual(self.amounts(start="2026-09-02"), [15, 28])
+        self.assertEqual(self.amounts(end="2026-09-02T00:00:00+01:00"), [1])
 
-# Create your tests here.
+    def test_bad_periods_are_rejected(self):
+        for params in ({"start": "yesterday"}, {"end": "2026-13-01"}, {"start": "2026-09-20", "end": "2026-09-10"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse("transactions"), params).status_code, 400)
@@ -12,7 +12,7 @@ from django.conf import settings
 from django.contrib.auth.models import User
 
 from .models import Wallet, Transaction, WithdrawalRequest
-from .serializers import TransactionSerializer, WithdrawalRequestSerializer
+from .serializers import TransactionPeriodSerializer, TransactionSerializer, WithdrawalRequestSerializer
 from .tasks import process_withdrawal
 
 # Create your views here.
@@ -125,9 +125,16 @@ class TransactionsView(APIView):
 
     def get(self, request):
         """Retrieve the wallet balance for the authenticated user."""
+        period = TransactionPeriodSerializer(data=request.query_params)
+        if not period.is_valid():
+            return Response(period.errors, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             wallet = Wallet.objects.get(user=request.user)
-            transactions = Transaction.objects.filter(wallet=wallet)
+            transactions = Transaction.objects.in_period(
+                start=period.validated_data.get('start'),
+                end=period.validated_data.get('end'),
+            ).filter(wallet=wallet)
             serializer = TransactionSerializer(transactions, many = True)
             return Response(serializer.data)
         except Wallet.DoesNotExist: